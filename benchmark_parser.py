@@ -0,0 +1,385 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+import variant_workbook_parser as parser
+from workbook_generator import generate_workbook
+
+STAGES = [
+    "open_workbook",
+    "checking_sheets",
+    "get_summary_fields",
+    "get_included_fields",
+    "get_report_fields",
+    "merge_workbook_fields",
+    "parse_workbook",
+]
+
+
+def get_command_line_args(arguments=None) -> argparse.Namespace:
+    """
+    Parse command line arguments
+
+    Returns
+    -------
+    args : Namespace
+        Namespace of command line argument inputs
+    """
+    arg_parser = argparse.ArgumentParser(
+        description=(
+            "time each stage of variant_workbook_parser.py and a whole run "
+            "for each reader, and compare the timings with a baseline"
+        )
+    )
+    arg_parser.add_argument(
+        "--files",
+        "--f",
+        nargs="+",
+        help="workbook(s) to benchmark, default is the test workbooks",
+        default=sorted(glob.glob("tests/test_data/*/*.xlsx")),
+    )
+    arg_parser.add_argument(
+        "--large",
+        nargs="*",
+        type=int,
+        default=[1000],
+        help=(
+            "numbers of variants of the large workbooks generated with "
+            "workbook_generator.py and added to the benchmark"
+        ),
+    )
+    arg_parser.add_argument(
+        "--readers",
+        nargs="+",
+        choices=["openpyxl", "readonly", "native"],
+        default=["openpyxl", "readonly", "native"],
+        help="readers to compare, the first one is the reference",
+    )
+    arg_parser.add_argument(
+        "--config",
+        help="parser config file",
+        default="tests/test_data/test_parser_config.json",
+    )
+    arg_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="number of timed runs per workbook and reader",
+    )
+    arg_parser.add_argument(
+        "--output",
+        "--o",
+        help="json file to save the results to",
+    )
+    arg_parser.add_argument(
+        "--baseline",
+        "--b",
+        help="json file of results to compare with",
+    )
+    arg_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="slowdown against the baseline reported as a regression",
+    )
+
+    return arg_parser.parse_args(arguments)
+
+
+def time_stages(filename: str, reader: str, config_variable: dict) -> dict:
+    """
+    run the stages of the parser on one workbook, timing each of them
+
+    Parameters
+    ----------
+      variant workbook file name
+      str for reader
+      dict from config file
+
+    Return
+    ------
+      dict of seconds per stage, only for the stages reached
+    """
+    seconds = {}
+
+    def timed(stage, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds[stage] = time.perf_counter() - start
+        return result
+
+    start = time.perf_counter()
+    workbook = timed("open_workbook", parser.open_workbook, filename, reader)
+    if timed("checking_sheets", parser.checking_sheets, filename, workbook):
+        return seconds
+    df_summary, error_msg = timed(
+        "get_summary_fields",
+        parser.get_summary_fields,
+        filename,
+        config_variable,
+        True,
+        workbook,
+    )
+    if error_msg:
+        return seconds
+    df_included = timed(
+        "get_included_fields", parser.get_included_fields, filename, workbook
+    )
+    df_report, error_msg = timed(
+        "get_report_fields",
+        parser.get_report_fields,
+        filename,
+        df_included,
+        workbook,
+    )
+    if error_msg or df_included["Interpreted"].isna().sum():
+        return seconds
+    timed(
+        "merge_workbook_fields",
+        parser.merge_workbook_fields,
+        df_summary,
+        df_included,
+        df_report,
+    )
+    seconds["parse_workbook"] = time.perf_counter() - start
+
+    return seconds
+
+
+def benchmark_workbook(
+    filename: str, reader: str, config_variable: dict, repeat: int
+) -> dict:
+    """
+    time the stages of one workbook and measure its peak memory
+
+    Parameters
+    ----------
+      variant workbook file name
+      str for reader
+      dict from config file
+      int for number of timed runs
+
+    Return
+    ------
+      dict of median seconds per stage and peak MiB allocated
+    """
+    timings = [
+        time_stages(filename, reader, config_variable) for _ in range(repeat)
+    ]
+
+    # memory is measured in its own run as tracing slows down execution
+    tracemalloc.start()
+    time_stages(filename, reader, config_variable)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": {
+            stage: statistics.median(timing[stage] for timing in timings)
+            for stage in STAGES
+            if stage in timings[0]
+        },
+        "peak_mib": peak / 1024 / 1024,
+    }
+
+
+def benchmark_main(files: list, reader: str, config: str) -> float:
+    """
+    time a whole run of main() with --no_dx_upload on a copy of the
+    workbooks, including writing the outputs and moving the workbooks
+
+    Parameters
+    ----------
+      list of variant workbook file names
+      str for reader
+      str for parser config file
+
+    Return
+    ------
+      float for seconds of the run
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        outdir = f"{tmp_dir}/output/"
+        for filename in files:
+            with contextlib.redirect_stdout(io.StringIO()):
+                folder = parser.get_folder(filename)
+            indir = f"{tmp_dir}/{folder}/"
+            os.makedirs(indir, exist_ok=True)
+            shutil.copy(filename, indir)
+        argv = [
+            "--config",
+            config,
+            "--o",
+            outdir,
+            "--pf",
+            f"{outdir}parsed.txt",
+            "--cf",
+            f"{outdir}clinvar.txt",
+            "--ff",
+            f"{outdir}failed.txt",
+            "--cd",
+            f"{outdir}completed_wb/",
+            "--fd",
+            f"{outdir}failed_wb/",
+            "--no_dx_upload",
+            "--reader",
+            reader,
+        ]
+        start = time.perf_counter()
+        for indir in sorted(glob.glob(f"{tmp_dir}/*/")):
+            if indir == outdir:
+                continue
+            testargs = ["variant_workbook_parser.py", "--i", indir] + argv
+            with patch.object(
+                sys, "argv", testargs
+            ), contextlib.redirect_stdout(io.StringIO()):
+                parser.main()
+
+        return time.perf_counter() - start
+
+
+def compare_with_baseline(
+    results: list, baseline: list, tolerance: float
+) -> list:
+    """
+    find the timings slower than the baseline by more than the tolerance
+
+    Parameters
+    ----------
+      list of dict results of this run
+      list of dict results of the baseline
+      float for tolerated ratio of seconds against the baseline
+
+    Return
+    ------
+      list of dict results with the baseline seconds and ratio added,
+      for the results also in the baseline
+    """
+    baseline_seconds = {
+        (result["workbook"], result["reader"], result["stage"]): result[
+            "seconds"
+        ]
+        for result in baseline
+    }
+    compared = []
+    for result in results:
+        key = (result["workbook"], result["reader"], result["stage"])
+        if key not in baseline_seconds:
+            continue
+        ratio = result["seconds"] / baseline_seconds[key]
+        compared.append(
+            dict(
+                result,
+                baseline=baseline_seconds[key],
+                ratio=ratio,
+                # differences under a millisecond are noise
+                regression=ratio > tolerance
+                and result["seconds"] - baseline_seconds[key] > 0.001,
+            )
+        )
+
+    return compared
+
+
+def main():
+    arguments = get_command_line_args()
+    with open(arguments.config) as f:
+        config_variable = json.load(f)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = list(arguments.files)
+        os.makedirs(f"{tmp_dir}/CUH")
+        for variants in arguments.large:
+            filename = f"{tmp_dir}/CUH/large_{variants}_variants.xlsx"
+            generate_workbook(
+                filename, variants, max(1, variants // 100), seed=variants
+            )
+            files.append(filename)
+
+        results = []
+        print(
+            f"{'workbook':<45} {'reader':<10} {'stage':<22} {'seconds':>9}"
+        )
+        for filename in files:
+            for reader in arguments.readers:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = benchmark_workbook(
+                        filename, reader, config_variable, arguments.repeat
+                    )
+                for stage, seconds in result["seconds"].items():
+                    results.append(
+                        {
+                            "workbook": os.path.basename(filename),
+                            "reader": reader,
+                            "stage": stage,
+                            "seconds": seconds,
+                        }
+                    )
+                    print(
+                        f"{os.path.basename(filename):<45} {reader:<10} "
+                        f"{stage:<22} {seconds:>9.4f}"
+                    )
+                print(
+                    f"{os.path.basename(filename):<45} {reader:<10} "
+                    f"{'peak MiB':<22} {result['peak_mib']:>9.2f}"
+                )
+        for reader in arguments.readers:
+            seconds = benchmark_main(files, reader, arguments.config)
+            results.append(
+                {
+                    "workbook": "all",
+                    "reader": reader,
+                    "stage": "main",
+                    "seconds": seconds,
+                }
+            )
+            print(f"{'all':<45} {reader:<10} {'main':<22} {seconds:>9.4f}")
+
+    if arguments.output:
+        with open(arguments.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "repeat": arguments.repeat,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+    if arguments.baseline:
+        with open(arguments.baseline) as f:
+            baseline = json.load(f)["results"]
+        compared = compare_with_baseline(
+            results, baseline, arguments.tolerance
+        )
+        print(
+            f"\n{'workbook':<45} {'reader':<10} {'stage':<22} "
+            f"{'baseline':>9} {'seconds':>9} {'ratio':>6}"
+        )
+        for result in compared:
+            print(
+                f"{result['workbook']:<45} {result['reader']:<10} "
+                f"{result['stage']:<22} {result['baseline']:>9.4f} "
+                f"{result['seconds']:>9.4f} {result['ratio']:>6.2f}"
+                + ("  REGRESSION" if result["regression"] else "")
+            )
+        regressions = [result for result in compared if result["regression"]]
+        if regressions:
+            sys.exit(
+                f"{len(regressions)} timing(s) slower than the baseline by "
+                f"more than {arguments.tolerance}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import threading
+import time
+from types import SimpleNamespace
+
+
+class UploadResult:
+    """
+    Outcome of the upload of one file
+
+    Parameters
+    ----------
+      str for local file uploaded
+      str for destination folder
+      int for number of attempts made
+      Exception raised by the last attempt, None if uploaded
+      datetime the first attempt started (optional)
+      float for seconds of all attempts, including backoff (optional)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        folder: str,
+        attempts: int,
+        error: Exception = None,
+        start: datetime = None,
+        seconds: float = None,
+    ) -> None:
+        self.path = path
+        self.folder = folder
+        self.attempts = attempts
+        self.error = error
+        self.start = start
+        self.seconds = seconds
+
+    @property
+    def uploaded(self) -> bool:
+        return self.error is None
+
+    def span(self) -> dict:
+        """
+        trace span of the upload
+
+        Return
+        ------
+          dict with the same keys as the spans of tracing.py
+        """
+        span = {
+            "workbook": self.path,
+            "stage": "dx_upload",
+            "start": self.start.isoformat(timespec="microseconds")
+            if self.start
+            else None,
+            "duration": self.seconds,
+            "attempts": self.attempts,
+            "outcome": "ok" if self.uploaded else "error",
+        }
+        if not self.uploaded:
+            span["error"] = f"{type(self.error).__name__}: {self.error}"
+        return span
+
+    def __repr__(self) -> str:
+        if self.uploaded:
+            return (
+                f"uploaded {self.path} to {self.folder} "
+                f"(attempts: {self.attempts})"
+            )
+        return (
+            f"failed to upload {self.path} to {self.folder} "
+            f"(attempts: {self.attempts}): {self.error}"
+        )
+
+
+class Uploader:
+    """
+    Bounded thread pool uploading files in the background, so uploads
+    overlap with parsing. Failed uploads are retried with exponential
+    backoff and the result of every upload is reported by wait()
+
+    Parameters
+    ----------
+      function uploading a local file, called with the file path and
+        the keyword arguments given to submit (dxpy.upload_local_file)
+      int for number of concurrent uploads
+      int for number of retries after a failed upload
+      float for seconds to wait before the first retry, doubled after
+        each retry
+    """
+
+    def __init__(
+        self,
+        upload_file,
+        workers: int = 4,
+        retries: int = 3,
+        backoff: float = 1.0,
+    ) -> None:
+        self.upload_file = upload_file
+        self.retries = retries
+        self.backoff = backoff
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+
+    def _upload(self, path: str, **kwargs) -> UploadResult:
+        """
+        upload a file, retrying with exponential backoff
+
+        Parameters
+        ----------
+          str for local file to upload
+          keyword arguments for upload_file
+
+        Return
+        ------
+          UploadResult of the last attempt
+        """
+        folder = kwargs.get("folder")
+        start = datetime.now()
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                self.upload_file(path, **kwargs)
+                return UploadResult(
+                    path,
+                    folder,
+                    attempt + 1,
+                    start=start,
+                    seconds=time.perf_counter() - started,
+                )
+            except Exception as e:
+                error = e
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2**attempt)
+
+        return UploadResult(
+            path,
+            folder,
+            self.retries + 1,
+            error,
+            start,
+            time.perf_counter() - started,
+        )
+
+    def submit(self, path: str, **kwargs) -> None:
+        """
+        queue a file to upload in the background
+
+        Parameters
+        ----------
+          str for local file to upload
+          keyword arguments for upload_file
+        """
+        self.futures.append(self.executor.submit(self._upload, path, **kwargs))
+
+    def wait(self) -> list:
+        """
+        wait for all queued uploads and print the result of each of them
+        in the order they were queued
+
+        Return
+        ------
+          list of UploadResult
+        """
+        self.executor.shutdown(wait=True)
+        results = [future.result() for future in self.futures]
+        for result in results:
+            print(result)
+
+        return results
+
+
+class DXClient:
+    """
+    DNAnexus session of a parser run, logging in once and caching the
+    project and the folders created in it. All uploads go through it
+
+    Parameters
+    ----------
+      str for DNAnexus token
+      str for DNAnexus project ID
+      module or object with the dxpy API used (optional, default dxpy)
+    """
+
+    def __init__(self, token: str, project_id: str, backend=None) -> None:
+        if backend is None:
+            import dxpy as backend
+        self.backend = backend
+        self.token = token
+        self.project_id = project_id
+        self.logged_in = None
+        self.folders = set()
+        self._project = None
+        self._lock = threading.Lock()
+
+    def login(self) -> bool:
+        """
+        log in to DNAnexus on the first call only
+
+        Return
+        ------
+          bool for whether the token was accepted
+        """
+        with self._lock:
+            if self.logged_in is None:
+                try:
+                    self.backend.set_security_context(
+                        {
+                            "auth_token_type": "Bearer",
+                            "auth_token": str(self.token),
+                        }
+                    )
+                    self.backend.api.system_whoami()
+                    self.logged_in = True
+                except self.backend.exceptions.InvalidAuthentication as e:
+                    print(e)
+                    self.logged_in = False
+
+        return self.logged_in
+
+    @property
+    def project(self):
+        """
+        DXProject of the project ID, created on first use
+        """
+        if self._project is None:
+            self.login()
+            self._project = self.backend.DXProject(self.project_id)
+        return self._project
+
+    def new_folder(self, folder: str) -> None:
+        """
+        create a folder in the project unless it was created already
+
+        Parameters
+        ----------
+          str for folder path
+        """
+        if folder not in self.folders:
+            self.project.new_folder(folder=folder)
+            self.folders.add(folder)
+
+    def upload_local_file(self, path: str, folder: str, **kwargs) -> None:
+        """
+        upload a local file into a folder of the project
+
+        Parameters
+        ----------
+          str for local file to upload
+          str for destination folder
+          other keyword arguments of dxpy.upload_local_file
+        """
+        self.login()
+        self.backend.upload_local_file(
+            path, project=self.project_id, folder=folder, **kwargs
+        )
+
+
+class FakeDXBackend:
+    """
+    In-process stand-in for the parts of the dxpy API used by DXClient,
+    counting the calls made to it and recording folders and uploads
+
+    Parameters
+    ----------
+      str for the only token accepted
+    """
+
+    class InvalidAuthentication(Exception):
+        pass
+
+    def __init__(self, token: str = "token") -> None:
+        self.token = token
+        self.calls = Counter()
+        self.folders = []
+        self.uploads = []
+        self.context = None
+        self.api = SimpleNamespace(system_whoami=self.system_whoami)
+        self.exceptions = SimpleNamespace(
+            InvalidAuthentication=self.InvalidAuthentication
+        )
+        self._lock = threading.Lock()
+
+    def _count(self, call: str) -> None:
+        with self._lock:
+            self.calls[call] += 1
+
+    def set_security_context(self, context: dict) -> None:
+        self._count("set_security_context")
+        self.context = context
+
+    def _check_token(self) -> None:
+        if not self.context or self.context["auth_token"] != self.token:
+            raise self.InvalidAuthentication("Invalid token")
+
+    def system_whoami(self) -> dict:
+        self._count("system_whoami")
+        self._check_token()
+        return {"id": "user-fake"}
+
+    def DXProject(self, project_id: str):
+        self._count("DXProject")
+        backend = self
+
+        class FakeDXProject:
+            def new_folder(self, folder: str, parents: bool = False):
+                backend._count("new_folder")
+                backend.folders.append((project_id, folder))
+
+        return FakeDXProject()
+
+    def upload_local_file(self, filename: str, **kwargs) -> None:
+        self._count("upload_local_file")
+        self._check_token()
+        with self._lock:
+            self.uploads.append((filename, kwargs))
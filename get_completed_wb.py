@@ -1,6 +1,7 @@
 import os
 from datetime import datetime
 import argparse
+import json
 import shutil
 
 
@@ -42,6 +43,14 @@ def get_command_line_args() -> argparse.Namespace:
             "workbooks_not_found_clingen.txt"
         ),
     )
+    parser.add_argument(
+        "--index_cache",
+        "--ic",
+        help=(
+            "json file to keep the listing of the folder between runs, "
+            "only directories modified since the last run are listed again"
+        ),
+    )
     args = parser.parse_args()
 
     return args
@@ -62,19 +71,121 @@ def write_txt_file(txt_file_name: str, filename: str) -> None:
         file.close()
 
 
+def scan_dir(path: str):  # -> tuple[list, list]
+    """
+    list a directory the way os.walk does
+
+    Parameters
+    ----------
+      str for directory
+
+    Return
+    ------
+      list of names of the files in the directory
+      list of names of the subdirectories to walk into
+    """
+    files = []
+    subdirs = []
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return files, subdirs
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if not is_dir:
+            files.append(entry.name)
+            continue
+        # like os.walk, symlinks to directories are not followed
+        try:
+            is_symlink = entry.is_symlink()
+        except OSError:
+            is_symlink = False
+        if not is_symlink:
+            subdirs.append(entry.name)
+
+    return files, subdirs
+
+
+def build_index(folder: str, cache: dict = None):  # -> tuple[dict, dict]
+    """
+    index the files under a folder in one traversal, in the same order as
+    os.walk. Directories whose mtime is unchanged since the cached listing
+    are not listed again
+
+    Parameters
+    ----------
+      str for folder to index
+      dict of directory listings from a previous run (optional)
+
+    Return
+    ------
+      dict of file name to the directories it is found in
+      dict of directory listings to cache for the next run
+    """
+    cache = cache or {}
+    index = {}
+    listings = {}
+    stack = [folder]
+    while stack:
+        root = stack.pop()
+        try:
+            mtime = os.stat(root).st_mtime_ns
+        except OSError:
+            continue
+        listing = cache.get(root)
+        if listing is None or listing["mtime"] != mtime:
+            files, subdirs = scan_dir(root)
+            listing = {"mtime": mtime, "files": files, "subdirs": subdirs}
+        listings[root] = listing
+        for name in listing["files"]:
+            index.setdefault(name, []).append(root)
+        stack.extend(
+            os.path.join(root, subdir)
+            for subdir in reversed(listing["subdirs"])
+        )
+
+    return index, listings
+
+
+def load_index_cache(cache_file: str) -> dict:
+    """
+    load the directory listings saved by a previous run
+
+    Parameters
+    ----------
+      str for json cache file
+
+    Return
+    ------
+      dict of directory listings, empty if there is no usable cache
+    """
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
 def main():
     arguments = get_command_line_args()
     input_file = open(arguments.input, "r")
     lines = input_file.read().splitlines()
+    cache = None
+    if arguments.index_cache:
+        cache = load_index_cache(arguments.index_cache)
+    index, listings = build_index(arguments.folder, cache)
+    if arguments.index_cache:
+        with open(arguments.index_cache, "w") as f:
+            json.dump(listings, f)
     for line in lines:
         found = False
-        for root, dirs, files in os.walk(arguments.folder):
-            if line in files:
-                shutil.copy(
-                    os.path.abspath(root + "/" + line), arguments.outdir
-                )
-                print("found", line, "in", os.path.abspath(root))
-                found = True
+        for root in index.get(line, []):
+            shutil.copy(os.path.abspath(root + "/" + line), arguments.outdir)
+            print("found", line, "in", os.path.abspath(root))
+            found = True
         if not found:
             write_txt_file(arguments.file_not_found, line)
 
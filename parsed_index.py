@@ -0,0 +1,126 @@
+import locale
+import os
+from pathlib import Path
+import sqlite3
+
+# bytes at the start of the log kept to detect a log that was replaced
+HEAD_SIZE = 256
+
+
+def parsed_workbook_name(line: str) -> str:
+    """
+    get the workbook name from a line of the parsed workbook log
+
+    Parameters
+    ----------
+      str for line written by write_txt_file
+
+    Return
+    ------
+      str for workbook name with .xlsx extension
+    """
+    columns = line.split("\t ")
+    return Path(columns[1]).stem + ".xlsx"
+
+
+class ParsedIndex:
+    """
+    Persistent index of the workbooks recorded in the parsed workbook log.
+    The names are kept in a SQLite file together with the byte offset of
+    the log read so far, so each run only reads the lines appended since
+    the previous run. The index is rebuilt from scratch if the log was
+    truncated or replaced
+
+    Parameters
+    ----------
+      str for log file that records previously parsed workbook
+      str for SQLite index file
+    """
+
+    def __init__(self, log_file: str, index_file: str) -> None:
+        self.log_file = log_file
+        # --pipeline adds the parsed workbooks from its record thread,
+        # while the main thread waits for the pipeline to finish
+        self.connection = sqlite3.connect(
+            index_file, check_same_thread=False
+        )
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS parsed "
+                "(name TEXT PRIMARY KEY) WITHOUT ROWID"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS log "
+                "(id INTEGER PRIMARY KEY CHECK (id = 0), "
+                "offset INTEGER, head BLOB)"
+            )
+        self.sync()
+
+    def sync(self) -> int:
+        """
+        add the workbooks appended to the log since the last sync
+
+        Return
+        ------
+          int for number of log lines read
+        """
+        row = self.connection.execute(
+            "SELECT offset, head FROM log WHERE id = 0"
+        ).fetchone()
+        offset, head = row if row else (0, b"")
+        size = os.path.getsize(self.log_file)
+        with open(self.log_file, "rb") as file:
+            if offset > size or file.read(len(head)) != head:
+                offset, head = 0, b""
+                with self.connection:
+                    self.connection.execute("DELETE FROM parsed")
+            file.seek(offset)
+            data = file.read(size - offset)
+            if len(head) < HEAD_SIZE:
+                file.seek(0)
+                head = file.read(HEAD_SIZE)
+        # the last line may still be being written
+        data = data[: data.rfind(b"\n") + 1]
+        encoding = locale.getpreferredencoding(False)
+        lines = [line for line in data.decode(encoding).splitlines() if line]
+        head = head[: offset + len(data)]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO parsed VALUES (?)",
+                ((parsed_workbook_name(line),) for line in lines),
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO log VALUES (0, ?, ?)",
+                (offset + len(data), head),
+            )
+
+        return len(lines)
+
+    def add(self, name: str) -> None:
+        """
+        add a workbook parsed by this run, before it is read from the log
+
+        Parameters
+        ----------
+          str for workbook name with .xlsx extension
+        """
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO parsed VALUES (?)", (name,)
+            )
+
+    def __contains__(self, name: str) -> bool:
+        return (
+            self.connection.execute(
+                "SELECT 1 FROM parsed WHERE name = ?", (name,)
+            ).fetchone()
+            is not None
+        )
+
+    def __len__(self) -> int:
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM parsed"
+        ).fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
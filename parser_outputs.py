@@ -0,0 +1,137 @@
+from __future__ import annotations
+import glob
+import os
+from pathlib import Path
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# arrow types of the typed columns of the all variants dataset, the other
+# columns are strings
+PARQUET_TYPES = {
+    "Organisation ID": "int64",
+    "Start": "int64",
+    "Date last evaluated": "date32",
+}
+PARTITION_COLUMNS = ["organisation_id", "evaluation_month"]
+
+
+class AggregateCsvWriter:
+    """
+    Csv file kept open for a whole run, appending the rows of each parsed
+    workbook as it completes, so memory does not depend on the number of
+    workbooks. The header is written with the first rows and every row
+    keeps the name of its source workbook
+
+    Parameters
+    ----------
+      str for output csv file name
+    """
+
+    SOURCE_COLUMN = "Source workbook"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = None
+        self.columns = None
+        self.rows = 0
+
+    def write(self, workbook: str, df: pd.DataFrame) -> None:
+        """
+        append the rows of a workbook to the csv
+
+        Parameters
+        ----------
+          str for source workbook name
+          data frame of the workbook
+        """
+        df = df.assign(**{self.SOURCE_COLUMN: workbook})
+        if self.file is None:
+            self.file = open(self.path, "w", newline="")
+            self.columns = list(df.columns)
+            df.to_csv(self.file, index=False)
+        else:
+            df.to_csv(
+                self.file, index=False, header=False, columns=self.columns
+            )
+        self.file.flush()
+        self.rows = self.rows + df.shape[0]
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+def parquet_table(df: pd.DataFrame):
+    """
+    convert the all variants df of a workbook into an arrow table with
+    explicit types, adding the partition columns. "null" filled in for
+    empty workbooks becomes a missing value
+
+    Parameters
+    ----------
+      data frame of all variants of a workbook
+
+    Return
+    ------
+      pyarrow Table
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    arrays = {}
+    for column in df.columns:
+        values = df[column].mask(df[column].astype(object) == "null")
+        pa_type = pa.type_for_alias(PARQUET_TYPES.get(column, "string"))
+        if pa.types.is_date(pa_type):
+            values = pd.to_datetime(values).dt.date
+        elif pa.types.is_integer(pa_type):
+            values = pd.to_numeric(values)
+        else:
+            values = [
+                None if pd.isna(value) else str(value) for value in values
+            ]
+        arrays[column] = pa.array(values, type=pa_type, from_pandas=True)
+    organisation = arrays["Organisation ID"].cast(pa.string())
+    evaluated = pd.to_datetime(df["Date last evaluated"], errors="coerce")
+    arrays["organisation_id"] = organisation
+    arrays["evaluation_month"] = pa.array(
+        evaluated.dt.strftime("%Y-%m"), type=pa.string(), from_pandas=True
+    )
+
+    return pa.table(arrays)
+
+
+def write_parquet(df: pd.DataFrame, dataset_dir: str, filename: str) -> None:
+    """
+    add the all variants of a workbook to the parquet dataset, partitioned
+    by organisation and month of evaluation. The files of an earlier parse
+    of the workbook are removed from every partition first, so a workbook
+    parsed again with another organisation or month has no duplicate
+    rows. Files of other workbooks are left as they are
+
+    Parameters
+    ----------
+      data frame of all variants of a workbook
+      str for dataset dir
+      variant workbook file name
+    """
+    import pyarrow.dataset as ds
+
+    stem = Path(filename).stem
+    workbook_file = re.compile(rf"{re.escape(stem)}-\d+\.parquet")
+    partitions = [dataset_dir] + ["*"] * len(PARTITION_COLUMNS)
+    for path in glob.glob(os.path.join(*partitions, "*.parquet")):
+        if workbook_file.fullmatch(os.path.basename(path)):
+            os.remove(path)
+    ds.write_dataset(
+        parquet_table(df),
+        dataset_dir,
+        format="parquet",
+        partitioning=PARTITION_COLUMNS,
+        partitioning_flavor="hive",
+        basename_template=stem + "-{i}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
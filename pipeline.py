@@ -0,0 +1,126 @@
+import asyncio
+from concurrent.futures import Future
+
+# marks the end of the items in a queue
+_DONE = object()
+
+
+def _failed(error: BaseException) -> Future:
+    """
+    future holding an error, passed on so it is raised in input order
+
+    Parameters
+    ----------
+      exception raised by a stage
+
+    Return
+    ------
+      concurrent.futures.Future with the exception set
+    """
+    future = Future()
+    future.set_exception(error)
+
+    return future
+
+
+class StagedPipeline:
+    """
+    Pipeline running the items through stages connected by bounded
+    queues, so the bytes of the next workbooks are fetched while the
+    current ones are parsed and their outputs written:
+
+      fetch -> parse -> record
+
+    fetch runs in a thread and its queue holds at most prefetch items.
+    parse submits each item to an executor and at most in_flight
+    submitted items wait to be recorded. record runs in a thread, one
+    item at a time and in input order. A full queue makes the stage
+    before it wait, so a slow stage holds back the ones before it
+    instead of fetching every workbook into memory.
+
+    An error raised fetching or parsing an item is raised when that
+    item is recorded, after the items before it were recorded, and no
+    item after it is recorded, the same as a loop parsing and recording
+    one item at a time.
+
+    Parameters
+    ----------
+      callable reading the payload of an item, run in a thread
+      callable submitting an item and its payload, returning a
+      concurrent.futures.Future of the result
+      callable recording an item and its result, run in a thread
+      int for number of items fetched ahead
+      int for number of items submitted ahead
+    """
+
+    def __init__(
+        self, fetch, submit, record, prefetch: int = 2, in_flight: int = 1
+    ) -> None:
+        self.fetch = fetch
+        self.submit = submit
+        self.record = record
+        self.prefetch = max(1, prefetch)
+        self.in_flight = max(1, in_flight)
+
+    def run(self, items: list) -> None:
+        """
+        run the items through the stages, returning once all of them
+        are recorded
+
+        Parameters
+        ----------
+          list of items, recorded in this order
+        """
+        asyncio.run(self._run(items))
+
+    async def _run(self, items: list) -> None:
+        fetched = asyncio.Queue(self.prefetch)
+        submitted = asyncio.Queue(self.in_flight)
+        tasks = [
+            asyncio.create_task(self._fetch_stage(items, fetched)),
+            asyncio.create_task(self._parse_stage(fetched, submitted)),
+            asyncio.create_task(self._record_stage(submitted)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _fetch_stage(self, items: list, fetched: asyncio.Queue):
+        for item in items:
+            try:
+                payload = await asyncio.to_thread(self.fetch, item)
+            except Exception as error:
+                await fetched.put((item, None, error))
+                continue
+            await fetched.put((item, payload, None))
+        await fetched.put(_DONE)
+
+    async def _parse_stage(
+        self, fetched: asyncio.Queue, submitted: asyncio.Queue
+    ):
+        while True:
+            entry = await fetched.get()
+            if entry is _DONE:
+                await submitted.put(_DONE)
+                return
+            item, payload, error = entry
+            if error is None:
+                try:
+                    future = self.submit(item, payload)
+                except Exception as submit_error:
+                    future = _failed(submit_error)
+            else:
+                future = _failed(error)
+            await submitted.put((item, asyncio.wrap_future(future)))
+
+    async def _record_stage(self, submitted: asyncio.Queue):
+        while True:
+            entry = await submitted.get()
+            if entry is _DONE:
+                return
+            item, future = entry
+            result = await future
+            await asyncio.to_thread(self.record, item, result)
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import pickle
+
+
+class ResultCache:
+    """
+    Results of parse_workbook kept on disk and keyed by the SHA-256 of
+    the workbook content, so a renamed copy of a workbook is not parsed
+    again and a changed workbook is never served an old result. Keys
+    also depend on the config, unusual_sample_name and the reader, and
+    on the folder of the workbook, which sets its organisation, as these
+    change the result of parsing the same content
+
+    Parameters
+    ----------
+      str for cache dir, created if missing
+      dict from config file
+      boolean for unusual_sample_name
+      str for reader
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        config_variable: dict,
+        unusual_sample_name: bool,
+        reader: str = "native",
+    ) -> None:
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        settings = json.dumps(
+            [config_variable, unusual_sample_name, reader], sort_keys=True
+        )
+        self.settings = hashlib.sha256(settings.encode()).hexdigest()[:16]
+        self.keys = {}
+        # bytes of the workbooks read for their key, kept until parsed
+        self.data = {}
+
+    def key(self, filename: str) -> str:
+        """
+        get the key of a workbook from its content and folder and
+        remember it for the workbook, with the bytes read so the
+        workbook is parsed without reading it again
+
+        Parameters
+        ----------
+          variant workbook file name
+
+        Return
+        ------
+          str for SHA-256 of the content followed by the hash of the
+          settings and folder
+        """
+        with open(filename, "rb") as file:
+            data = file.read()
+        folder = os.path.basename(os.path.normpath(os.path.dirname(filename)))
+        settings = hashlib.sha256(
+            f"{self.settings}/{folder}".encode()
+        ).hexdigest()[:16]
+        digest = hashlib.sha256(data).hexdigest()
+        self.keys[filename] = f"{digest}-{settings}"
+        self.data[filename] = data
+
+        return self.keys[filename]
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def get(self, key: str) -> tuple:
+        """
+        load a cached result
+
+        Parameters
+        ----------
+          str for key
+
+        Return
+        ------
+          tuple returned by parse_workbook
+        """
+        with open(self.path(key), "rb") as file:
+            return pickle.load(file)
+
+    def put(self, key: str, result: tuple) -> None:
+        """
+        store a result, replacing the cache file in one step so a cache
+        shared between runs never has a partly written result
+
+        Parameters
+        ----------
+          str for key
+          tuple returned by parse_workbook
+        """
+        tmp_path = f"{self.path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path(key))
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import pickle
+
+
+class SheetCache:
+    """
+    Values extracted from workbook sheets kept on disk, keyed by the
+    content of the sheet and the extraction asked for, so a workbook
+    edited in one sheet only has that sheet extracted again. The least
+    recently used entries are removed once the cache is larger than its
+    maximum size. The size is counted as entries are stored, so the cache
+    dir is only scanned when the cache is opened and when it is full
+
+    Parameters
+    ----------
+      str for cache dir, created if missing
+      int for maximum size of the cache in bytes
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total = 0
+        self.evict()
+
+    def path(self, sheet_key: str, call: tuple) -> str:
+        """
+        get the cache file of an extraction from a sheet
+
+        Parameters
+        ----------
+          str for key of the sheet content
+          tuple of the extraction method and its arguments
+
+        Return
+        ------
+          str for cache file name
+        """
+        digest = hashlib.sha256(f"{sheet_key}{call!r}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".pkl")
+
+    def get(self, sheet_key: str, call: tuple):
+        """
+        load a cached extraction and mark it as recently used
+
+        Parameters
+        ----------
+          str for key of the sheet content
+          tuple of the extraction method and its arguments
+
+        Return
+        ------
+          extracted value, KeyError is raised if it is not cached
+        """
+        path = self.path(sheet_key, call)
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # a missing entry, or one removed by another process
+            self.misses = self.misses + 1
+            raise KeyError(call)
+        self.hits = self.hits + 1
+
+        return value
+
+    def put(self, sheet_key: str, call: tuple, value) -> None:
+        """
+        store an extraction, then remove the least recently used entries
+        if the cache is larger than its maximum size
+
+        Parameters
+        ----------
+          str for key of the sheet content
+          tuple of the extraction method and its arguments
+          extracted value
+        """
+        path = self.path(sheet_key, call)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            size = file.tell()
+        try:
+            # size of the entry replaced, if any
+            size = size - os.stat(path).st_size
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        self.total = self.total + size
+        if self.total > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        scan the cache dir and remove the least recently used entries
+        until the cache fits in its maximum size. The scan also counts
+        the entries stored or removed by other processes
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".pkl"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total = total - size
+        self.total = total
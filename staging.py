@@ -0,0 +1,357 @@
+import json
+import locale
+import os
+import shutil
+
+JOURNAL = "journal.json"
+
+
+def _append_once(log_file: str, offset: int, data: bytes) -> None:
+    """
+    append bytes to a log file that was offset bytes long when the
+    commit started, unless they were already appended by an interrupted
+    commit. A partly written append is written again from the offset
+
+    Parameters
+    ----------
+      str for log file
+      int for size of the log before the append
+      bytes to append
+    """
+    if not os.path.isfile(log_file):
+        with open(log_file, "wb") as file:
+            file.write(data)
+        return
+    with open(log_file, "r+b") as file:
+        file.seek(offset)
+        written = file.read(len(data))
+        if written == data:
+            return
+        if data.startswith(written):
+            file.seek(offset)
+            file.truncate()
+        else:
+            # lines appended by another writer since the commit started
+            file.seek(0, os.SEEK_END)
+        file.write(data)
+
+
+def apply_journal(journal: dict) -> None:
+    """
+    apply the steps of a commit: replace each output in one step, append
+    the log lines and move the workbooks. Every step can be applied
+    again, so an interrupted commit is finished by applying it again
+
+    Parameters
+    ----------
+      dict of outputs, logs and moves of the commit
+    """
+    for local_path, path in journal["outputs"]:
+        if os.path.isfile(local_path):
+            shutil.copyfile(local_path, path + ".tmp")
+            os.replace(path + ".tmp", path)
+    for log_file, offset, text in journal["logs"]:
+        data = text.replace("\n", os.linesep).encode(
+            locale.getpreferredencoding(False)
+        )
+        _append_once(log_file, offset, data)
+    for filename, dest_dir in journal["moves"]:
+        # already moved by the interrupted commit
+        if os.path.exists(filename):
+            shutil.move(filename, dest_dir)
+
+
+def write_journal(journal_file: str, journal: dict) -> None:
+    """
+    write a journal in one step, removing it if it has nothing to do
+
+    Parameters
+    ----------
+      str for journal file
+      dict of outputs, logs, moves and uploads of the commit
+    """
+    if not any(journal.values()):
+        if os.path.isfile(journal_file):
+            os.remove(journal_file)
+        return
+    with open(journal_file + ".tmp", "w") as file:
+        json.dump(journal, file)
+    os.replace(journal_file + ".tmp", journal_file)
+
+
+def replay_journal(staging_dir: str) -> int:
+    """
+    finish the commit interrupted in a previous run, if any. Its uploads
+    are kept in the journal, to be made by the next StagingArea
+
+    Parameters
+    ----------
+      str for staging dir
+
+    Return
+    ------
+      int for number of workbooks moved by the commit
+    """
+    journal_file = os.path.join(staging_dir, JOURNAL)
+    if not os.path.isfile(journal_file):
+        return 0
+    with open(journal_file) as file:
+        journal = json.load(file)
+    apply_journal(journal)
+    write_journal(
+        journal_file,
+        {
+            "outputs": [],
+            "logs": [],
+            "moves": [],
+            "uploads": journal.get("uploads", []),
+        },
+    )
+
+    return len(journal["moves"])
+
+
+class StagingArea:
+    """
+    Local dir the workbooks are copied to and parsed from, keeping their
+    outputs, log lines and moves until they are committed to the shared
+    drive in batches. Each commit writes a journal before changing the
+    shared drive and removes it once done, so a commit interrupted by a
+    crash is finished by the next run instead of leaving outputs without
+    log lines or logged workbooks that were not moved. Workbooks not
+    committed stay in the input dir and are parsed again.
+
+    Outputs staged for upload are uploaded once committed and stay in
+    the journal until uploaded() is told their uploads are done, so the
+    uploads of a run that crashed or failed to upload are made again by
+    the next run
+
+    Parameters
+    ----------
+      str for staging dir, created if missing
+      int for number of workbooks per commit
+      callable uploading a file (optional, no uploads if not given)
+    """
+
+    def __init__(
+        self, staging_dir: str, batch_size: int, upload=None
+    ) -> None:
+        self.staging_dir = staging_dir
+        self.batch_size = max(1, batch_size)
+        self.upload = upload
+        self.journal_file = os.path.join(staging_dir, JOURNAL)
+        self.inputs_dir = os.path.join(staging_dir, "inputs")
+        self.outputs_dir = os.path.join(staging_dir, "outputs")
+        os.makedirs(staging_dir, exist_ok=True)
+        replay_journal(staging_dir)
+        # uploads of a previous run, made from the committed outputs as
+        # the staged copies are removed below
+        self.pending = []
+        if os.path.isfile(self.journal_file):
+            with open(self.journal_file) as file:
+                self.pending = [
+                    [path, path]
+                    for _, path in json.load(file).get("uploads", [])
+                ]
+        # files staged by a run that was interrupted before committing
+        for folder in [self.inputs_dir, self.outputs_dir]:
+            shutil.rmtree(folder, ignore_errors=True)
+            os.makedirs(folder)
+        self.workbooks = 0
+        self.outputs = []
+        self.logs = {}
+        self.moves = []
+        self.uploads = []
+        self.write_pending()
+        self.run_uploads(self.pending)
+
+    def read(self, filename: str, data: bytes = None) -> bytes:
+        """
+        copy a workbook to the staging dir and read the local copy. The
+        copy keeps the name of the folder of the workbook, which the
+        parser checks. Bytes of the workbook already read are written to
+        the copy instead
+
+        Parameters
+        ----------
+          variant workbook file name
+          bytes of the workbook already read from disk (optional)
+
+        Return
+        ------
+          bytes of the workbook
+        """
+        folder = os.path.basename(os.path.dirname(os.path.abspath(filename)))
+        os.makedirs(os.path.join(self.inputs_dir, folder), exist_ok=True)
+        local_path = os.path.join(
+            self.inputs_dir, folder, os.path.basename(filename)
+        )
+        if data is not None:
+            with open(local_path, "wb") as file:
+                file.write(data)
+            return data
+        shutil.copyfile(filename, local_path)
+        with open(local_path, "rb") as file:
+            return file.read()
+
+    def local_path(self, path: str) -> str:
+        """
+        get the staged copy of an output
+
+        Parameters
+        ----------
+          str for output file name on the shared drive
+
+        Return
+        ------
+          str for local file name
+        """
+        return os.path.join(self.outputs_dir, os.path.basename(path))
+
+    def output(self, path: str) -> str:
+        """
+        stage an output, to be replaced on the shared drive by the commit
+
+        Parameters
+        ----------
+          str for output file name on the shared drive
+
+        Return
+        ------
+          str for local file name to write the output to
+        """
+        self.outputs.append((self.local_path(path), path))
+
+        return self.local_path(path)
+
+    def append_log(self, log_file: str, line: str) -> None:
+        """
+        stage a line to append to a log file
+
+        Parameters
+        ----------
+          str for log file
+          str for line, ending with a new line
+        """
+        self.logs[log_file] = self.logs.get(log_file, "") + line
+
+    def move(self, filename: str, dest_dir: str) -> None:
+        """
+        stage the move of a workbook, ending its staged steps
+
+        Parameters
+        ----------
+          variant workbook file name
+          str for completed or failed dir
+        """
+        self.moves.append((filename, dest_dir))
+        self.workbooks = self.workbooks + 1
+
+    def upload_after_commit(self, path: str) -> None:
+        """
+        stage the upload of an output, made from its staged copy once it
+        is committed
+
+        Parameters
+        ----------
+          str for output file name on the shared drive
+        """
+        if self.upload is not None:
+            self.uploads.append([self.local_path(path), path])
+
+    def commit(self) -> int:
+        """
+        write the journal of the staged steps, apply them to the shared
+        drive, then keep only the uploads not yet done in the journal and
+        remove the staged inputs. The staged uploads are made once the
+        commit is done
+
+        Return
+        ------
+          int for number of workbooks committed
+        """
+        if not (self.outputs or self.logs or self.moves):
+            return 0
+        journal = {
+            "outputs": self.outputs,
+            "logs": [
+                [
+                    log_file,
+                    os.path.getsize(log_file)
+                    if os.path.isfile(log_file)
+                    else 0,
+                    text,
+                ]
+                for log_file, text in self.logs.items()
+            ],
+            "moves": self.moves,
+            "uploads": self.pending + self.uploads,
+        }
+        write_journal(self.journal_file, journal)
+        apply_journal(journal)
+        committed = self.workbooks
+        uploads = self.uploads
+        self.pending = self.pending + uploads
+        self.workbooks = 0
+        self.outputs = []
+        self.logs = {}
+        self.moves = []
+        self.uploads = []
+        self.write_pending()
+        shutil.rmtree(self.inputs_dir, ignore_errors=True)
+        os.makedirs(self.inputs_dir)
+        self.run_uploads(uploads)
+
+        return committed
+
+    def write_pending(self) -> None:
+        """
+        keep only the uploads not yet done in the journal
+        """
+        write_journal(
+            self.journal_file,
+            {"outputs": [], "logs": [], "moves": [], "uploads": self.pending},
+        )
+
+    def run_uploads(self, uploads: list) -> None:
+        """
+        make every upload, then raise an error listing the ones that
+        failed. They stay in the journal and are made again by the next
+        run
+
+        Parameters
+        ----------
+          list of staged copy and output file name of each upload
+        """
+        if self.upload is None:
+            return
+        failed = []
+        for local_path, path in uploads:
+            try:
+                self.upload(local_path)
+            except Exception as error:
+                failed.append(f"{path} ({error})")
+        if failed:
+            raise RuntimeError(
+                "failed to upload committed file(s): " + ", ".join(failed)
+            )
+
+    def uploaded(self, paths: list) -> None:
+        """
+        remove the uploads that are done from the journal
+
+        Parameters
+        ----------
+          list of uploaded file names
+        """
+        self.pending = [
+            upload for upload in self.pending if upload[0] not in paths
+        ]
+        self.write_pending()
+
+    def close(self) -> None:
+        """
+        remove the staged files, once the uploads of the outputs are done
+        """
+        shutil.rmtree(self.inputs_dir, ignore_errors=True)
+        shutil.rmtree(self.outputs_dir, ignore_errors=True)
@@ -0,0 +1,71 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(1, "../")
+from benchmark_parser import compare_with_baseline, time_stages
+from tests import TEST_DATA_DIR
+from workbook_generator import generate_workbook
+
+with open(f"{TEST_DATA_DIR}/test_parser_config.json") as f:
+    config_variable = json.load(f)
+
+
+class TestBenchmarkParser(unittest.TestCase):
+    def test_time_stages(self):
+        """
+        Test "time_stages" times every stage of a generated workbook
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.makedirs(f"{tmp_dir}/CUH")
+            filename = f"{tmp_dir}/CUH/large.xlsx"
+            generate_workbook(filename, 50, 3, seed=1)
+            seconds = time_stages(filename, "native", config_variable)
+        self.assertTrue(
+            list(seconds)
+            == [
+                "open_workbook",
+                "checking_sheets",
+                "get_summary_fields",
+                "get_included_fields",
+                "get_report_fields",
+                "merge_workbook_fields",
+                "parse_workbook",
+            ]
+        )
+
+    def test_compare_with_baseline(self):
+        """
+        Test "compare_with_baseline" flags the stages slower than the
+        tolerance, ignores sub-millisecond differences and results
+        missing from the baseline
+        """
+        baseline = [
+            {"workbook": "a", "reader": "native", "stage": s, "seconds": t}
+            for s, t in [("open", 1.0), ("merge", 0.0001), ("main", 2.0)]
+        ]
+        results = [
+            {"workbook": "a", "reader": "native", "stage": s, "seconds": t}
+            for s, t in [
+                ("open", 1.5),
+                ("merge", 0.0005),
+                ("main", 2.1),
+                ("new", 1.0),
+            ]
+        ]
+        compared = compare_with_baseline(results, baseline, 1.25)
+        self.assertTrue(
+            [result["stage"] for result in compared]
+            == ["open", "merge", "main"]
+        )
+        self.assertTrue(
+            [result["regression"] for result in compared]
+            == [True, False, False]
+        )
+        self.assertTrue(compared[0]["ratio"] == 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
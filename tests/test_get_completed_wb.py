@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(1, "../")
+import get_completed_wb
+from get_completed_wb import build_index
+
+
+class TestGetCompletedWb(unittest.TestCase):
+    def make_tree(self, folder: str) -> None:
+        """
+        Create nested dirs with a workbook found in two places and a
+        symlink to a dir which os.walk does not follow
+        """
+        for path in [
+            "a/cen_snv_test1.xlsx",
+            "a/b/cen_snv_test2.xlsx",
+            "c/cen_snv_test1.xlsx",
+            "c/d/e/cen_snv_test3.xlsx",
+        ]:
+            os.makedirs(os.path.dirname(f"{folder}/{path}"), exist_ok=True)
+            open(f"{folder}/{path}", "w").close()
+        os.symlink(f"{folder}/c", f"{folder}/link")
+
+    def test_build_index_same_as_os_walk(self):
+        """
+        Test "build_index" finds every file in the same dirs and order
+        as os.walk
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            self.make_tree(folder)
+            expected = {}
+            for root, dirs, files in os.walk(folder):
+                for name in files:
+                    expected.setdefault(name, []).append(root)
+            index, listings = build_index(folder)
+            self.assertTrue(index == expected)
+            self.assertTrue(len(index["cen_snv_test1.xlsx"]) == 2)
+            self.assertFalse("link" in index)
+            self.assertFalse(f"{folder}/link" in listings)
+
+    def test_build_index_cache(self):
+        """
+        Test "build_index" only lists again the dirs modified since the
+        cached listing
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            self.make_tree(folder)
+            index, listings = build_index(folder)
+            open(f"{folder}/c/d/cen_snv_test4.xlsx", "w").close()
+            with patch.object(
+                get_completed_wb,
+                "scan_dir",
+                wraps=get_completed_wb.scan_dir,
+            ) as patch_scan:
+                index, listings = build_index(folder, listings)
+            self.assertTrue(
+                [call.args[0] for call in patch_scan.call_args_list]
+                == [f"{folder}/c/d"]
+            )
+            self.assertTrue(
+                index["cen_snv_test4.xlsx"] == [f"{folder}/c/d"]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
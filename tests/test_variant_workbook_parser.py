@@ -1,7 +1,17 @@
+import glob
+import importlib.util
 import json
 import os
+import re
+import shutil
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 from openpyxl import load_workbook
 from unittest.mock import patch
@@ -9,7 +19,16 @@ from freezegun import freeze_time
 
 sys.path.insert(1, "../")
 from variant_workbook_parser import *
+from dx_upload import FakeDXBackend
+from parser_outputs import AggregateCsvWriter, write_parquet
+from parsed_index import ParsedIndex
+from pipeline import StagedPipeline
+from result_cache import ResultCache
+from sheet_cache import SheetCache
+from staging import StagingArea, replay_journal
+from validation_rules import CONFIG_FILE, load_rules
 from tests import TEST_DATA_DIR
+from workbook_reader import NativeWorkbook, ReadOnlyWorkbook, VariantWorkbook
 
 excel_data_NUH = f"{TEST_DATA_DIR}/NUH/cen_snv_test4.xlsx"
 excel_data_CUH = f"{TEST_DATA_DIR}/CUH/cen_snv_test2.xlsx"
@@ -30,6 +49,7 @@ excel_data_wrong_interpreted = (
     f"{TEST_DATA_DIR}/CUH/cen_snv_test2_wrong_interpreted.xlsx"
 )
 excel_data_wrong_ACMG = f"{TEST_DATA_DIR}/CUH/cen_snv_test2_wrong_ACMG.xlsx"
+excel_data_formula = f"{TEST_DATA_DIR}/cen_snv_test2_formula.xlsx"
 excel_data_wrong_dropdown = (
     f"{TEST_DATA_DIR}/NUH/cen_snv_test4_wrong_interpret_dropdown.xlsx"
 )
@@ -46,6 +66,10 @@ excel_data_invalid_evaluated_date = (
 with open(f"{TEST_DATA_DIR}/test_parser_config.json") as f:
     config_variable = json.load(f)
 
+# seconds allowed for --help and for a run with nothing to parse,
+# including the start of the interpreter
+STARTUP_BUDGET = 1.5
+
 
 class TestParserScript(unittest.TestCase):
     """
@@ -69,6 +93,37 @@ class TestParserScript(unittest.TestCase):
             ]
         )
 
+    def test_parsed_index(self):
+        """
+        Test "ParsedIndex" holds the same workbooks as "get_parsed_list",
+        only reads the lines appended to the log since the last sync
+        and is rebuilt if the log is replaced
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_file = f"{tmp_dir}/parsed.txt"
+            index_file = f"{tmp_dir}/parsed.sqlite"
+            shutil.copy(parsed_data, log_file)
+            parsed_index = ParsedIndex(log_file, index_file)
+            self.assertTrue(len(parsed_index) == 4)
+            for name in get_parsed_list(parsed_data):
+                self.assertTrue(name in parsed_index)
+            self.assertFalse("cen_snv_test5.xlsx" in parsed_index)
+            parsed_index.close()
+
+            write_txt_file(log_file, "dir/cen_snv_test5.xlsx", "")
+            parsed_index = ParsedIndex(log_file, index_file)
+            self.assertTrue("cen_snv_test5.xlsx" in parsed_index)
+            self.assertTrue(parsed_index.sync() == 0)
+            parsed_index.close()
+
+            os.remove(log_file)
+            write_txt_file(log_file, "dir/cen_snv_test6.xlsx", "")
+            parsed_index = ParsedIndex(log_file, index_file)
+            self.assertTrue(len(parsed_index) == 1)
+            self.assertTrue("cen_snv_test6.xlsx" in parsed_index)
+            self.assertFalse("cen_snv_test5.xlsx" in parsed_index)
+            parsed_index.close()
+
     def test_get_folder(self):
         """
         Test "get_folder" generates the correct folder
@@ -112,6 +167,56 @@ class TestParserScript(unittest.TestCase):
         self.assertTrue(df["Start"][0] == 135773000)
         self.assertTrue(df["HGVSc"][1] == "NM_000548.5:c.4255C>T")
 
+    def test_generate_local_ids(self):
+        """
+        Test "generate_local_ids" gives the requested number of IDs in
+        the uid_<int> format, with ints that fit in int64
+        Test millions of IDs generated in one process and concurrently
+        in the processes of id_process_pool have no duplicates
+        """
+        local_ids = generate_local_ids(5)
+        self.assertTrue(len(local_ids) == 5)
+        self.assertTrue(
+            all(re.match(r"^uid_\d+$", local_id) for local_id in local_ids)
+        )
+        self.assertTrue(
+            all(int(local_id[4:]) < 1 << 63 for local_id in local_ids)
+        )
+        batches = [generate_local_ids(1000) for _ in range(1000)]
+        with id_process_pool(4) as executor:
+            batches.extend(executor.map(generate_local_ids, [250000] * 8))
+        all_ids = [local_id for batch in batches for local_id in batch]
+        self.assertTrue(len(all_ids) == 3000000)
+        self.assertTrue(len(set(all_ids)) == len(all_ids))
+
+    def test_generate_local_ids_hosts(self):
+        """
+        Test runs with different node IDs on two hosts give different
+        Local IDs in the same millisecond, even when their pids and
+        host names are the same or collide when hashed
+        """
+        import variant_workbook_parser
+
+        host_ids = []
+        for node_id, hostname in [(1, "host-a"), (2, "host-b")]:
+            with patch.object(
+                variant_workbook_parser, "_next_id_tick", 0
+            ), patch.object(variant_workbook_parser, "_id_node", 0), patch(
+                "variant_workbook_parser.time.time_ns",
+                return_value=1700000000000000000,
+            ), patch("os.getpid", return_value=4096 * node_id), patch(
+                "socket.gethostname", return_value=hostname
+            ):
+                set_id_node(node_id, 1)
+                host_ids.append(generate_local_ids(2000))
+        self.assertTrue(set(host_ids[0]).isdisjoint(host_ids[1]))
+        self.assertTrue(len(set(host_ids[0])) == 2000)
+        self.assertTrue(
+            all(int(local_id[4:]) < 1 << 63 for local_id in host_ids[0])
+        )
+        with self.assertRaises(ValueError):
+            set_id_node(64)
+
     def test_get_report_fields(self):
         """
         Test "get_report_fields" generates df with expected shape
@@ -225,6 +330,266 @@ class TestParserScript(unittest.TestCase):
         self.assertTrue(df_report["BP4_evidence"][0] is np.nan)
         self.assertTrue(msg == "")
 
+    def test_process_report_evidence(self):
+        """
+        Test "process_report_evidence" removes 'NA' strengths and
+        the evidence of criteria without strength, and only writes
+        strengths which are not the default in the comment on
+        classification
+        """
+        df_report = pd.DataFrame(
+            {
+                "Associated disease": ["A", "B", "C"],
+                "Known inheritance": ["AD", "AR", "AD"],
+                "Prevalence": [np.nan, np.nan, np.nan],
+                "HGVSc": ["c.1A>G", "c.2A>G", "c.3A>G"],
+                "Germline classification": ["Pathogenic"] * 3,
+                "PVS1": ["Very Strong", "Strong", np.nan],
+                "PVS1_evidence": ["LOF", "LOF", "LOF"],
+                "PM2": ["NA", "Supporting", np.nan],
+                "PM2_evidence": ["absent", "absent", np.nan],
+                "BA1": [np.nan, np.nan, np.nan],
+                "BA1_evidence": [np.nan, np.nan, np.nan],
+            }
+        )
+        df_report = process_report_evidence(df_report)
+        self.assertTrue(df_report["PM2"][0] is np.nan)
+        self.assertTrue(df_report["PM2_evidence"][0] is np.nan)
+        self.assertTrue(df_report["PVS1_evidence"][2] is np.nan)
+        self.assertTrue(df_report["PM2_evidence"][1] == "absent")
+        self.assertTrue(
+            df_report["Comment on classification"].tolist()
+            == ["PVS1", "PVS1_Strong,PM2_Supporting", ""]
+        )
+
+    def test_stages_share_loaded_workbook(self):
+        """
+        Test the parsing stages reuse a VariantWorkbook passed in and do
+        not load the workbook from disk again
+        Test the extracted data is the same as loading from file name
+        """
+        workbook = VariantWorkbook(excel_data_CUH)
+        with patch("workbook_reader.load_workbook") as patch_load, patch(
+            "pandas.read_excel", wraps=pd.read_excel
+        ) as patch_read_excel:
+            msg = checking_sheets(excel_data_CUH, workbook)
+            df_summary, error_msg = get_summary_fields(
+                excel_data_CUH, config_variable, False, workbook
+            )
+            df_included = get_included_fields(excel_data_CUH, workbook)
+            df_report, msg_table = get_report_fields(
+                excel_data_CUH, df_included, workbook
+            )
+        self.assertFalse(patch_load.called)
+        self.assertTrue(
+            all(
+                isinstance(call.args[0], pd.ExcelFile)
+                for call in patch_read_excel.call_args_list
+            )
+        )
+        self.assertTrue(msg is None)
+        self.assertTrue(msg_table == "")
+        self.assertTrue(
+            df_summary.equals(
+                get_summary_fields(excel_data_CUH, config_variable, False)[0]
+            )
+        )
+        df_report_from_file, _ = get_report_fields(
+            excel_data_CUH, df_included
+        )
+        self.assertTrue(df_report.equals(df_report_from_file))
+
+    def test_readonly_reader_matches_openpyxl(self):
+        """
+        Test the readonly reader extracts the same data as the default
+        openpyxl reader
+        Test each needed sheet is only streamed once
+        """
+        workbook = open_workbook(excel_data_CUH, "openpyxl")
+        readonly = open_workbook(excel_data_CUH, "readonly")
+        self.assertTrue(isinstance(readonly, ReadOnlyWorkbook))
+        with patch.object(
+            readonly, "_fetch", wraps=readonly._fetch
+        ) as patch_fetch:
+            self.assertTrue(checking_sheets(excel_data_CUH, readonly) is None)
+            df_summary, msg = get_summary_fields(
+                excel_data_CUH, config_variable, False, readonly
+            )
+            df_included = get_included_fields(excel_data_CUH, readonly)
+            df_report, msg_table = get_report_fields(
+                excel_data_CUH, df_included, readonly
+            )
+        # summary and the three interpret sheets
+        self.assertTrue(patch_fetch.call_count == 4)
+        self.assertTrue(
+            df_summary.equals(
+                get_summary_fields(
+                    excel_data_CUH, config_variable, False, workbook
+                )[0]
+            )
+        )
+        df_included_openpyxl = get_included_fields(excel_data_CUH, workbook)
+        self.assertTrue(
+            df_included.drop(columns=["Local ID", "Linking ID"]).equals(
+                df_included_openpyxl.drop(columns=["Local ID", "Linking ID"])
+            )
+        )
+        df_report_openpyxl, _ = get_report_fields(
+            excel_data_CUH, df_included, workbook
+        )
+        self.assertTrue(df_report.equals(df_report_openpyxl))
+
+    def test_native_reader_matches_openpyxl(self):
+        """
+        Test the native reader extracts the same data as the default
+        openpyxl reader, including a whole sheet read as data frame
+        Test sheets that are not needed are never read from the zip
+        """
+        workbook = open_workbook(excel_data_NUH, "openpyxl")
+        native = open_workbook(excel_data_NUH, "native")
+        self.assertTrue(isinstance(native, NativeWorkbook))
+        self.assertTrue(native.sheetnames == workbook.sheetnames)
+        with patch.object(
+            native.archive, "open", wraps=native.archive.open
+        ) as patch_open:
+            self.assertTrue(checking_sheets(excel_data_NUH, native) is None)
+            df_summary, msg = get_summary_fields(
+                excel_data_NUH, config_variable, False, native
+            )
+            df_included = get_included_fields(excel_data_NUH, native)
+            df_report, msg_table = get_report_fields(
+                excel_data_NUH, df_included, native
+            )
+        opened = {call.args[0] for call in patch_open.call_args_list}
+        self.assertTrue(native.sheet_paths["excluded"] not in opened)
+        self.assertTrue(
+            df_summary.equals(
+                get_summary_fields(
+                    excel_data_NUH, config_variable, False, workbook
+                )[0]
+            )
+        )
+        df_included_openpyxl = get_included_fields(excel_data_NUH, workbook)
+        self.assertTrue(
+            df_included.drop(columns=["Local ID", "Linking ID"]).equals(
+                df_included_openpyxl.drop(columns=["Local ID", "Linking ID"])
+            )
+        )
+        df_report_openpyxl, _ = get_report_fields(
+            excel_data_NUH, df_included, workbook
+        )
+        self.assertTrue(df_report.equals(df_report_openpyxl))
+        self.assertTrue(
+            native.read_sheet("excluded").equals(
+                pd.read_excel(excel_data_NUH, sheet_name="excluded")
+            )
+        )
+
+    def test_readers_formula_values(self):
+        """
+        Test every reader parses the cached value of a formula in the
+        HGVSc column of the included sheet, as pandas.read_excel does
+        """
+        expected = pd.read_excel(excel_data_formula, sheet_name="included")
+        self.assertTrue(expected["HGVSc"][1] == "NM_000548.5:c.4255C>T")
+        _, _, error_msg, _ = parse_workbook(
+            excel_data_CUH, config_variable, False, "openpyxl"
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.makedirs(f"{tmp_dir}/CUH")
+            filename = f"{tmp_dir}/CUH/wb.xlsx"
+            shutil.copy(excel_data_formula, filename)
+            for reader in ["openpyxl", "readonly", "native"]:
+                workbook = open_workbook(filename, reader)
+                df_included = get_included_fields(filename, workbook)
+                self.assertTrue(
+                    list(df_included["HGVSc"])
+                    == list(expected["HGVSc"][:2]),
+                    reader,
+                )
+                result = parse_workbook(
+                    filename, config_variable, False, reader
+                )
+                self.assertTrue(result[2] == error_msg, reader)
+
+    def test_native_reader_sheet_cache(self):
+        """
+        Test the native reader with a sheet cache gives the same results
+        and, after one interpret sheet of the workbook is edited, only
+        parses that sheet again
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.makedirs(f"{tmp_dir}/CUH")
+            filename = f"{tmp_dir}/CUH/wb.xlsx"
+            workbook = load_workbook(excel_data_CUH)
+            workbook.save(filename)
+            sheet_cache = SheetCache(f"{tmp_dir}/cache", 1024**2)
+            results = []
+            misses = []
+            for cache in [None, sheet_cache, sheet_cache]:
+                results.append(
+                    parse_workbook(
+                        filename, config_variable, False, "native", None, cache
+                    )
+                )
+                misses.append(sheet_cache.misses)
+            self.assertTrue(misses[1] > 0)
+            self.assertTrue(misses[2] == misses[1])
+            for df_final, df_clinvar, error_msg, _ in results:
+                self.assertTrue(error_msg is None)
+                self.assertTrue(
+                    df_final.drop(columns=["Local ID", "Linking ID"]).equals(
+                        results[0][0].drop(columns=["Local ID", "Linking ID"])
+                    )
+                )
+            self.assertTrue(
+                set(results[1][0]["Local ID"]).isdisjoint(
+                    results[2][0]["Local ID"]
+                )
+            )
+
+            # reload the saved workbook so only the edited sheet changes
+            workbook = load_workbook(filename)
+            workbook["interpret_2"]["C3"] = "NM_000548.5:c.4255C>A"
+            workbook.save(filename)
+            hits = sheet_cache.hits
+            sheet_cache.misses = 0
+            _, _, error_msg, _ = parse_workbook(
+                filename, config_variable, False, "native", None, sheet_cache
+            )
+            self.assertTrue(sheet_cache.misses == 1)
+            self.assertTrue(sheet_cache.hits > hits)
+            self.assertTrue(
+                error_msg
+                == "HGVSc in interpret table does not match with that in "
+                "included sheet"
+            )
+
+    def test_sheet_cache_eviction(self):
+        """
+        Test "SheetCache" removes the least recently used entries once
+        it is larger than its maximum size, only scanning the cache dir
+        when it is full
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sheet_cache = SheetCache(tmp_dir, 2500)
+            with patch.object(
+                sheet_cache, "evict", wraps=sheet_cache.evict
+            ) as evict:
+                for idx in range(3):
+                    sheet_cache.put("sheet", ("call", idx), b"x" * 1000)
+                    time.sleep(0.01)
+            self.assertTrue(evict.call_count == 1)
+            self.assertTrue(len(os.listdir(tmp_dir)) == 2)
+            with self.assertRaises(KeyError):
+                sheet_cache.get("sheet", ("call", 0))
+            sheet_cache.get("sheet", ("call", 1))
+            time.sleep(0.01)
+            sheet_cache.put("sheet", ("call", 3), b"x" * 1000)
+            self.assertTrue(sheet_cache.get("sheet", ("call", 1)) == b"x" * 1000)
+            with self.assertRaises(KeyError):
+                sheet_cache.get("sheet", ("call", 2))
+
     def test_check_interpret_table_correct_wb(self):
         """
         Test df_report has expected HGVSc and Germline classification
@@ -297,6 +662,30 @@ class TestParserScript(unittest.TestCase):
         error_msg = check_interpret_table(df_report, df_included)
         self.assertTrue(error_msg == ("Wrong strength in PM2"))
 
+    def test_check_interpret_table_several_rows(self):
+        """
+        Test every error of each row of df_report is reported, joined
+        by "; ", in row order
+        """
+        df_included = get_included_fields(excel_data_CUH)
+        df_report, msg = get_report_fields(excel_data_CUH, df_included)
+        df_report = pd.concat([df_report] * 4, ignore_index=True)
+        df_report.loc[0, "PM2"] = "Stand-Alone"
+        df_report.loc[0, "BA1"] = "wrong"
+        df_report.loc[1, "HGVSc"] = "c.1A>G"
+        df_report.loc[1, "PM2"] = "wrong"
+        df_report.loc[3, "Germline classification"] = np.nan
+        error_msg = check_interpret_table(df_report, df_included)
+        self.assertTrue(
+            error_msg
+            == (
+                "Wrong strength in PM2; Wrong strength in BA1"
+                "HGVSc in interpret table does not match with that in "
+                "included sheet; Wrong strength in PM2"
+                "empty ACMG classification in interpret table"
+            )
+        )
+
     def test_checking_sheet_wrong_summary(self):
         """
         Test if change done in columns of summary sheet is captured as error
@@ -467,6 +856,119 @@ class TestParserScript(unittest.TestCase):
         )
         self.assertTrue(msg == "Unusual probesetID")
 
+    def test_check_probeset_ID_edge_cases(self):
+        """
+        Test the probeset ID checks keep the meaning of the length,
+        isalnum and isalpha checks they replace
+        """
+        for probesetID, expected in [
+            ("abc1\n", "Unusual probesetID"),
+            (
+                "1" * 19 + "\n",
+                "probesetID is too long/short; Unusual probesetID",
+            ),
+            ("ab\u00b2", None),
+            ("a\nb1", "Unusual probesetID"),
+            ("1" * 19, None),
+            ("", "probesetID is too long/short; Unusual probesetID"),
+        ]:
+            msg = check_sample_name(
+                "124256019", "23201R0067", "23NGCEN32", "9527", probesetID
+            )
+            self.assertTrue(msg == expected, repr(probesetID))
+
+    def test_check_sample_name_all_errors(self):
+        """
+        Test "check_sample_name" reports every unusual part of the sample
+        name, not only the first one
+        """
+        msg = check_sample_name(
+            "124256019", "2320100067", "23NGCEN32", "9527A", "99347387"
+        )
+        self.assertTrue(msg == "Unusual sampleID; Unusual testcode")
+
+    def test_checking_sheets_all_errors(self):
+        """
+        Test "checking_sheets" reports a changed summary sheet and a
+        changed interpret sheet together
+        """
+        workbook = load_workbook(excel_data_CUH)
+        workbook["summary"]["G21"] = "Data"
+        workbook["interpret_1"]["L8"] = None
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            workbook.save(f"{tmp_dir}/wb.xlsx")
+            native = open_workbook(f"{tmp_dir}/wb.xlsx", "native")
+            msg = checking_sheets(f"{tmp_dir}/wb.xlsx", native)
+        self.assertTrue(
+            msg
+            == "extra col(s) added or change(s) done in summary sheet; "
+            "extra row(s) or col(s) added or change(s) done in interpret "
+            "sheet"
+        )
+
+    def test_validation_rules(self):
+        """
+        Test the validation rules of parser_config.json are used when no
+        config is given, match the test config and are compiled once
+        Test rules set in the config are used, and a config without
+        rules or with unknown rules fails when compiled
+        """
+        with open(CONFIG_FILE) as f:
+            parser_config = json.load(f)
+        self.assertTrue(
+            parser_config["validation_rules"]
+            == config_variable["validation_rules"]
+        )
+        self.assertTrue(load_rules(parser_config) is load_rules())
+        self.assertTrue(load_rules(config_variable) is load_rules())
+
+        sample_name = [
+            {
+                "part": "testcode",
+                "pattern": r"^\d{4}[A-Z]?$",
+                "message": "Unusual testcode",
+            }
+        ]
+        rules = load_rules(
+            dict(
+                config_variable,
+                validation_rules=dict(
+                    config_variable["validation_rules"],
+                    sample_name=sample_name,
+                ),
+            )
+        )
+        self.assertTrue(rules is not load_rules())
+        self.assertTrue(
+            check_sample_name(
+                "124256019", "23201R0067", "23NGCEN32", "9527A", "x", rules
+            )
+            is None
+        )
+        self.assertTrue(
+            check_interpreted_col(
+                pd.DataFrame(
+                    {
+                        "Interpreted": ["yes", "no", "maybe"],
+                        "Germline classification": [None, None, None],
+                    }
+                ),
+                rules,
+            )
+            == "Wrong interpreted column in row 1 of included sheet Wrong "
+            "interpreted column dropdown in row 3 of included sheet"
+        )
+        unknown_rule = dict(
+            config_variable["validation_rules"],
+            interpreted_column=[
+                {"columns": ["Interpreted"], "rule": "unknown", "message": ""}
+            ],
+        )
+        with self.assertRaises(ValueError):
+            load_rules({"validation_rules": unknown_rule})
+        with self.assertRaises(ValueError):
+            load_rules({"info": config_variable["info"]})
+
     @freeze_time("2024-07-10 22:22:22")
     def test_no_evaluated_date(self):
         '''
@@ -575,6 +1077,33 @@ class TestParserScript(unittest.TestCase):
             == ("Wrong interpreted column dropdown in row 1 of included sheet")
         )
 
+    def test_interpreted_col_several_rows(self):
+        """
+        Test each wrong row of the interpreted col is reported
+        with its row number, in row order
+        """
+        df = pd.DataFrame(
+            {
+                "Interpreted": ["yes", "no", "maybe", "no", "yes"],
+                "Germline classification": [
+                    np.nan,
+                    np.nan,
+                    np.nan,
+                    "Benign",
+                    "Pathogenic",
+                ],
+            }
+        )
+        msg = check_interpreted_col(df)
+        self.assertTrue(
+            msg
+            == (
+                "Wrong interpreted column in row 1 of included sheet "
+                "Wrong interpreted column dropdown in row 3 of included "
+                "sheet Wrong interpreted column in row 4 of included sheet"
+            )
+        )
+
     def test_get_command_line_args(self):
         """
         Test if parser args are correctly read in
@@ -634,6 +1163,97 @@ class TestParserScript(unittest.TestCase):
         self.assertEqual(contents.split("\t ")[1], "abc.xlsx")
         self.assertEqual(contents.split("\t ")[2], "testing_msg\n")
 
+    @patch("time.sleep")
+    def test_uploader_retries(self, patch_sleep):
+        """
+        Test "Uploader" retries failed uploads with exponential backoff
+        and reports the result of every upload in the order queued
+        """
+        attempts = {}
+
+        def upload_local_file(path, **kwargs):
+            attempts[path] = attempts.get(path, 0) + 1
+            if path == "flaky.csv" and attempts[path] < 3:
+                raise ConnectionError("connection reset")
+            if path == "broken.csv":
+                raise ConnectionError("connection refused")
+
+        uploader = Uploader(upload_local_file, workers=2, retries=3)
+        for path in ["ok.csv", "flaky.csv", "broken.csv"]:
+            uploader.submit(path, project="project-1", folder="/csvs/")
+        results = uploader.wait()
+        self.assertTrue(
+            [result.path for result in results]
+            == ["ok.csv", "flaky.csv", "broken.csv"]
+        )
+        self.assertTrue(
+            [result.uploaded for result in results] == [True, True, False]
+        )
+        self.assertTrue([result.attempts for result in results] == [1, 3, 4])
+        self.assertTrue(isinstance(results[2].error, ConnectionError))
+        self.assertTrue(
+            [result.span()["outcome"] for result in results]
+            == ["ok", "ok", "error"]
+        )
+        self.assertTrue(results[1].span()["attempts"] == 3)
+        self.assertTrue(
+            sorted(call.args[0] for call in patch_sleep.call_args_list)
+            == [1, 1, 2, 2, 4]
+        )
+
+    def test_parser_run_uploads(self):
+        """
+        Test "ParserRun" logs in to DNAnexus once, creates the csvs
+        folder once, uploads the clinvar csvs and the logs to the same
+        destinations as before and raises an error if an upload fails
+        """
+        dx_config = {"info": {"csv_projectID": "project-1"}}
+        arguments = get_command_line_args(
+            [
+                "--i",
+                "in/",
+                "--o",
+                "out/",
+                "--pf",
+                "parsed.txt",
+                "--cf",
+                "clinvar.txt",
+                "--tk",
+                "token",
+            ]
+        )
+        backend = FakeDXBackend("token")
+        run = ParserRun(arguments, dx_config, backend)
+        for filename in ["in/a.xlsx", "in/b.xlsx"]:
+            run.upload_clinvar_csv(filename)
+        with patch("os.path.isfile", return_value=True):
+            run.upload_logs()
+        self.assertTrue(backend.calls["system_whoami"] == 1)
+        self.assertTrue(backend.calls["DXProject"] == 1)
+        self.assertTrue(
+            backend.folders == [("project-1", "/csvs/" + run.folder_name)]
+        )
+        self.assertTrue(
+            [(path, kwargs["folder"]) for path, kwargs in backend.uploads]
+            == [
+                ("out/a_clinvar_variants.csv", "/csvs/" + run.folder_name),
+                ("out/b_clinvar_variants.csv", "/csvs/" + run.folder_name),
+                ("parsed.txt", "/parser_logs/"),
+                ("clinvar.txt", "/parser_logs/"),
+            ]
+        )
+        self.assertTrue(
+            all(
+                kwargs["project"] == "project-1"
+                for _, kwargs in backend.uploads
+            )
+        )
+
+        arguments.upload_retries = 0
+        run = ParserRun(arguments, dx_config, FakeDXBackend("other"))
+        with self.assertRaises(RuntimeError):
+            run.upload_logs()
+
     @patch("os.path.exists")
     @patch("os.makedirs")
     def test_check_and_create_folder(self, patch_makedirs, patch_exists):
@@ -657,6 +1277,815 @@ class TestParserScript(unittest.TestCase):
         with patch.object(sys, 'argv', testargs):
             self.assertRaises(RuntimeError, main)
 
+    def run_main_on_copy(self, tmp_dir: str, extra_args: list) -> dict:
+        """
+        Run main() with --no_dx_upload on a copy of the CUH test
+        workbooks and return the outputs with the Local IDs and the log
+        timestamps removed
+        """
+        indir = f"{tmp_dir}/CUH/"
+        outdir = f"{tmp_dir}/output/"
+        shutil.copytree(f"{TEST_DATA_DIR}/CUH", indir)
+        testargs = [
+            "variant_workbook_parser.py",
+            "--i",
+            indir,
+            "--o",
+            outdir,
+            "--pf",
+            f"{outdir}parsed.txt",
+            "--cf",
+            f"{outdir}clinvar.txt",
+            "--ff",
+            f"{outdir}failed.txt",
+            "--cd",
+            f"{outdir}completed_wb/",
+            "--fd",
+            f"{outdir}failed_wb/",
+            "--no_dx_upload",
+        ] + extra_args
+        with patch.object(sys, "argv", testargs):
+            main()
+        outputs = {}
+        for csv in sorted(glob.glob(f"{outdir}*.csv")):
+            outputs[os.path.basename(csv)] = pd.read_csv(csv).drop(
+                columns=["Local ID", "Linking ID"]
+            )
+        for log in ["parsed.txt", "clinvar.txt", "failed.txt"]:
+            with open(f"{outdir}{log}") as f:
+                outputs[log] = [
+                    line.split("\t ", 1)[1].replace(tmp_dir, "")
+                    for line in f
+                ]
+        for folder in ["completed_wb", "failed_wb"]:
+            outputs[folder] = sorted(os.listdir(f"{outdir}{folder}"))
+
+        return outputs
+
+    def test_main_workers_same_as_serial(self):
+        """
+        Test parsing the workbooks in a process pool gives the same
+        csvs, logs and moved workbooks as parsing them serially
+        """
+        with tempfile.TemporaryDirectory() as serial_dir:
+            serial = self.run_main_on_copy(serial_dir, ["--reader", "native"])
+        with tempfile.TemporaryDirectory() as pool_dir:
+            pool = self.run_main_on_copy(
+                pool_dir, ["--reader", "native", "--workers", "3"]
+            )
+        self.assertTrue(serial.keys() == pool.keys())
+        for output, value in serial.items():
+            if isinstance(value, pd.DataFrame):
+                self.assertTrue(value.equals(pool[output]))
+            else:
+                self.assertTrue(value == pool[output])
+        self.assertTrue(len(serial["failed_wb"]) == 5)
+        self.assertTrue(serial["completed_wb"] == ["cen_snv_test2.xlsx"])
+
+    def test_main_pipeline_same_as_serial(self):
+        """
+        Test --pipeline gives the same csvs, logs and moved workbooks as
+        parsing the workbooks one after another, in a thread and in a
+        process pool
+        """
+        with tempfile.TemporaryDirectory() as serial_dir:
+            serial = self.run_main_on_copy(serial_dir, ["--reader", "native"])
+        for extra_args in [
+            ["--pipeline", "--prefetch", "1"],
+            ["--pipeline", "--workers", "2"],
+        ]:
+            with tempfile.TemporaryDirectory() as pipeline_dir:
+                pipelined = self.run_main_on_copy(
+                    pipeline_dir, ["--reader", "native"] + extra_args
+                )
+            self.assertTrue(serial.keys() == pipelined.keys())
+            for output, value in serial.items():
+                if isinstance(value, pd.DataFrame):
+                    self.assertTrue(value.equals(pipelined[output]))
+                else:
+                    self.assertTrue(value == pipelined[output])
+
+    def test_main_staging_same_as_serial(self):
+        """
+        Test --staging_dir gives the same csvs, logs and moved workbooks
+        as writing them straight to the output dirs, and removes the
+        staged files at the end of the run
+        """
+        with tempfile.TemporaryDirectory() as serial_dir:
+            serial = self.run_main_on_copy(serial_dir, ["--reader", "native"])
+        for extra_args in [[], ["--pipeline"]]:
+            with tempfile.TemporaryDirectory() as staging_dir:
+                staged = self.run_main_on_copy(
+                    staging_dir,
+                    [
+                        "--reader",
+                        "native",
+                        "--staging_dir",
+                        f"{staging_dir}/staging",
+                        "--commit_batch",
+                        "2",
+                    ]
+                    + extra_args,
+                )
+                self.assertTrue(
+                    os.listdir(f"{staging_dir}/staging") == []
+                )
+            self.assertTrue(serial.keys() == staged.keys())
+            for output, value in serial.items():
+                if isinstance(value, pd.DataFrame):
+                    self.assertTrue(value.equals(staged[output]))
+                else:
+                    self.assertTrue(value == staged[output])
+
+    def test_staging_replay_interrupted_commit(self):
+        """
+        Test a commit interrupted after writing the outputs and log lines
+        is finished by "replay_journal" without writing the log lines
+        twice, including a log line only partly written
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for folder in ["CUH", "output", "completed_wb"]:
+                os.makedirs(f"{tmp_dir}/{folder}")
+            filename = f"{tmp_dir}/CUH/wb.xlsx"
+            shutil.copy(excel_data_CUH, filename)
+            log_file = f"{tmp_dir}/output/parsed.txt"
+            with open(log_file, "w") as f:
+                f.write("earlier line\n")
+            staging = StagingArea(f"{tmp_dir}/staging", 10)
+            with open(staging.output(f"{tmp_dir}/output/wb.csv"), "w") as f:
+                f.write("a,b\n")
+            staging.append_log(log_file, "wb.xlsx\n")
+            staging.append_log(log_file, "wb2.xlsx\n")
+            staging.move(filename, f"{tmp_dir}/completed_wb")
+            with patch("staging.shutil.move", side_effect=KeyboardInterrupt):
+                self.assertRaises(KeyboardInterrupt, staging.commit)
+            self.assertTrue(os.path.isfile(filename))
+            self.assertTrue(os.path.isfile(f"{tmp_dir}/output/wb.csv"))
+            # cut the last log line short
+            with open(log_file, "r+b") as f:
+                f.truncate(os.path.getsize(log_file) - 3)
+
+            self.assertTrue(replay_journal(f"{tmp_dir}/staging") == 1)
+            with open(log_file) as f:
+                self.assertTrue(
+                    f.read() == "earlier line\nwb.xlsx\nwb2.xlsx\n"
+                )
+            self.assertTrue(not os.path.exists(filename))
+            self.assertTrue(
+                os.listdir(f"{tmp_dir}/completed_wb") == ["wb.xlsx"]
+            )
+            self.assertTrue(replay_journal(f"{tmp_dir}/staging") == 0)
+
+    def test_staging_failed_uploads(self):
+        """
+        Test a commit makes every staged upload even if one fails, raises
+        an error listing the failed ones and keeps the uploads in the
+        journal until they are done, so the next run makes them again
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.makedirs(f"{tmp_dir}/output")
+            uploads = []
+
+            def upload(path):
+                uploads.append(path)
+                if path.endswith("a.csv"):
+                    raise OSError("upload failed")
+
+            staging = StagingArea(f"{tmp_dir}/staging", 10, upload)
+            for name in ["a.csv", "b.csv"]:
+                path = f"{tmp_dir}/output/{name}"
+                with open(staging.output(path), "w") as f:
+                    f.write("a,b\n")
+                staging.upload_after_commit(path)
+            with self.assertRaisesRegex(RuntimeError, "a.csv") as error:
+                staging.commit()
+            self.assertTrue("b.csv" not in str(error.exception))
+            self.assertTrue(
+                uploads
+                == [
+                    staging.local_path(f"{tmp_dir}/output/{name}")
+                    for name in ["a.csv", "b.csv"]
+                ]
+            )
+            self.assertTrue(os.path.isfile(f"{tmp_dir}/output/a.csv"))
+            staging.uploaded(uploads[1:])
+            staging.close()
+
+            uploads.clear()
+            staging = StagingArea(f"{tmp_dir}/staging", 10, uploads.append)
+            self.assertTrue(uploads == [f"{tmp_dir}/output/a.csv"])
+            staging.uploaded(uploads)
+            self.assertTrue(
+                sorted(os.listdir(f"{tmp_dir}/staging"))
+                == ["inputs", "outputs"]
+            )
+
+    def test_staged_pipeline(self):
+        """
+        Test "StagedPipeline" records the items in input order while
+        fetching at most prefetch items ahead, and raises the error of a
+        failed item after recording the items before it
+        """
+        fetched = []
+        recorded = []
+        ahead = []
+
+        def fetch(item):
+            fetched.append(item)
+            ahead.append(len(fetched) - len(recorded))
+            if item == "fetch_error":
+                raise OSError(item)
+            return item
+
+        def parse(item):
+            # later items finish first
+            time.sleep(0.02 * (5 - len(item) % 5))
+            if item == "parse_error":
+                raise ValueError(item)
+            return item.upper()
+
+        def record(item, result):
+            self.assertTrue(result == item.upper())
+            recorded.append(item)
+
+        items = [f"wb{idx}" for idx in range(12)]
+        with ThreadPoolExecutor(max_workers=3) as executor:
+
+            def submit(item, payload):
+                return executor.submit(parse, payload)
+
+            StagedPipeline(fetch, submit, record, 2, 3).run(items)
+            self.assertTrue(recorded == items)
+            # 2 fetched items queued, 1 waiting for a submit slot, 3
+            # submitted, 1 being recorded and 1 being fetched
+            self.assertTrue(max(ahead) <= 8)
+            for error, error_type in [
+                ("fetch_error", OSError),
+                ("parse_error", ValueError),
+            ]:
+                recorded.clear()
+                with self.assertRaises(error_type):
+                    StagedPipeline(fetch, submit, record, 2, 3).run(
+                        items[:4] + [error] + items[4:]
+                    )
+                self.assertTrue(recorded == items[:4])
+
+    def test_main_aggregate(self):
+        """
+        Test --aggregate writes the rows of every parsed workbook into
+        one all variants csv and one clinvar csv, with the source
+        workbook of each row
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            outputs = self.run_main_on_copy(tmp_dir, ["--aggregate"])
+        for output in ["all_variants", "clinvar_variants"]:
+            aggregate = [
+                name
+                for name in outputs
+                if re.match(rf"^run_\d{{8}}_\d{{6}}_{output}.csv$", name)
+            ]
+            self.assertTrue(len(aggregate) == 1)
+            df = outputs[aggregate[0]]
+            self.assertTrue(
+                list(df["Source workbook"])
+                == ["cen_snv_test2.xlsx"] * df.shape[0]
+            )
+            self.assertTrue(
+                df.drop(columns=["Source workbook"]).equals(
+                    outputs[f"cen_snv_test2_{output}.csv"]
+                )
+            )
+
+    def test_main_trace(self):
+        """
+        Test --trace writes a span per stage of each workbook, including
+        the ones parsed in worker processes, with the row counts and
+        the outcome of the stage
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trace_file = f"{tmp_dir}/trace.jsonl"
+            self.run_main_on_copy(
+                tmp_dir,
+                ["--reader", "native", "--workers", "2", "--trace", trace_file],
+            )
+            with open(trace_file) as f:
+                spans = [json.loads(line) for line in f]
+        stages = {}
+        for span in spans:
+            self.assertTrue(span["duration"] >= 0)
+            stages.setdefault(os.path.basename(span["workbook"]), []).append(
+                span
+            )
+        self.assertTrue(len(stages) == 6)
+        passed = stages["cen_snv_test2.xlsx"]
+        self.assertTrue(
+            [span["stage"] for span in passed]
+            == [
+                "open_workbook",
+                "checking_sheets",
+                "get_summary_fields",
+                "get_included_fields",
+                "get_report_fields",
+                "merge_workbook_fields",
+                "write_outputs",
+                "write_logs",
+                "move_workbook",
+            ]
+        )
+        self.assertTrue(all(span["outcome"] == "ok" for span in passed))
+        self.assertTrue(passed[5]["rows"] == 2)
+        self.assertTrue(passed[5]["clinvar_rows"] == 1)
+        failed = stages["cen_snv_test2_wrong_HGVSc.xlsx"]
+        self.assertTrue(failed[4]["stage"] == "get_report_fields")
+        self.assertTrue(failed[4]["outcome"] == "failed")
+        self.assertTrue(
+            failed[4]["error"]
+            == "HGVSc in interpret table does not match with that in "
+            "included sheet"
+        )
+        self.assertTrue(
+            [span["stage"] for span in failed[5:]]
+            == ["write_logs", "move_workbook"]
+        )
+
+    def test_main_result_cache(self):
+        """
+        Test --result_cache logs a renamed copy of a parsed workbook as
+        parsed without writing its outputs again, skips the same content
+        under the same name and parses a changed workbook again from the
+        bytes read for its key
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            indir = f"{tmp_dir}/CUH/"
+            outdir = f"{tmp_dir}/output/"
+            os.makedirs(indir)
+            testargs = [
+                "variant_workbook_parser.py",
+                "--i",
+                indir,
+                "--o",
+                outdir,
+                "--pf",
+                f"{outdir}parsed.txt",
+                "--cf",
+                f"{outdir}clinvar.txt",
+                "--ff",
+                f"{outdir}failed.txt",
+                "--cd",
+                f"{outdir}completed_wb/",
+                "--fd",
+                f"{outdir}failed_wb/",
+                "--no_dx_upload",
+                "--result_cache",
+                f"{tmp_dir}/cache",
+            ]
+            shutil.copy(excel_data_CUH, f"{indir}wb.xlsx")
+            with patch.object(sys, "argv", testargs):
+                main()
+            self.assertTrue(os.path.isfile(f"{outdir}wb_all_variants.csv"))
+            self.assertTrue(len(os.listdir(f"{tmp_dir}/cache")) == 1)
+
+            shutil.copy(excel_data_CUH, f"{indir}wb.xlsx")
+            shutil.copy(excel_data_CUH, f"{indir}copy.xlsx")
+            with patch("variant_workbook_parser.parse_workbook") as parse:
+                with patch.object(sys, "argv", testargs):
+                    main()
+            parse.assert_not_called()
+            self.assertTrue(os.path.isfile(f"{indir}wb.xlsx"))
+            self.assertTrue(os.path.isfile(f"{outdir}completed_wb/copy.xlsx"))
+            self.assertFalse(os.path.isfile(f"{outdir}copy_all_variants.csv"))
+            self.assertFalse(
+                os.path.isfile(f"{outdir}copy_clinvar_variants.csv")
+            )
+            with open(f"{outdir}parsed.txt") as f:
+                self.assertTrue("copy.xlsx" in f.read())
+            with open(f"{outdir}clinvar.txt") as f:
+                self.assertTrue("copy.xlsx" not in f.read())
+
+            shutil.copy(excel_data_wrong_ACMG, f"{indir}wb.xlsx")
+            with open(excel_data_wrong_ACMG, "rb") as f:
+                data = f.read()
+            with patch(
+                "variant_workbook_parser.parse_workbook",
+                wraps=parse_workbook,
+            ) as parse:
+                with patch.object(sys, "argv", testargs):
+                    main()
+            self.assertTrue(parse.call_args.args[6] == data)
+            with open(f"{outdir}failed.txt") as f:
+                failed = f.read()
+            self.assertTrue("wb.xlsx" in failed)
+            self.assertTrue(
+                "wrong ACMG classification in interpret table" in failed
+            )
+            self.assertTrue(len(os.listdir(f"{tmp_dir}/cache")) == 2)
+
+    def test_main_result_cache_staging(self):
+        """
+        Test --result_cache with --staging_dir caches a result only once
+        the outputs of its workbook are committed
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            indir = f"{tmp_dir}/CUH/"
+            outdir = f"{tmp_dir}/output/"
+            os.makedirs(indir)
+            testargs = [
+                "variant_workbook_parser.py",
+                "--i",
+                indir,
+                "--o",
+                outdir,
+                "--pf",
+                f"{outdir}parsed.txt",
+                "--cf",
+                f"{outdir}clinvar.txt",
+                "--ff",
+                f"{outdir}failed.txt",
+                "--cd",
+                f"{outdir}completed_wb/",
+                "--fd",
+                f"{outdir}failed_wb/",
+                "--no_dx_upload",
+                "--result_cache",
+                f"{tmp_dir}/cache",
+                "--staging_dir",
+                f"{tmp_dir}/staging",
+            ]
+            shutil.copy(excel_data_CUH, f"{indir}wb.xlsx")
+            with patch.object(
+                StagingArea, "commit", side_effect=OSError("share is down")
+            ):
+                with patch.object(sys, "argv", testargs):
+                    with self.assertRaises(OSError):
+                        main()
+            self.assertTrue(os.listdir(f"{tmp_dir}/cache") == [])
+
+            with patch.object(sys, "argv", testargs):
+                main()
+            self.assertTrue(os.path.isfile(f"{outdir}wb_all_variants.csv"))
+            self.assertTrue(len(os.listdir(f"{tmp_dir}/cache")) == 1)
+
+    def test_result_cache_key(self):
+        """
+        Test "ResultCache" keys the same content differently in the CUH
+        and NUH folders and for each reader
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for folder in ["CUH", "NUH"]:
+                os.makedirs(f"{tmp_dir}/{folder}")
+                shutil.copy(excel_data_CUH, f"{tmp_dir}/{folder}/wb.xlsx")
+            native = ResultCache(f"{tmp_dir}/cache", config_variable, False)
+            read_only = ResultCache(
+                f"{tmp_dir}/cache", config_variable, False, "readonly"
+            )
+            keys = [
+                cache.key(f"{tmp_dir}/{folder}/wb.xlsx")
+                for cache in [native, read_only]
+                for folder in ["CUH", "NUH"]
+            ]
+            self.assertTrue(len(set(keys)) == 4)
+            self.assertTrue(
+                native.key(f"{tmp_dir}/CUH/wb.xlsx") == keys[0]
+            )
+
+    def test_validate_workbook(self):
+        """
+        Test "validate_workbook" fails the test workbooks with the same
+        error message as "parse_workbook" with each reader and passes the
+        others
+        Test a workbook outside the CUH and NUH folders fails as in a
+        full run
+        """
+        workbooks = sorted(glob.glob(f"{TEST_DATA_DIR}/*/*.xlsx"))
+        for filename in workbooks:
+            for unusual_sample_name in [False, True]:
+                _, _, error_msg, _ = parse_workbook(
+                    filename, config_variable, unusual_sample_name, "native"
+                )
+                self.assertTrue(
+                    validate_workbook(
+                        filename, config_variable, unusual_sample_name
+                    )
+                    == error_msg,
+                    filename,
+                )
+        for reader in ["openpyxl", "readonly"]:
+            self.assertTrue(
+                validate_workbook(
+                    excel_data_wrong_ACMG, config_variable, False, reader
+                )
+                == "wrong ACMG classification in interpret table"
+            )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shutil.copy(excel_data_CUH, f"{tmp_dir}/wb.xlsx")
+            self.assertTrue(
+                validate_workbooks(
+                    [excel_data_CUH, f"{tmp_dir}/wb.xlsx"],
+                    config_variable,
+                    False,
+                )
+                == [f"{tmp_dir}/wb.xlsx"]
+            )
+
+    def test_main_validate_only(self):
+        """
+        Test --validate_only reports each workbook without writing any
+        output or moving the workbooks, and exits with an error if any
+        workbook fails
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            indir = f"{tmp_dir}/CUH/"
+            outdir = f"{tmp_dir}/output/"
+            shutil.copytree(f"{TEST_DATA_DIR}/CUH", indir)
+            testargs = [
+                "variant_workbook_parser.py",
+                "--i",
+                indir,
+                "--o",
+                outdir,
+                "--validate_only",
+            ]
+            with patch.object(sys, "argv", testargs):
+                with self.assertRaises(SystemExit) as exit:
+                    main()
+            self.assertTrue(exit.exception.code == 1)
+            self.assertTrue(not os.path.exists(outdir))
+            self.assertTrue(
+                sorted(os.listdir(indir))
+                == sorted(os.listdir(f"{TEST_DATA_DIR}/CUH"))
+            )
+            with patch.object(
+                sys, "argv", testargs + ["--f", "cen_snv_test2.xlsx"]
+            ):
+                main()
+            self.assertTrue(os.path.isfile(f"{indir}cen_snv_test2.xlsx"))
+
+    def test_main_validate_only_reader(self):
+        """
+        Test --validate_only reads the workbooks with the native reader
+        unless --reader is given, while a full run defaults to openpyxl
+        """
+        testargs = [
+            "variant_workbook_parser.py",
+            "--i",
+            f"{TEST_DATA_DIR}/CUH/",
+            "--f",
+            "cen_snv_test2.xlsx",
+            "--validate_only",
+        ]
+        for extra_args, reader in [
+            ([], "native"),
+            (["--reader", "openpyxl"], "openpyxl"),
+        ]:
+            with patch(
+                "variant_workbook_parser.open_workbook", wraps=open_workbook
+            ) as opened:
+                with patch.object(sys, "argv", testargs + extra_args):
+                    main()
+            self.assertTrue(opened.call_args.args[1] == reader)
+        arguments = get_command_line_args(["--i", "input/"])
+        self.assertTrue(arguments.reader == "openpyxl")
+
+    def test_parse_workbook_not_traced(self):
+        """
+        Test "parse_workbook_spans" returns no spans when tracing is off
+        """
+        result, spans = parse_workbook_spans(
+            excel_data_CUH, config_variable, False, "native"
+        )
+        self.assertTrue(spans is None)
+        self.assertTrue(result[2] is None)
+
+    def test_aggregate_csv_writer(self):
+        """
+        Test "AggregateCsvWriter" writes the header once and appends the
+        rows of each workbook in the columns of the first one
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            writer = AggregateCsvWriter(f"{tmp_dir}/run.csv")
+            writer.write("a.xlsx", pd.DataFrame({"x": [1, 2], "y": [3, 4]}))
+            writer.write("b.xlsx", pd.DataFrame({"y": [5], "x": [6]}))
+            writer.close()
+            df = pd.read_csv(f"{tmp_dir}/run.csv")
+        self.assertTrue(writer.rows == 3)
+        self.assertTrue(list(df.columns) == ["x", "y", "Source workbook"])
+        self.assertTrue(list(df["x"]) == [1, 2, 6])
+        self.assertTrue(
+            list(df["Source workbook"]) == ["a.xlsx", "a.xlsx", "b.xlsx"]
+        )
+
+    @unittest.skipUnless(
+        importlib.util.find_spec("pyarrow"), "pyarrow not installed"
+    )
+    def test_write_parquet(self):
+        """
+        Test "write_parquet" writes the all variants of each workbook with
+        explicit types into organisation and month partitions, adding
+        files without rewriting those of other workbooks
+        """
+        import pyarrow.dataset as ds
+
+        with tempfile.TemporaryDirectory() as dataset_dir:
+            for filename in [excel_data_CUH, excel_data_NUH]:
+                df_final, df_clinvar, error_msg, warning_msg = parse_workbook(
+                    filename, config_variable, False
+                )
+                write_parquet(df_final, dataset_dir, filename)
+            CUH_file = (
+                f"{dataset_dir}/organisation_id=288359/"
+                "evaluation_month=2023-11/cen_snv_test2-0.parquet"
+            )
+            mtime = os.path.getmtime(CUH_file)
+            write_parquet(df_final, dataset_dir, excel_data_NUH)
+            self.assertTrue(os.path.getmtime(CUH_file) == mtime)
+            dataset = ds.dataset(
+                dataset_dir, format="parquet", partitioning="hive"
+            )
+            self.assertTrue(len(dataset.files) == 2)
+            table = dataset.to_table(
+                columns=["Gene symbol", "Start", "Date last evaluated"],
+                filter=ds.field("organisation_id") == 288359,
+            )
+        self.assertTrue(table.num_rows == 2)
+        self.assertTrue(str(table.schema.field("Start").type) == "int64")
+        self.assertTrue(
+            str(table.schema.field("Date last evaluated").type)
+            == "date32[day]"
+        )
+        self.assertTrue(
+            sorted(table.column("Gene symbol").to_pylist())
+            == ["TSC1", "TSC2"]
+        )
+
+    @unittest.skipUnless(
+        importlib.util.find_spec("pyarrow"), "pyarrow not installed"
+    )
+    def test_write_parquet_parsed_again(self):
+        """
+        Test "write_parquet" removes the files of a workbook parsed again
+        with a changed date last evaluated, so its rows are only in the
+        partition of the new month
+        """
+        import pyarrow.dataset as ds
+
+        df_final, _, _, _ = parse_workbook(
+            excel_data_CUH, config_variable, False
+        )
+        with tempfile.TemporaryDirectory() as dataset_dir:
+            write_parquet(df_final, dataset_dir, excel_data_CUH)
+            # a workbook whose name starts with the same stem
+            write_parquet(df_final, dataset_dir, "cen_snv_test2-1.xlsx")
+            df_final["Date last evaluated"] = pd.Timestamp("2024-01-15")
+            write_parquet(df_final, dataset_dir, excel_data_CUH)
+            dataset = ds.dataset(
+                dataset_dir, format="parquet", partitioning="hive"
+            )
+            files = sorted(
+                os.path.relpath(path, dataset_dir) for path in dataset.files
+            )
+            table = dataset.to_table(
+                columns=["evaluation_month"],
+                filter=ds.field("organisation_id") == 288359,
+            )
+        self.assertTrue(
+            files
+            == [
+                "organisation_id=288359/evaluation_month=2023-11/"
+                "cen_snv_test2-1-0.parquet",
+                "organisation_id=288359/evaluation_month=2024-01/"
+                "cen_snv_test2-0.parquet",
+            ]
+        )
+        self.assertTrue(
+            sorted(table.column("evaluation_month").to_pylist())
+            == ["2023-11", "2023-11", "2024-01", "2024-01"]
+        )
+
+    def test_watch_folder(self):
+        """
+        Test "watch_folder" parses a workbook once its size is stable,
+        skips Excel lock files and parses the queued workbooks before
+        stopping
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            indir = f"{tmp_dir}/CUH/"
+            outdir = f"{tmp_dir}/output/"
+            os.makedirs(indir)
+            arguments = get_command_line_args(
+                [
+                    "--i",
+                    indir,
+                    "--o",
+                    outdir,
+                    "--pf",
+                    f"{outdir}parsed.txt",
+                    "--cf",
+                    f"{outdir}clinvar.txt",
+                    "--ff",
+                    f"{outdir}failed.txt",
+                    "--cd",
+                    f"{outdir}completed_wb/",
+                    "--fd",
+                    f"{outdir}failed_wb/",
+                    "--no_dx_upload",
+                    "--watch",
+                    "--poll_interval",
+                    "0.05",
+                    "--watch_status",
+                    f"{tmp_dir}/status.json",
+                ]
+            )
+            for folder in ["completed_wb", "failed_wb"]:
+                os.makedirs(f"{outdir}{folder}")
+            run = ParserRun(arguments, config_variable)
+            stop = threading.Event()
+            watcher = ThreadPoolExecutor(max_workers=1).submit(
+                watch_folder, arguments, config_variable, run, set(), stop
+            )
+            open(f"{indir}~$cen_snv_test2.xlsx", "w").close()
+            shutil.copy(excel_data_CUH, indir)
+            shutil.copy(excel_data_wrong_HGVSc, indir)
+            for _ in range(600):
+                time.sleep(0.05)
+                if not os.path.isfile(f"{tmp_dir}/status.json"):
+                    continue
+                with open(f"{tmp_dir}/status.json") as f:
+                    status = json.load(f)
+                if status["parsed"] + status["failed"] == 2:
+                    break
+            stop.set()
+            stats = watcher.result(timeout=60)
+            self.assertTrue(stats.parsed == 1)
+            self.assertTrue(stats.failed == 1)
+            self.assertTrue(stats.to_dict()["workbooks_per_minute"] > 0)
+            self.assertTrue(
+                os.listdir(arguments.completed_dir) == ["cen_snv_test2.xlsx"]
+            )
+            self.assertTrue(os.listdir(indir) == ["~$cen_snv_test2.xlsx"])
+
+    def run_startup(self, args: list, cwd: str) -> tuple:
+        """
+        Run main() in a new interpreter and return the wall time and
+        the heavy modules it imported
+        """
+        code = (
+            "import json, sys\n"
+            "import variant_workbook_parser\n"
+            "sys.argv = ['variant_workbook_parser.py'] + sys.argv[1:]\n"
+            "try:\n"
+            "    variant_workbook_parser.main()\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "heavy = ['dateutil', 'dxpy', 'numpy', 'openpyxl', 'pandas']\n"
+            "print(json.dumps([m for m in heavy if m in sys.modules]))\n"
+        )
+        env = dict(
+            os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(__file__))
+        )
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", code] + args,
+            cwd=cwd,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        seconds = time.perf_counter() - start
+
+        return seconds, json.loads(output.splitlines()[-1])
+
+    def test_startup_time(self):
+        """
+        Test --help and a run with no workbook to parse do not import
+        pandas, numpy, openpyxl, dateutil or dxpy and stay under the
+        startup budget
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.makedirs(f"{tmp_dir}/CUH")
+            outdir = f"{tmp_dir}/output/"
+            noop_args = [
+                "--i",
+                f"{tmp_dir}/CUH/",
+                "--o",
+                outdir,
+                "--pf",
+                f"{outdir}parsed.txt",
+                "--cf",
+                f"{outdir}clinvar.txt",
+                "--ff",
+                f"{outdir}failed.txt",
+                "--cd",
+                f"{outdir}completed_wb/",
+                "--fd",
+                f"{outdir}failed_wb/",
+                "--no_dx_upload",
+            ]
+            for args in [["--help"], noop_args]:
+                seconds, heavy = self.run_startup(args, tmp_dir)
+                self.assertTrue(heavy == [])
+                self.assertTrue(seconds < STARTUP_BUDGET)
+
 
 if __name__ == "__main__":
     unittest.main()
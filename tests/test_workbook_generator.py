@@ -0,0 +1,135 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(1, "../")
+from variant_workbook_parser import parse_workbook, validate_workbook
+from tests import TEST_DATA_DIR
+from workbook_generator import (
+    ERRORS,
+    generate_workbook,
+    generate_workbooks,
+)
+
+with open(f"{TEST_DATA_DIR}/test_parser_config.json") as f:
+    config_variable = json.load(f)
+
+# error message of the parser for each error of the generator
+ERROR_MESSAGES = {
+    "summary_layout": "extra col(s) added or change(s) done in summary sheet",
+    "interpret_layout": "extra row(s) or col(s) added or change(s) done in "
+    "interpret sheet",
+    "sample_name": "Unusual batchID",
+    "evaluated_date": "Value for date last evaluated \"not a date\" is not "
+    "compatible with datetime conversion",
+    "empty_interpreted": "Interpreted column in included sheet needs to be "
+    "fixed",
+    "empty_classification": "empty ACMG classification in interpret table",
+    "wrong_classification": "wrong ACMG classification in interpret table",
+    "empty_hgvsc": "empty HGVSc in interpret table",
+    "wrong_hgvsc": "HGVSc in interpret table does not match with that in "
+    "included sheet",
+    "wrong_strength": "Wrong strength in ",
+    "wrong_interpreted": "Wrong interpreted column in row ",
+    "wrong_interpreted_dropdown": "Wrong interpreted column dropdown in row ",
+}
+
+
+class TestWorkbookGenerator(unittest.TestCase):
+    def test_generate_workbook(self):
+        """
+        Test "generate_workbook" writes a workbook with the requested
+        numbers of variants and interpret sheets, which every reader
+        parses the same way
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.makedirs(f"{tmp_dir}/CUH")
+            filename = f"{tmp_dir}/CUH/large.xlsx"
+            generate_workbook(filename, 50, 3, seed=1)
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = [
+                    parse_workbook(filename, config_variable, False, reader)
+                    for reader in ["openpyxl", "readonly", "native"]
+                ]
+        for df_final, df_clinvar, error_msg, warning_msg in results:
+            self.assertTrue(error_msg is None)
+            self.assertTrue(df_final.shape == (50, 84))
+            self.assertTrue(df_clinvar.shape == (3, 21))
+            self.assertTrue(
+                df_final.drop(columns=["Local ID", "Linking ID"]).equals(
+                    results[0][0].drop(columns=["Local ID", "Linking ID"])
+                )
+            )
+
+    def test_generate_workbook_errors(self):
+        """
+        Test each error of "generate_workbook" fails the parser with the
+        error message of the check it targets, and fails
+        "validate_workbook" with the same message
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.makedirs(f"{tmp_dir}/NUH")
+            for error in ERRORS:
+                filename = f"{tmp_dir}/NUH/{error}.xlsx"
+                generate_workbook(filename, 10, 2, error, seed=2)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    _, _, error_msg, _ = parse_workbook(
+                        filename, config_variable, False, "native"
+                    )
+                    validate_msg = validate_workbook(
+                        filename, config_variable, False
+                    )
+                self.assertTrue(
+                    error_msg.startswith(ERROR_MESSAGES[error]), error
+                )
+                self.assertTrue(validate_msg == error_msg, error)
+
+    def test_generate_workbooks(self):
+        """
+        Test "generate_workbooks" is reproducible with a seed, names the
+        workbooks after their error and puts no interpret sheet error
+        in workbooks without interpreted variants
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            generated = generate_workbooks(
+                f"{tmp_dir}/CUH", 20, 5, 0, error_rate=0.5, seed=3
+            )
+            again = generate_workbooks(
+                f"{tmp_dir}/NUH", 20, 5, 0, error_rate=0.5, seed=3
+            )
+            files = sorted(os.listdir(f"{tmp_dir}/CUH"))
+        self.assertTrue(len(files) == 20)
+        self.assertTrue(
+            [error for _, error in generated]
+            == [error for _, error in again]
+        )
+        errors = [error for _, error in generated if error is not None]
+        self.assertTrue(0 < len(errors) < 20)
+        self.assertTrue("empty_classification" not in errors)
+        for filename, error in generated:
+            self.assertTrue(
+                os.path.basename(filename).startswith("synthetic_")
+            )
+            if error is not None:
+                self.assertTrue(filename.endswith(f"_{error}.xlsx"))
+
+    def test_generate_workbook_invalid(self):
+        """
+        Test "generate_workbook" refuses errors it cannot put in the
+        workbook
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with self.assertRaises(ValueError):
+                generate_workbook(f"{tmp_dir}/a.xlsx", 2, 3)
+            with self.assertRaises(ValueError):
+                generate_workbook(f"{tmp_dir}/a.xlsx", 2, 0, "wrong_hgvsc")
+            with self.assertRaises(ValueError):
+                generate_workbook(f"{tmp_dir}/a.xlsx", 2, 1, "unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+from datetime import datetime
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan:
+    """
+    Span of a disabled trace, ignoring everything set on it
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+    def __setitem__(self, key: str, value) -> None:
+        pass
+
+    def set_error(self, error_msg: str) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span(dict):
+    """
+    Timed span of a stage, recorded when the with block exits. The row
+    counts and outcome of the stage can be set on it as items
+    """
+
+    def __init__(self, spans: list, workbook: str, stage: str) -> None:
+        super().__init__(workbook=workbook, stage=stage, pid=os.getpid())
+        self.spans = spans
+
+    def set_error(self, error_msg: str) -> None:
+        """
+        mark the stage as failed if it returned an error message
+
+        Parameters
+        ----------
+          str for error message, None if the stage passed
+        """
+        if error_msg:
+            self["outcome"] = "failed"
+            self["error"] = error_msg
+
+    def __enter__(self):
+        self["start"] = datetime.now().isoformat(timespec="microseconds")
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self["duration"] = time.perf_counter() - self._start
+        if exc_type is not None:
+            self["outcome"] = "error"
+            self["error"] = f"{exc_type.__name__}: {exc}"
+        else:
+            self.setdefault("outcome", "ok")
+        self.spans.append(dict(self))
+        return False
+
+
+class WorkbookTrace:
+    """
+    Spans of the stages of one workbook. The spans are kept in a plain
+    list so they can be returned from a worker process with the result
+    of the workbook. Without a list, tracing is disabled and every span
+    is the same object that does nothing
+
+    Parameters
+    ----------
+      str for variant workbook file name
+      list to append the spans to, None to disable tracing
+    """
+
+    def __init__(self, workbook: str, spans: list = None) -> None:
+        self.workbook = workbook
+        self.spans = spans
+
+    def span(self, stage: str):
+        """
+        span timing a stage, to use as a context manager
+
+        Parameters
+        ----------
+          str for stage name
+
+        Return
+        ------
+          span to set the row counts and outcome on
+        """
+        if self.spans is None:
+            return NULL_SPAN
+        return _Span(self.spans, self.workbook, stage)
+
+
+class Tracer:
+    """
+    Writer of the trace spans of a run to a JSON lines file, one span
+    per line. Without a file name, tracing is disabled
+
+    Parameters
+    ----------
+      str for JSON lines trace file (optional)
+    """
+
+    def __init__(self, trace_file: str = None) -> None:
+        self.trace_file = trace_file
+        self.file = None
+        self._lock = threading.Lock()
+        if trace_file:
+            self.file = open(trace_file, "a")
+
+    @property
+    def enabled(self) -> bool:
+        return self.file is not None
+
+    def workbook(self, workbook: str) -> WorkbookTrace:
+        """
+        trace of a workbook, disabled if this tracer is. Its spans are
+        written by passing them to write()
+
+        Parameters
+        ----------
+          str for variant workbook file name
+
+        Return
+        ------
+          WorkbookTrace
+        """
+        return WorkbookTrace(workbook, [] if self.enabled else None)
+
+    def write(self, spans: list) -> None:
+        """
+        write spans, such as the ones returned by a worker process
+
+        Parameters
+        ----------
+          list of dict spans
+        """
+        if not self.enabled or not spans:
+            return
+        with self._lock:
+            for span in spans:
+                self.file.write(json.dumps(span, default=str) + "\n")
+            self.file.flush()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
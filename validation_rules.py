@@ -0,0 +1,243 @@
+from functools import lru_cache
+import json
+import os
+import re
+
+# config holding the validation rules used when no config is given
+CONFIG_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "parser_config.json"
+)
+
+
+def _value_check(rule: dict):
+    """
+    compile a rule of a part of the sample name into a function telling
+    whether a value passes it. A pattern is matched from the start of
+    the value, as re.match does
+
+    Parameters
+    ----------
+      dict for sample name rule
+
+    Return
+    ------
+      function of the value, returning a boolean
+    """
+    if "pattern" in rule:
+        pattern = re.compile(rule["pattern"])
+        return lambda value: pattern.match(value) is not None
+    check = rule["check"]
+    if check == "length":
+        return lambda value: rule["min"] <= len(value) <= rule["max"]
+    if check == "alnum_not_alpha":
+        return lambda value: value.isalnum() and not value.isalpha()
+    raise ValueError(f"unknown sample name check {check!r}")
+
+
+def _row_mask(rule: dict, column: str):
+    """
+    compile a row rule of a column into a function returning the rows
+    that break it
+
+    Parameters
+    ----------
+      dict for row rule
+      str for column name
+
+    Return
+    ------
+      function of the data frame and the included sheet data frame,
+      returning a boolean series
+    """
+    kind = rule["rule"]
+    if kind == "required":
+        return lambda df, included: df[column].isnull()
+    if kind in ["one_of", "one_of_if_set"]:
+        values = list(rule["values"])
+        if kind == "one_of":
+            return lambda df, included: ~df[column].isin(values)
+        return lambda df, included: (
+            df[column].notnull() & ~df[column].isin(values)
+        )
+    if kind == "in_included":
+        return lambda df, included: (
+            df[column].notnull() & ~df[column].isin(set(included[column]))
+        )
+    if kind in ["requires", "forbids"]:
+        when = rule["when"]
+        other = rule["other"]
+        if kind == "requires":
+            return lambda df, included: (
+                (df[column] == when) & df[other].isnull()
+            )
+        return lambda df, included: (
+            (df[column] == when) & df[other].notnull()
+        )
+    raise ValueError(f"unknown validation rule {kind!r}")
+
+
+class ValidationRules:
+    """
+    Rules of the workbook checks compiled once from their declarative
+    form: the checks of the sample name are compiled and each row rule
+    becomes a function returning the rows breaking it, evaluated over
+    all rows of a table at once. Every rule is evaluated, so all the
+    violations are reported instead of only the first one
+
+    Parameters
+    ----------
+      dict from validation_rules section of config file
+    """
+
+    def __init__(self, rules: dict) -> None:
+        self.sheet_anchors = [
+            (
+                anchor["sheet"],
+                anchor["cell"],
+                anchor["equals"],
+                anchor["message"],
+            )
+            for anchor in rules["sheet_anchors"]
+        ]
+        self.sample_name = [
+            (rule["part"], _value_check(rule), rule["message"])
+            for rule in rules["sample_name"]
+        ]
+        self.interpret_table = self._compile_rows(rules["interpret_table"])
+        # values allowed in each column of the interpret table, as in the
+        # dropdowns of the workbooks
+        self.dropdowns = {
+            column: rule["values"]
+            for rule in rules["interpret_table"]
+            if rule["rule"] == "one_of_if_set"
+            for column in rule["columns"]
+        }
+        self.interpreted_column = self._compile_rows(
+            rules["interpreted_column"]
+        )
+
+    @staticmethod
+    def _compile_rows(rules: list) -> list:
+        return [
+            (
+                _row_mask(rule, column),
+                rule["message"].replace("{column}", column),
+            )
+            for rule in rules
+            for column in rule["columns"]
+        ]
+
+    def check_sheets(self, workbook) -> list:
+        """
+        check the anchor cells of the summary and interpret sheets
+
+        Parameters
+        ----------
+          VariantWorkbook
+
+        Return
+        ------
+          list of distinct error messages, in the order of the rules
+        """
+        error_msg = []
+        for sheet, cell, equals, message in self.sheet_anchors:
+            if sheet == "interpret":
+                sheets = workbook.interpret_sheets
+            else:
+                sheets = [sheet]
+            for name in sheets:
+                if workbook.cell(name, cell) != equals:
+                    if message not in error_msg:
+                        error_msg.append(message)
+
+        return error_msg
+
+    def check_sample_name(self, parts: dict) -> list:
+        """
+        check the parts of a sample name against their patterns
+
+        Parameters
+        ----------
+          dict of part name to value
+
+        Return
+        ------
+          list of error messages, in the order of the rules
+        """
+        return [
+            message
+            for part, check, message in self.sample_name
+            if not check(parts[part])
+        ]
+
+    @staticmethod
+    def check_rows(row_rules: list, df, included=None) -> list:
+        """
+        evaluate row rules over all rows of a table at once
+
+        Parameters
+        ----------
+          list of compiled row rules
+          data frame to check
+          data frame from included sheet, for in_included rules
+
+        Return
+        ------
+          list of row index and error messages of each failing row, the
+          messages of every rule the row breaks joined by "; ", with
+          {row} replaced by the row number
+        """
+        import numpy as np
+        if not row_rules:
+            return []
+        broken = np.column_stack(
+            [mask(df, included).to_numpy(dtype=bool) for mask, _ in row_rules]
+        )
+        messages = [message for _, message in row_rules]
+
+        return [
+            (
+                row,
+                "; ".join(
+                    dict.fromkeys(
+                        messages[rule] for rule in np.flatnonzero(broken[row])
+                    )
+                ).replace("{row}", str(row + 1)),
+            )
+            for row in np.flatnonzero(broken.any(axis=1))
+        ]
+
+
+@lru_cache(maxsize=None)
+def _compile_rules(rules_json: str) -> ValidationRules:
+    return ValidationRules(json.loads(rules_json))
+
+
+def load_rules(config_variable: dict = None) -> ValidationRules:
+    """
+    get the validation rules of a config, or of the parser_config.json
+    of the parser if no config is given. Rules are compiled the first
+    time they are asked for in each process
+
+    Parameters
+    ----------
+      dict from config file (optional)
+
+    Return
+    ------
+      ValidationRules
+    """
+    if config_variable is None:
+        return _default_rules()
+    if "validation_rules" not in config_variable:
+        raise ValueError("no validation_rules section in the config")
+
+    return _compile_rules(
+        json.dumps(config_variable["validation_rules"], sort_keys=True)
+    )
+
+
+@lru_cache(maxsize=None)
+def _default_rules() -> ValidationRules:
+    with open(CONFIG_FILE) as file:
+        return load_rules(json.load(file))
@@ -1,19 +1,128 @@
+from __future__ import annotations
 import argparse
-import re
+import importlib.util
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from itertools import repeat
 import os
 import sys
 import glob
 import shutil
+import multiprocessing
+import signal
+import threading
 from pathlib import Path
 import time
 from datetime import datetime, date
-from dateutil import parser as date_parser
-import uuid
 import json
-import numpy as np
-from openpyxl import load_workbook
-import pandas as pd
-import dxpy
+from typing import TYPE_CHECKING
+from dx_upload import DXClient, Uploader
+from parsed_index import ParsedIndex, parsed_workbook_name
+from parser_outputs import AggregateCsvWriter, write_parquet
+from pipeline import StagedPipeline
+from result_cache import ResultCache
+from sheet_cache import SheetCache
+from staging import StagingArea, replay_journal
+from tracing import Tracer, WorkbookTrace
+from validation_rules import CONFIG_FILE, ValidationRules, load_rules
+
+# pandas, numpy, openpyxl and dateutil are slow to import, so they are
+# only imported by the functions parsing workbooks and not for --help,
+# --watch with nothing to parse or runs where every workbook has already
+# been parsed or cached, with nothing left to do
+if TYPE_CHECKING:
+    import pandas as pd
+    from workbook_reader import VariantWorkbook
+
+# fields extracted from each interpret sheet and their cell addresses
+FIELD_CELLS = [
+    ("Associated disease", "C4"),
+    ("Known inheritance", "C5"),
+    ("Prevalence", "C6"),
+    ("HGVSc", "C3"),
+    ("Germline classification", "C26"),
+    ("PVS1", "H10"),
+    ("PVS1_evidence", "C10"),
+    ("PS1", "H11"),
+    ("PS1_evidence", "C11"),
+    ("PS2", "H12"),
+    ("PS2_evidence", "C12"),
+    ("PS3", "H13"),
+    ("PS3_evidence", "C13"),
+    ("PS4", "H14"),
+    ("PS4_evidence", "C14"),
+    ("PM1", "H15"),
+    ("PM1_evidence", "C15"),
+    ("PM2", "H16"),
+    ("PM2_evidence", "C16"),
+    ("PM3", "H17"),
+    ("PM3_evidence", "C17"),
+    ("PM4", "H18"),
+    ("PM4_evidence", "C18"),
+    ("PM5", "H19"),
+    ("PM5_evidence", "C19"),
+    ("PM6", "H20"),
+    ("PM6_evidence", "C20"),
+    ("PP1", "H21"),
+    ("PP1_evidence", "C21"),
+    ("PP2", "H22"),
+    ("PP2_evidence", "C22"),
+    ("PP3", "H23"),
+    ("PP3_evidence", "C23"),
+    ("PP4", "H24"),
+    ("PP4_evidence", "C24"),
+    ("BS1", "K16"),
+    ("BS1_evidence", "C16"),
+    ("BS2", "K12"),
+    ("BS2_evidence", "C12"),
+    ("BS3", "K13"),
+    ("BS3_evidence", "C13"),
+    ("BA1", "K9"),
+    ("BA1_evidence", "C9"),
+    ("BP2", "K17"),
+    ("BP2_evidence", "C17"),
+    ("BP3", "K18"),
+    ("BP3_evidence", "C18"),
+    ("BS4", "K21"),
+    ("BS4_evidence", "C21"),
+    ("BP1", "K22"),
+    ("BP1_evidence", "C22"),
+    ("BP4", "K23"),
+    ("BP4_evidence", "C23"),
+    ("BP5", "K24"),
+    ("BP5_evidence", "C24"),
+    ("BP7", "K25"),
+    ("BP7_evidence", "C25"),
+]
+
+# default strength of each type of ACMG criteria, which is not written in
+# the comment on classification
+MATCHED_STRENGTH = [
+    ("PVS", "Very Strong"),
+    ("PS", "Strong"),
+    ("PM", "Moderate"),
+    ("PP", "Supporting"),
+    ("BS", "Supporting"),
+    ("BA", "Stand-Alone"),
+    ("BP", "Supporting"),
+]
+
+# cells needed from the summary and interpret sheets by the parser
+SUMMARY_CELLS = ["B1", "F1", "F2", "G21", "G22", "C38"]
+INTERPRET_CELLS = [cell for _, cell in FIELD_CELLS] + ["B26", "L8"]
+
+# layout of the ints of Local IDs, see generate_local_ids
+ID_EPOCH_MS = 1577836800000
+ID_NODE_BITS = 6
+ID_SLOT_BITS = 6
+ID_COUNTER_BITS = 10
+_id_lock = threading.Lock()
+_next_id_tick = 0
+# node field of the Local IDs of this process, see set_id_node
+_id_node = 0
 
 
 def get_command_line_args(arguments) -> argparse.Namespace:
@@ -35,6 +144,14 @@ def get_command_line_args(arguments) -> argparse.Namespace:
         nargs="+",
         help="input file(s) to parse if want to specify",
     )
+    parser.add_argument(
+        "--config",
+        default=CONFIG_FILE,
+        help=(
+            "parser config file, default is the parser_config.json next "
+            "to the parser"
+        ),
+    )
     parser.add_argument(
         "--outdir",
         "--o",
@@ -104,6 +221,15 @@ def get_command_line_args(arguments) -> argparse.Namespace:
         action="store_true",
         help="add this argument if sample name is unusual",
     )
+    parser.add_argument(
+        "--validate_only",
+        "--validate-only",
+        action="store_true",
+        help=(
+            "only check whether the workbooks would pass, without writing "
+            "any output or moving them"
+        ),
+    )
     parser.add_argument(
         "--token", "--tk", help="DNAnexus token to log in", required=False
     )
@@ -112,13 +238,202 @@ def get_command_line_args(arguments) -> argparse.Namespace:
         action="store_true",
         help="add this argument if don't want to upload file(s) to dx",
     )
+    parser.add_argument(
+        "--upload_workers",
+        type=int,
+        default=4,
+        help="number of concurrent uploads to DNAnexus",
+    )
+    parser.add_argument(
+        "--upload_retries",
+        type=int,
+        default=3,
+        help=(
+            "number of retries of a failed upload to DNAnexus, with "
+            "exponential backoff between them"
+        ),
+    )
+    parser.add_argument(
+        "--parsed_index",
+        "--pi",
+        help=(
+            "SQLite file indexing the parsed workbook log, so only the "
+            "lines added since the last run are read from the log"
+        ),
+    )
+    parser.add_argument(
+        "--aggregate",
+        action="store_true",
+        help=(
+            "add this argument to also write all the variants and clinvar "
+            "variants of the run into one csv each"
+        ),
+    )
+    parser.add_argument(
+        "--parquet_dir",
+        help=(
+            "dir of a parquet dataset to also add all the variants of each "
+            "parsed workbook to, partitioned by organisation and month of "
+            "evaluation (needs pyarrow)"
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "add this argument to keep running and parse new workbooks "
+            "in the input dir once their size stops changing, until "
+            "SIGTERM or Ctrl+C"
+        ),
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        default=10,
+        help="seconds between checks of the input dir in --watch mode",
+    )
+    parser.add_argument(
+        "--watch_status",
+        help=(
+            "json file updated with the queue depth and throughput "
+            "counters in --watch mode"
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes to parse and validate workbooks in",
+    )
+    parser.add_argument(
+        "--node_id",
+        type=int,
+        default=0,
+        help=(
+            "ID from 0 to 63 in the Local IDs of this run, each run at the "
+            "same time on any host needs its own"
+        ),
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help=(
+            "read the next workbooks from disk while the current ones are "
+            "parsed and their outputs written"
+        ),
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="number of workbooks read ahead with --pipeline",
+    )
+    parser.add_argument(
+        "--staging_dir",
+        help=(
+            "local dir to copy the workbooks to and parse them in, their "
+            "outputs, log lines and moves are committed to the output "
+            "dirs in batches"
+        ),
+    )
+    parser.add_argument(
+        "--commit_batch",
+        type=int,
+        default=20,
+        help="number of workbooks per commit with --staging_dir",
+    )
+    parser.add_argument(
+        "--reader",
+        choices=["openpyxl", "readonly", "native"],
+        help=(
+            "engine to read the workbooks; readonly only reads the cells "
+            "needed by the parser, native also skips openpyxl and only "
+            "parses the needed sheets from the xlsx zip. Default is "
+            "openpyxl, or native with --validate_only"
+        ),
+    )
+    parser.add_argument(
+        "--result_cache",
+        "--rc",
+        help=(
+            "dir caching the result of each parsed workbook by the SHA-256 "
+            "of its content. A copy of a parsed workbook under another "
+            "name is logged as parsed without writing its outputs again "
+            "and a workbook changed since it was parsed is parsed again"
+        ),
+    )
+    parser.add_argument(
+        "--sheet_cache",
+        help=(
+            "dir caching the values extracted from each sheet by its "
+            "content, so only the sheets changed since a workbook was "
+            "last read are parsed again (needs --reader native)"
+        ),
+    )
+    parser.add_argument(
+        "--sheet_cache_size",
+        type=int,
+        default=512,
+        help=(
+            "maximum size of --sheet_cache in MB, the least recently used "
+            "sheets are removed beyond it"
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        help=(
+            "JSON lines file to append a trace span to for each stage of "
+            "each workbook, with its start, duration, row counts and "
+            "outcome"
+        ),
+    )
     args = parser.parse_args(arguments)
+    if args.reader is None:
+        # checking workbooks does not need openpyxl to load them whole
+        args.reader = "native" if args.validate_only else "openpyxl"
 
     return args
 
 
+def open_workbook(
+    filename: str,
+    reader: str = "openpyxl",
+    sheet_cache: SheetCache = None,
+    data: bytes = None,
+) -> VariantWorkbook:
+    """
+    read the variant workbook from disk once with the chosen reader
+
+    Parameters
+    ----------
+      variant workbook file name
+      str for reader, either openpyxl, readonly or native
+      SheetCache of the native reader (optional)
+      bytes of the workbook already read from disk (optional)
+
+    Return
+    ------
+      VariantWorkbook to pass to the parsing stages
+    """
+    from workbook_reader import (
+        NativeWorkbook,
+        ReadOnlyWorkbook,
+        VariantWorkbook,
+    )
+    cells = {"summary": SUMMARY_CELLS, "interpret": INTERPRET_CELLS}
+    if reader == "readonly":
+        return ReadOnlyWorkbook(filename, cells, data)
+    if reader == "native":
+        return NativeWorkbook(filename, cells, sheet_cache, data)
+
+    return VariantWorkbook(filename, data)
+
+
 def get_summary_fields(
-    filename: str, config_variable: dict, unusual_sample_name: bool
+    filename: str,
+    config_variable: dict,
+    unusual_sample_name: bool,
+    workbook: VariantWorkbook = None,
 ):  # -> tuple[pd.DataFrame, str]
     """
     Extract data from summary sheet of variant workbook
@@ -128,15 +443,19 @@ def get_summary_fields(
       variant workbook file name
       dict from config file
       boolean for unusual_sample_name
+      VariantWorkbook already loaded from file name (optional)
 
     Returns
     -------
       data frame from summary sheet
       str for error message
     """
-    workbook = load_workbook(filename)
-    sampleID = workbook["summary"]["B1"].value
-    CI = workbook["summary"]["F1"].value
+    import pandas as pd
+    from workbook_reader import VariantWorkbook
+    if workbook is None:
+        workbook = VariantWorkbook(filename)
+    sampleID = workbook.cell("summary", "B1")
+    CI = workbook.cell("summary", "F1")
     if ";" in CI:
         split_CI = CI.split(";")
         indication = []
@@ -150,24 +469,28 @@ def get_summary_fields(
     else:
         new_CI = CI.split("_")[1]
         combined_Rcode = CI.split("_")[0]
-    panel = workbook["summary"]["F2"].value
-    date_evaluated = workbook["summary"]["G22"].value
+    panel = workbook.cell("summary", "F2")
+    date_evaluated = workbook.cell("summary", "G22")
     split_sampleID = sampleID.split("-")
     instrumentID = split_sampleID[0]
     sample_ID = split_sampleID[1]
     batchID = split_sampleID[2]
     testcode = split_sampleID[3]
     probesetID = split_sampleID[5]
-    ref_genome = "not_defined"
-    for cell in workbook["summary"]["A"]:
-        if cell.value == "Reference:":
-            ref_genome = workbook["summary"][f"B{cell.row}"].value
+    ref_genome = workbook.lookup(
+        "summary", "A", "Reference:", "B", default="not_defined"
+    )
 
     # checking sample naming
     error_msg = None
     if not unusual_sample_name:
         error_msg = check_sample_name(
-            instrumentID, sample_ID, batchID, testcode, probesetID
+            instrumentID,
+            sample_ID,
+            batchID,
+            testcode,
+            probesetID,
+            load_rules(config_variable),
         )
     d = {
         "Instrument ID": instrumentID,
@@ -191,14 +514,11 @@ def get_summary_fields(
     # Catch if workbook has value for date last evaluated which is not datetime
     # compatible
     # Can test with first item in series as all rows have the same date value
-    try:
-        r = bool(date_parser.parse(str(df_summary['Date last evaluated'][0])))
-    except date_parser._parser.ParserError:
-        error_msg = (
-            f"Value for date last evaluated \"{date_evaluated}\" is not "
-            "compatible with datetime conversion"
-        )
-        return df_summary, error_msg
+    error_msg_date = check_date_evaluated(
+        df_summary['Date last evaluated'][0]
+    )
+    if error_msg_date:
+        return df_summary, error_msg_date
 
 
     df_summary["Date last evaluated"] = pd.to_datetime(
@@ -233,24 +553,56 @@ def get_summary_fields(
     return df_summary, error_msg
 
 
-def get_included_fields(filename: str) -> pd.DataFrame:
+def check_date_evaluated(date_evaluated) -> str:
+    """
+    check if the date last evaluated is compatible with datetime
+    conversion, an empty date is replaced by today's date
+
+    Parameters
+    ----------
+      value of date last evaluated in summary sheet
+
+    Return
+    ------
+      str for error message
+    """
+    from dateutil import parser as date_parser
+    if date_evaluated is None:
+        return None
+    try:
+        date_parser.parse(str(date_evaluated))
+    except date_parser._parser.ParserError:
+        return (
+            f"Value for date last evaluated \"{date_evaluated}\" is not "
+            "compatible with datetime conversion"
+        )
+
+    return None
+
+
+def get_included_fields(
+    filename: str, workbook: VariantWorkbook = None, generate_ids: bool = True
+) -> pd.DataFrame:
     """
     Extract data from included sheet of variant workbook
 
     Parameters
     ----------
       variant workbook file name
+      VariantWorkbook already loaded from file name (optional)
+      boolean for whether to generate the Local IDs and Linking IDs
 
     Return
     ------
       data frame from included sheet
     """
-    workbook = load_workbook(filename)
-    num_variants = workbook["summary"]["C38"].value
-    interpreted_col = get_col_letter(workbook["included"], "Interpreted")
-    df = pd.read_excel(
-        filename,
-        sheet_name="included",
+    from workbook_reader import VariantWorkbook
+    if workbook is None:
+        workbook = VariantWorkbook(filename)
+    num_variants = workbook.cell("summary", "C38")
+    interpreted_col = workbook.col_letter("included", "Interpreted")
+    df = workbook.read_sheet(
+        "included",
         usecols=f"A:{interpreted_col}",
         nrows=num_variants,
     )
@@ -279,18 +631,107 @@ def get_included_fields(filename: str) -> pd.DataFrame:
         },
         inplace=True,
     )
-    df_included["Local ID"] = ""
-    for row in range(df_included.shape[0]):
-        unique_id = uuid.uuid1()
-        df_included.loc[row, "Local ID"] = f"uid_{unique_id.time}"
-        time.sleep(0.5)
-    df_included["Linking ID"] = df_included["Local ID"]
+    if generate_ids:
+        df_included["Local ID"] = generate_local_ids(df_included.shape[0])
+        df_included["Linking ID"] = df_included["Local ID"]
 
     return df_included
 
 
+def generate_local_ids(num_ids: int) -> list:
+    """
+    generate unique Local IDs in the uid_<int> format for all variants
+    of a workbook in one call
+
+    The int fits in 63 bits: the milliseconds since 2020 (41 bits, until
+    2089), a 12 bit node field and a 10 bit counter. The node field is
+    the --node_id of the run and the slot of the process in the run,
+    set by set_id_node, so no two processes running at the same time on
+    any host share it as long as each run has its own --node_id. Each
+    process hands out (millisecond, counter) pairs in increasing order,
+    taking the pairs of the next milliseconds when a call needs more
+    than 1024 IDs, so it never gives the same pair twice
+
+    Parameters
+    ----------
+      int for number of IDs
+
+    Return
+    ------
+      list of str for Local IDs
+    """
+    global _next_id_tick
+    now = (time.time_ns() // 1000000 - ID_EPOCH_MS) << ID_COUNTER_BITS
+    with _id_lock:
+        first_tick = max(_next_id_tick, now)
+        _next_id_tick = first_tick + num_ids
+    counter_mask = (1 << ID_COUNTER_BITS) - 1
+    node_bits = ID_NODE_BITS + ID_SLOT_BITS + ID_COUNTER_BITS
+
+    return [
+        "uid_%d"
+        % (
+            (tick >> ID_COUNTER_BITS) << node_bits
+            | _id_node << ID_COUNTER_BITS
+            | tick & counter_mask
+        )
+        for tick in range(first_tick, first_tick + num_ids)
+    ]
+
+
+def set_id_node(node_id: int, slot: int = 0) -> None:
+    """
+    set the node field of the Local IDs generated by this process
+
+    Parameters
+    ----------
+      int for --node_id of the run, unique among the runs at the same
+      time on every host
+      int for slot of the process in the run, 0 for the main process
+    """
+    global _id_node
+    if not 0 <= node_id < 1 << ID_NODE_BITS:
+        raise ValueError(f"node ID {node_id} is not in 0-63")
+    if not 0 <= slot < 1 << ID_SLOT_BITS:
+        raise ValueError(f"process slot {slot} is not in 0-63")
+    _id_node = node_id << ID_SLOT_BITS | slot
+
+
+def _init_id_worker(node_id: int, slots) -> None:
+    set_id_node(node_id, slots.get())
+
+
+def id_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    start a process pool giving each of its processes its own slot in
+    the node field of the Local IDs, after the main process in slot 0
+
+    Parameters
+    ----------
+      int for number of processes, at most 63
+
+    Return
+    ------
+      ProcessPoolExecutor
+    """
+    if workers >= 1 << ID_SLOT_BITS:
+        raise ValueError(f"cannot generate Local IDs in {workers} processes")
+    slots = multiprocessing.Queue()
+    for slot in range(1, workers + 1):
+        slots.put(slot)
+
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_id_worker,
+        initargs=(_id_node >> ID_SLOT_BITS, slots),
+    )
+
+
 def get_report_fields(
-    filename: str, df_included: pd.DataFrame
+    filename: str,
+    df_included: pd.DataFrame,
+    workbook: VariantWorkbook = None,
+    rules: ValidationRules = None,
 ):  # -> tuple[pd.DataFrame, str]
     """
     Extract data from interpret sheet(s) of variant workbook
@@ -299,6 +740,8 @@ def get_report_fields(
     ----------
       variant workbook file name
       data frame from included sheet
+      VariantWorkbook already loaded from file name (optional)
+      ValidationRules (optional, parser_config.json rules if not given)
 
     Return
     ------
@@ -306,129 +749,78 @@ def get_report_fields(
       str for error message
 
     """
-    workbook = load_workbook(filename)
-    field_cells = [
-        ("Associated disease", "C4"),
-        ("Known inheritance", "C5"),
-        ("Prevalence", "C6"),
-        ("HGVSc", "C3"),
-        ("Germline classification", "C26"),
-        ("PVS1", "H10"),
-        ("PVS1_evidence", "C10"),
-        ("PS1", "H11"),
-        ("PS1_evidence", "C11"),
-        ("PS2", "H12"),
-        ("PS2_evidence", "C12"),
-        ("PS3", "H13"),
-        ("PS3_evidence", "C13"),
-        ("PS4", "H14"),
-        ("PS4_evidence", "C14"),
-        ("PM1", "H15"),
-        ("PM1_evidence", "C15"),
-        ("PM2", "H16"),
-        ("PM2_evidence", "C16"),
-        ("PM3", "H17"),
-        ("PM3_evidence", "C17"),
-        ("PM4", "H18"),
-        ("PM4_evidence", "C18"),
-        ("PM5", "H19"),
-        ("PM5_evidence", "C19"),
-        ("PM6", "H20"),
-        ("PM6_evidence", "C20"),
-        ("PP1", "H21"),
-        ("PP1_evidence", "C21"),
-        ("PP2", "H22"),
-        ("PP2_evidence", "C22"),
-        ("PP3", "H23"),
-        ("PP3_evidence", "C23"),
-        ("PP4", "H24"),
-        ("PP4_evidence", "C24"),
-        ("BS1", "K16"),
-        ("BS1_evidence", "C16"),
-        ("BS2", "K12"),
-        ("BS2_evidence", "C12"),
-        ("BS3", "K13"),
-        ("BS3_evidence", "C13"),
-        ("BA1", "K9"),
-        ("BA1_evidence", "C9"),
-        ("BP2", "K17"),
-        ("BP2_evidence", "C17"),
-        ("BP3", "K18"),
-        ("BP3_evidence", "C18"),
-        ("BS4", "K21"),
-        ("BS4_evidence", "C21"),
-        ("BP1", "K22"),
-        ("BP1_evidence", "C22"),
-        ("BP4", "K23"),
-        ("BP4_evidence", "C23"),
-        ("BP5", "K24"),
-        ("BP5_evidence", "C24"),
-        ("BP7", "K25"),
-        ("BP7_evidence", "C25"),
-    ]
-    col_name = [i[0] for i in field_cells]
+    import pandas as pd
+    from workbook_reader import VariantWorkbook
+    if workbook is None:
+        workbook = VariantWorkbook(filename)
+    col_name = [i[0] for i in FIELD_CELLS]
     df_report = pd.DataFrame(columns=col_name)
-    report_sheets = [
-        idx
-        for idx in workbook.sheetnames
-        if idx.lower().startswith("interpret")
-    ]
+    report_sheets = workbook.interpret_sheets
 
     for idx, sheet in enumerate(report_sheets):
-        for field, cell in field_cells:
-            if workbook[sheet][cell].value is not None:
-                df_report.loc[idx, field] = workbook[sheet][cell].value
+        for field, cell in FIELD_CELLS:
+            value = workbook.cell(sheet, cell)
+            if value is not None:
+                df_report.loc[idx, field] = value
     df_report.reset_index(drop=True, inplace=True)
     error_msg = None
     if not df_report.empty:
-        error_msg = check_interpret_table(df_report, df_included)
+        error_msg = check_interpret_table(df_report, df_included, rules)
     if not error_msg:
-        # put strength as nan if it is 'NA'
-        for row in range(df_report.shape[0]):
-            for column in range(5, df_report.shape[1], 2):
-                if df_report.iloc[row, column] == "NA":
-                    df_report.iloc[row, column] = np.nan
+        df_report = process_report_evidence(df_report)
+
+    return df_report, error_msg
+
+
+def process_report_evidence(df_report: pd.DataFrame) -> pd.DataFrame:
+    """
+    tidy the strength and evidence columns of the interpret table and add
+    the comment on classification for clinvar submission, working on
+    whole strength/evidence column pairs
+
+    Parameters
+    ----------
+      data frame from interpret sheet(s)
 
+    Return
+    ------
+      data frame from interpret sheet(s) with comment on classification
+    """
+    import numpy as np
+    import pandas as pd
+    strength_cols = df_report.columns[5::2]
+    evidence_cols = df_report.columns[6::2]
+
+    for criteria, criteria_evidence in zip(strength_cols, evidence_cols):
+        # put strength as nan if it is 'NA'
+        df_report.loc[df_report[criteria] == "NA", criteria] = np.nan
         # removing evidence value if no strength
-        for row in range(df_report.shape[0]):
-            for column in range(5, df_report.shape[1], 2):
-                if df_report.isnull().iloc[row, column]:
-                    df_report.iloc[row, column + 1] = np.nan
-
-        # getting comment on classification for clinvar submission
-        matched_strength = [
-            ("PVS", "Very Strong"),
-            ("PS", "Strong"),
-            ("PM", "Moderate"),
-            ("PP", "Supporting"),
-            ("BS", "Supporting"),
-            ("BA", "Stand-Alone"),
-            ("BP", "Supporting"),
-        ]
-        df_report["Comment on classification"] = ""
-        for row in range(df_report.shape[0]):
-            evidence = []
-            for column in range(5, df_report.shape[1] - 1, 2):
-                if not df_report.isnull().iloc[row, column]:
-                    evidence.append(
-                        [
-                            df_report.columns[column],
-                            df_report.iloc[row, column],
-                        ]
-                    )
-            for index, value in enumerate(evidence):
-                for st1, st2 in matched_strength:
-                    if st1 in value[0] and st2 == value[1]:
-                        evidence[index][1] = ""
-            evidence_pair = []
-            for e in evidence:
-                evidence_pair.append("_".join(e).rstrip("_"))
-            comment_on_classification = ",".join(evidence_pair)
-            df_report.iloc[
-                row, df_report.columns.get_loc("Comment on classification")
-            ] = comment_on_classification
+        df_report.loc[
+            df_report[criteria].isnull(), criteria_evidence
+        ] = np.nan
+
+    # getting comment on classification for clinvar submission, the
+    # strength is left out if it is the default one for the criteria
+    comment = pd.Series("", index=df_report.index, dtype=object)
+    for criteria in strength_cols:
+        strength = df_report[criteria]
+        defaults = [st2 for st1, st2 in MATCHED_STRENGTH if st1 in criteria]
+        evidence = strength.notnull()
+        if not evidence.any():
+            continue
+        label = (
+            criteria
+            + "_"
+            + strength[evidence].mask(strength[evidence].isin(defaults), "")
+        ).str.rstrip("_")
+        comment[evidence] = np.where(
+            comment[evidence] == "",
+            label,
+            comment[evidence] + "," + label,
+        )
+    df_report["Comment on classification"] = comment
 
-    return df_report, error_msg
+    return df_report
 
 
 def check_sample_name(
@@ -437,6 +829,7 @@ def check_sample_name(
     batchID: str,
     testcode: str,
     probesetID: str,
+    rules: ValidationRules = None,
 ) -> str:
     """
     checking if individual parts of sample name have
@@ -446,69 +839,57 @@ def check_sample_name(
     ----------
       str values for instrumentID, sample_ID, batchID, testcode,
       probesetID
+      ValidationRules (optional, parser_config.json rules if not given)
 
     Return
     ------
-      str for error message
+      str for error message(s), separated by "; "
     """
-    try:
-        assert re.match(
-            r"^\d{9}$", instrumentID
-        ), "Unusual name for instrumentID"
-        assert re.match(r"^\d{5}[A-Z]\d{4}$", sample_ID), "Unusual sampleID"
-        assert re.match(r"^\d{2}[A-Z]{5}\d{1,}$", batchID), "Unusual batchID"
-        assert re.match(r"^\d{4}$", testcode), "Unusual testcode"
-        assert 0 < len(probesetID) < 20, "probesetID is too long/short"
-        assert (
-            probesetID.isalnum() and not probesetID.isalpha()
-        ), "Unusual probesetID"
-        error_msg = None
-    except AssertionError as msg:
-        error_msg = str(msg)
+    if rules is None:
+        rules = load_rules()
+    error_msg = rules.check_sample_name(
+        {
+            "instrumentID": instrumentID,
+            "sample_ID": sample_ID,
+            "batchID": batchID,
+            "testcode": testcode,
+            "probesetID": probesetID,
+        }
+    )
+    for msg in error_msg:
         print(msg)
 
-    return error_msg
+    return "; ".join(error_msg) or None
 
 
-def checking_sheets(filename: str) -> str:
+def checking_sheets(
+    filename: str,
+    workbook: VariantWorkbook = None,
+    rules: ValidationRules = None,
+) -> str:
     """
     check if extra row(s)/col(s) are added in the sheets
 
     Parameters
     ----------
       variant workbook file name
+      VariantWorkbook already loaded from file name (optional)
+      ValidationRules (optional, parser_config.json rules if not given)
 
     Return
     ------
-      str for error message
+      str for error message(s), separated by "; "
     """
-    workbook = load_workbook(filename)
-    summary = workbook["summary"]
-    reports = [
-        idx
-        for idx in workbook.sheetnames
-        if idx.lower().startswith("interpret")
-    ]
-    try:
-        assert (
-            summary["G21"].value == "Date"
-        ), "extra col(s) added or change(s) done in summary sheet"
-        for sheet in reports:
-            report = workbook[sheet]
-            assert report["B26"].value == "FINAL ACMG CLASSIFICATION", (
-                "extra row(s) or col(s) added or change(s) done in "
-                "interpret sheet"
-            )
-            assert report["L8"].value == "B_POINTS", (
-                "extra row(s) or col(s) added or change(s) done in "
-                "interpret sheet"
-            )
-        error_msg = None
-    except AssertionError as msg:
-        error_msg = str(msg)
+    from workbook_reader import VariantWorkbook
+    if workbook is None:
+        workbook = VariantWorkbook(filename)
+    if rules is None:
+        rules = load_rules()
+    error_msg = rules.check_sheets(workbook)
+    for msg in error_msg:
         print(msg)
 
-    return error_msg
+    return "; ".join(error_msg) or None
 
 
 def get_col_letter(worksheet: object, col_name: str) -> str:
@@ -543,13 +924,31 @@ def write_txt_file(txt_file_name: str, filename: str, msg: str) -> None:
       str for error message
     """
     with open(txt_file_name, "a") as file:
-        dt = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        file.write(dt + "\t " + filename + "\t " + msg + "\n")
+        file.write(log_line(filename, msg))
         file.close()
 
 
+def log_line(filename: str, msg: str) -> str:
+    """
+    get the line recording a workbook in a txt file output
+
+    Parameters
+    ----------
+      variant workbook file name
+      str for error message
+
+    Return
+    ------
+      str for line with the current time, ending with a new line
+    """
+    dt = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+    return dt + "\t " + filename + "\t " + msg + "\n"
+
+
 def check_interpret_table(
-    df_report: pd.DataFrame, df_included: pd.DataFrame
+    df_report: pd.DataFrame,
+    df_included: pd.DataFrame,
+    rules: ValidationRules = None,
 ) -> str:
     """
     check if ACMG classification and HGVSc are correctly
@@ -559,93 +958,30 @@ def check_interpret_table(
     ----------
       df from interpret sheet(s)
       df from included sheet
+      ValidationRules (optional, parser_config.json rules if not given)
 
     Return
     ------
       str for error message
     """
-    error_msg = []
-    strength_dropdown = [
-        "Very Strong",
-        "Strong",
-        "Moderate",
-        "Supporting",
-        "NA",
-    ]
-    BA1_dropdown = [
-        "Stand-Alone",
-        "Very Strong",
-        "Strong",
-        "Moderate",
-        "Supporting",
-        "NA",
+    if rules is None:
+        rules = load_rules()
+    error_msg = [
+        msg
+        for _, msg in rules.check_rows(
+            rules.interpret_table, df_report, df_included
+        )
     ]
-    for row in range(df_report.shape[0]):
-        try:
-            assert (
-                df_report.loc[row, "Germline classification"] is not np.nan
-            ), "empty ACMG classification in interpret table"
-            assert df_report.loc[row, "Germline classification"] in [
-                "Pathogenic",
-                "Likely Pathogenic",
-                "Uncertain Significance",
-                "Likely Benign",
-                "Benign",
-            ], "wrong ACMG classification in interpret table"
-            assert (
-                df_report.loc[row, "HGVSc"] is not np.nan
-            ), "empty HGVSc in interpret table"
-            assert df_report.loc[row, "HGVSc"] in list(df_included["HGVSc"]), (
-                "HGVSc in interpret table does not match with that in "
-                "included sheet"
-            )
-            criteria_list = [
-                "PVS1",
-                "PS1",
-                "PS2",
-                "PS3",
-                "PS4",
-                "PM1",
-                "PM2",
-                "PM3",
-                "PM4",
-                "PM5",
-                "PM6",
-                "PP1",
-                "PP2",
-                "PP3",
-                "PP4",
-                "BS2",
-                "BS3",
-                "BS1",
-                "BP2",
-                "BP3",
-                "BS4",
-                "BP1",
-                "BP4",
-                "BP5",
-                "BP7",
-            ]
-            for criteria in criteria_list:
-                if df_report.loc[row, criteria] is not np.nan:
-                    assert (
-                        df_report.loc[row, criteria] in strength_dropdown
-                    ), f"Wrong strength in {criteria}"
-
-            if df_report.loc[row, "BA1"] is not np.nan:
-                assert (
-                    df_report.loc[row, "BA1"] in BA1_dropdown
-                ), "Wrong strength in BA1"
-
-        except AssertionError as msg:
-            error_msg.append(str(msg))
-            print(msg)
+    for msg in error_msg:
+        print(msg)
     error_msg = "".join(error_msg)
 
     return error_msg
 
 
-def check_interpreted_col(df: pd.DataFrame) -> str:
+def check_interpreted_col(
+    df: pd.DataFrame, rules: ValidationRules = None
+) -> str:
     """
     check if interpreted col in included sheet
     is correctly filled in
@@ -653,34 +989,18 @@ def check_interpreted_col(df: pd.DataFrame) -> str:
     Parameters
     ----------
     merged df
+    ValidationRules (optional, parser_config.json rules if not given)
 
     Return
     ------
       str for error message
     """
-    row_yes = df[df["Interpreted"] == "yes"].index.tolist()
+    if rules is None:
+        rules = load_rules()
     error_msg = []
-    for row in range(df.shape[0]):
-        if row in row_yes:
-            try:
-                assert (
-                    df.loc[row, "Germline classification"] is not np.nan
-                ), f"Wrong interpreted column in row {row+1} of included sheet"
-            except AssertionError as msg:
-                error_msg.append(str(msg))
-                print(msg)
-        else:
-            try:
-                assert df.loc[row, "Interpreted"] == "no", (
-                    f"Wrong interpreted column dropdown in row {row+1} "
-                    "of included sheet"
-                )
-                assert (
-                    df.loc[row, "Germline classification"] is np.nan
-                ), f"Wrong interpreted column in row {row+1} of included sheet"
-            except AssertionError as msg:
-                error_msg.append(str(msg))
-                print(msg)
+    for _, msg in rules.check_rows(rules.interpreted_column, df):
+        error_msg.append(msg)
+        print(msg)
     error_msg = " ".join(error_msg)
 
     return error_msg
@@ -717,9 +1037,7 @@ def get_parsed_list(file: str) -> list:
     lines = f.readlines()
     parsed_list = []
     for x in lines:
-        columns = x.split("\t ")
-        file_path = Path(columns[1])
-        parsed_list.append(Path(file_path).stem + ".xlsx")
+        parsed_list.append(parsed_workbook_name(x))
     f.close()
 
     return parsed_list
@@ -736,323 +1054,1247 @@ def check_and_create_folder(dir: str) -> None:
         os.makedirs(dir)
 
 
-def dx_login(token: str) -> bool:
-    """
-    Function to check dxpy login
-    Input: dxpy token
-    Output: boolean
+def parse_workbook(
+    filename: str,
+    config_variable: dict,
+    unusual_sample_name: bool,
+    reader: str = "openpyxl",
+    spans: list = None,
+    sheet_cache: SheetCache = None,
+    data: bytes = None,
+):  # -> tuple[pd.DataFrame, pd.DataFrame, str, str]
     """
+    parse and validate a variant workbook without writing any output,
+    so it can run in a worker process
 
-    try:
-        DX_SECURITY_CONTEXT = {
-            "auth_token_type": "Bearer",
-            "auth_token": str(token),
-        }
+    Parameters
+    ----------
+      variant workbook file name
+      dict from config file
+      boolean for unusual_sample_name
+      str for reader
+      list to append the trace spans of the stages to (optional)
+      SheetCache of the native reader (optional)
+      bytes of the workbook already read from disk (optional)
 
-        dxpy.set_security_context(DX_SECURITY_CONTEXT)
-        dxpy.api.system_whoami()
-        return True
+    Return
+    ------
+      data frame of all variants, None if the workbook failed
+      data frame of variants for clinvar submission, None if there are
+      no variants to submit
+      str for error message if the workbook failed
+      str for warning message to record in the failed file log
+    """
+    trace = WorkbookTrace(filename, spans)
+    rules = load_rules(config_variable)
+    with trace.span("open_workbook"):
+        workbook = open_workbook(filename, reader, sheet_cache, data)
+    with trace.span("checking_sheets") as span:
+        error_msg_sheet = checking_sheets(filename, workbook, rules)
+        span.set_error(error_msg_sheet)
+    if error_msg_sheet:
+        return None, None, error_msg_sheet, None
+    with trace.span("get_summary_fields") as span:
+        df_summary, error_msg_name = get_summary_fields(
+            filename, config_variable, unusual_sample_name, workbook
+        )
+        span.set_error(error_msg_name)
+    if error_msg_name:
+        return None, None, error_msg_name, None
+    with trace.span("get_included_fields") as span:
+        df_included = get_included_fields(filename, workbook)
+        span["rows"] = df_included.shape[0]
+        if df_included["Interpreted"].isna().sum() != 0:
+            print("Interpreted column in included sheet needs to be fixed")
+            span.set_error(
+                "Interpreted column in included sheet needs to be fixed"
+            )
+            return (
+                None,
+                None,
+                "Interpreted column in included sheet needs to be fixed",
+                None,
+            )
+    with trace.span("get_report_fields") as span:
+        df_report, error_msg_table = get_report_fields(
+            filename, df_included, workbook, rules
+        )
+        span["rows"] = df_report.shape[0]
+        span.set_error(error_msg_table)
+    if error_msg_table:
+        return None, None, error_msg_table, None
+
+    with trace.span("merge_workbook_fields") as span:
+        result = merge_workbook_fields(
+            df_summary, df_included, df_report, rules
+        )
+        df_final, df_clinvar, error_msg, _ = result
+        span["rows"] = 0 if df_final is None else df_final.shape[0]
+        span["clinvar_rows"] = 0 if df_clinvar is None else df_clinvar.shape[0]
+        span.set_error(error_msg)
 
-    except dxpy.exceptions.InvalidAuthentication as e:
-        print(e)
+    return result
 
-        return False
 
+def merge_workbook_fields(
+    df_summary: pd.DataFrame,
+    df_included: pd.DataFrame,
+    df_report: pd.DataFrame,
+    rules: ValidationRules = None,
+):  # -> tuple[pd.DataFrame, pd.DataFrame, str, str]
+    """
+    merge the fields extracted from the summary, included and interpret
+    sheets, check the interpreted column and select the columns of the
+    all variants and clinvar outputs
 
-def main():
-    arguments = get_command_line_args(sys.argv[1:])
-    if not arguments.no_dx_upload and not arguments.token:
-        raise RuntimeError(
-            "--no_dx_upload=False but no DNAnexus token provided via --token"
-        )
-    input_dir = arguments.indir
-    if arguments.file:
-        input_file = []
-        for idx, file in enumerate(arguments.file):
-            input_file.append(glob.glob(input_dir + file)[0])
+    Parameters
+    ----------
+      data frame from summary sheet
+      data frame from included sheet
+      data frame from interpret sheet(s)
+      ValidationRules (optional, parser_config.json rules if not given)
+
+    Return
+    ------
+      data frame of all variants, None if the workbook failed
+      data frame of variants for clinvar submission, None if there are
+      no variants to submit
+      str for error message if the workbook failed
+      str for warning message to record in the failed file log
+    """
+    import pandas as pd
+    if not df_included.empty:
+        df_merged = pd.merge(df_included, df_summary, how="cross")
+        empty_workbook = False
     else:
-        input_file = glob.glob(input_dir + "*.xlsx")
-    if len(input_file) == 0:
-        print("Input file(s) not exist")
-    check_and_create_folder(arguments.outdir)
-    check_and_create_folder(arguments.completed_dir)
-    check_and_create_folder(arguments.failed_dir)
-    if not os.path.isfile(arguments.parsed_file_log):
-        with open(arguments.parsed_file_log, "w") as file:
-            file.close()
-    unusual_sample_name = arguments.unusual_sample_name
-    no_dx_upload = arguments.no_dx_upload
-    clinvar_count = 0
-    with open("parser_config.json") as f:
-        config_variable = json.load(f)
-    parsed_list = get_parsed_list(arguments.parsed_file_log)
-    # extract fields from variant workbooks as df and merged
+        df_merged = pd.concat([df_summary, df_included], axis=1)
+        empty_workbook = True
+    df_final = pd.merge(df_merged, df_report, on="HGVSc", how="left")
+    error_msg_interpreted = None
+    if not empty_workbook:
+        error_msg_interpreted = check_interpreted_col(df_final, rules)
+    if error_msg_interpreted:
+        return None, None, error_msg_interpreted, None
+    df_final = df_final[
+        [
+            "Local ID",
+            "Linking ID",
+            "Organisation ID",
+            "Gene symbol",
+            "Chromosome",
+            "Start",
+            "Reference allele",
+            "Alternate allele",
+            "R code",
+            "Preferred condition name",
+            "Germline classification",
+            "Date last evaluated",
+            "Comment on classification",
+            "Collection method",
+            "Allele origin",
+            "Affected status",
+            "HGVSc",
+            "Consequence",
+            "Interpreted",
+            "Comment",
+            "Instrument ID",
+            "Specimen ID",
+            "Batch ID",
+            "Test code",
+            "Probeset ID",
+            "Panel",
+            "Ref genome",
+            "Organisation",
+            "Institution",
+            "Associated disease",
+            "Known inheritance",
+            "Prevalence",
+            "PVS1",
+            "PVS1_evidence",
+            "PS1",
+            "PS1_evidence",
+            "PS2",
+            "PS2_evidence",
+            "PS3",
+            "PS3_evidence",
+            "PS4",
+            "PS4_evidence",
+            "PM1",
+            "PM1_evidence",
+            "PM2",
+            "PM2_evidence",
+            "PM3",
+            "PM3_evidence",
+            "PM4",
+            "PM4_evidence",
+            "PM5",
+            "PM5_evidence",
+            "PM6",
+            "PM6_evidence",
+            "PP1",
+            "PP1_evidence",
+            "PP2",
+            "PP2_evidence",
+            "PP3",
+            "PP3_evidence",
+            "PP4",
+            "PP4_evidence",
+            "BS1",
+            "BS1_evidence",
+            "BS2",
+            "BS2_evidence",
+            "BS3",
+            "BS3_evidence",
+            "BA1",
+            "BA1_evidence",
+            "BP2",
+            "BP2_evidence",
+            "BP3",
+            "BP3_evidence",
+            "BS4",
+            "BS4_evidence",
+            "BP1",
+            "BP1_evidence",
+            "BP4",
+            "BP4_evidence",
+            "BP5",
+            "BP5_evidence",
+            "BP7",
+            "BP7_evidence",
+        ]
+    ]
+    df_clinvar = None
+    warning_msg = None
+    if empty_workbook:
+        df_final.fillna("null", inplace=True)
+    else:
+        df_final["Germline classification"] = df_final[
+            "Germline classification"
+        ].replace(
+            {
+                "Likely Pathogenic": "Likely pathogenic",
+                "Uncertain Significance": "Uncertain significance",
+                "Likely Benign": "Likely benign",
+            }
+        )
+        if (df_final.Interpreted == "yes").sum() > 0 and list(
+            df_final["Ref genome"].unique()
+        )[0] != "not_defined":
+            df_clinvar = df_final[df_final["Interpreted"] == "yes"]
+            df_clinvar = df_clinvar[
+                [
+                    "Local ID",
+                    "Linking ID",
+                    "Organisation ID",
+                    "Gene symbol",
+                    "Chromosome",
+                    "Start",
+                    "Reference allele",
+                    "Alternate allele",
+                    "Preferred condition name",
+                    "Germline classification",
+                    "Date last evaluated",
+                    "Comment on classification",
+                    "Collection method",
+                    "Allele origin",
+                    "Affected status",
+                    "Ref genome",
+                    "HGVSc",
+                    "Consequence",
+                    "Interpreted",
+                    "Instrument ID",
+                    "Specimen ID",
+                ]
+            ]
+        elif list(df_final["Ref genome"].unique())[0] == "not_defined":
+            warning_msg = "Ref_genome_not_defined"
+
+    return df_final, df_clinvar, None, warning_msg
+
+
+def validate_workbook(
+    filename: str,
+    config_variable: dict,
+    unusual_sample_name: bool,
+    reader: str = "native",
+    sheet_cache: SheetCache = None,
+    rules: ValidationRules = None,
+) -> str:
+    """
+    run the checks of parse_workbook on a variant workbook, including
+    the parsing of the summary fields, without generating IDs, merging
+    the fields or writing any output, stopping at the first check that
+    fails as parse_workbook does
+
+    Parameters
+    ----------
+      variant workbook file name
+      dict from config file
+      boolean for unusual_sample_name
+      str for reader
+      SheetCache of the native reader (optional)
+      ValidationRules (optional, rules of the config if not given)
+
+    Return
+    ------
+      str for error message, None if the workbook passes
+    """
+    if rules is None:
+        rules = load_rules(config_variable)
+    workbook = open_workbook(filename, reader, sheet_cache)
+    error_msg = checking_sheets(filename, workbook, rules)
+    if error_msg:
+        return error_msg
+    _, error_msg = get_summary_fields(
+        filename, config_variable, unusual_sample_name, workbook
+    )
+    if error_msg:
+        return error_msg
+    df_included = get_included_fields(filename, workbook, generate_ids=False)
+    if df_included["Interpreted"].isna().sum() != 0:
+        print("Interpreted column in included sheet needs to be fixed")
+        return "Interpreted column in included sheet needs to be fixed"
+    df_report, error_msg = get_report_fields(
+        filename, df_included, workbook, rules
+    )
+    if error_msg:
+        return error_msg
+    if df_included.empty:
+        return None
+    # only the columns check_interpreted_col needs, in the order of the
+    # rows of the merged fields
+    df_interpreted = df_included[["HGVSc", "Interpreted"]].merge(
+        df_report[["HGVSc", "Germline classification"]],
+        on="HGVSc",
+        how="left",
+    )
+
+    return check_interpreted_col(df_interpreted, rules) or None
+
+
+def validate_workbooks(
+    input_file: list,
+    config_variable: dict,
+    unusual_sample_name: bool,
+    reader: str = "native",
+    sheet_cache: SheetCache = None,
+) -> list:
+    """
+    check the workbooks with validate_workbook, printing whether each
+    one passes
+
+    Parameters
+    ----------
+      list of variant workbook file names
+      dict from config file
+      boolean for unusual_sample_name
+      str for reader
+      SheetCache of the native reader (optional)
+
+    Return
+    ------
+      list of variant workbook file names that failed
+    """
+    failed = []
+    for filename in input_file:
+        try:
+            error_msg = validate_workbook(
+                filename,
+                config_variable,
+                unusual_sample_name,
+                reader,
+                sheet_cache,
+            )
+        except SystemExit:
+            # get_summary_fields exits the full run for a wrong folder
+            error_msg = "Running for the wrong folder"
+        except Exception as error:
+            # the full run stops on these, report them with the workbook
+            error_msg = f"{type(error).__name__}: {error}"
+        if error_msg:
+            print(filename, "fails:", error_msg)
+            failed.append(filename)
+        else:
+            print(filename, "passes")
+
+    return failed
+
+
+def parse_workbook_spans(
+    filename: str,
+    config_variable: dict,
+    unusual_sample_name: bool,
+    reader: str = "openpyxl",
+    trace: bool = False,
+    sheet_cache: SheetCache = None,
+    data: bytes = None,
+):  # -> tuple[tuple, list]
+    """
+    parse a workbook, returning the trace spans of its stages with the
+    result so they can be sent back from a worker process
+
+    Parameters
+    ----------
+      variant workbook file name
+      dict from config file
+      boolean for unusual_sample_name
+      str for reader
+      boolean for whether to trace the stages
+      SheetCache of the native reader (optional)
+      bytes of the workbook already read from disk (optional)
+
+    Return
+    ------
+      tuple returned by parse_workbook
+      list of dict spans, None if not traced
+    """
+    spans = [] if trace else None
+    result = parse_workbook(
+        filename,
+        config_variable,
+        unusual_sample_name,
+        reader,
+        spans,
+        sheet_cache,
+        data,
+    )
+
+    return result, spans
+
+
+def select_workbooks(
+    input_file: list, parsed_list, result_cache: ResultCache = None
+):  # -> tuple[list, set]
+    """
+    select the workbooks to record in this run. Without a result cache,
+    workbooks are skipped if their name is in the parsed workbook log.
+    With a result cache, they are skipped only if their content is also
+    cached, a workbook with cached content under a new name is recorded
+    from the cache and any other workbook is parsed
+
+    Parameters
+    ----------
+      list of variant workbook file names
+      set or ParsedIndex of previously parsed workbooks
+      ResultCache (optional)
+
+    Return
+    ------
+      list of variant workbook file names to record, in input order
+      set of variant workbook file names to record from the cache
+    """
+    selected = []
+    cached = set()
     for filename in input_file:
         print("Running", filename)
-        if (Path(filename).stem + ".xlsx") in parsed_list:
-            print(filename, "is already parsed")
-            continue
-        error_msg_sheet = checking_sheets(filename)
-        if error_msg_sheet:
-            write_txt_file(
-                arguments.failed_file_log, filename, error_msg_sheet
+        parsed = (Path(filename).stem + ".xlsx") in parsed_list
+        if result_cache is None:
+            if parsed:
+                print(filename, "is already parsed")
+                continue
+        elif result_cache.key(filename) in result_cache:
+            # only the workbooks parsed need the bytes read for the key
+            del result_cache.data[filename]
+            if parsed:
+                print(filename, "is already parsed")
+                continue
+            print(filename, "has the same content as a parsed workbook")
+            cached.add(filename)
+        elif parsed:
+            print(filename, "has changed since it was parsed")
+        selected.append(filename)
+
+    return selected, cached
+
+
+def parse_workbooks(
+    input_file: list,
+    config_variable: dict,
+    unusual_sample_name: bool,
+    reader: str = "openpyxl",
+    workers: int = 1,
+    trace: bool = False,
+    result_cache: ResultCache = None,
+    cached: set = frozenset(),
+    sheet_cache: SheetCache = None,
+    staging: StagingArea = None,
+):
+    """
+    parse workbooks serially or in a pool of worker processes, yielding
+    the results in the same order as the input files. The workbooks
+    with a cached result are not parsed and the bytes read for the key
+    of the others are parsed. With a staging area, the workbooks are
+    parsed from their local copies
+
+    Parameters
+    ----------
+      list of variant workbook file names
+      dict from config file
+      boolean for unusual_sample_name
+      str for reader
+      int for number of worker processes
+      boolean for whether to trace the stages
+      ResultCache with the keys of the workbooks (optional)
+      set of variant workbook file names to serve from the result cache
+      SheetCache of the native reader (optional)
+      StagingArea to copy the workbooks to (optional)
+
+    Yields
+    ------
+      variant workbook file name, tuple returned by parse_workbook and
+      list of trace spans (None if not traced or served from the cache)
+    """
+    to_parse = [filename for filename in input_file if filename not in cached]
+
+    def read(filename: str) -> bytes:
+        # the bytes of a workbook, read from disk when it is parsed if
+        # there is neither a result cache nor a staging area
+        data = None
+        if result_cache is not None:
+            data = result_cache.data.pop(filename, None)
+        if staging is not None:
+            data = staging.read(filename, data)
+        return data
+
+    data = map(read, to_parse)
+    executor = None
+    if workers <= 1:
+        results = (
+            parse_workbook_spans(
+                filename,
+                config_variable,
+                unusual_sample_name,
+                reader,
+                trace,
+                sheet_cache,
+                workbook_data,
             )
-            shutil.move(filename, arguments.failed_dir)
-            continue
-        df_summary, error_msg_name = get_summary_fields(
-            filename, config_variable, unusual_sample_name
+            for filename, workbook_data in zip(to_parse, data)
         )
-        if error_msg_name:
-            write_txt_file(arguments.failed_file_log, filename, error_msg_name)
-            shutil.move(filename, arguments.failed_dir)
-            continue
-        df_included = get_included_fields(filename)
-        if df_included["Interpreted"].isna().sum() != 0:
-            print("Interpreted column in included sheet needs to be fixed")
-            write_txt_file(
-                arguments.failed_file_log,
-                filename,
-                "Interpreted column in included sheet needs to be fixed",
+    else:
+        executor = id_process_pool(workers)
+        results = executor.map(
+            parse_workbook_spans,
+            to_parse,
+            repeat(config_variable),
+            repeat(unusual_sample_name),
+            repeat(reader),
+            repeat(trace),
+            repeat(sheet_cache),
+            data,
+        )
+    try:
+        for filename in input_file:
+            if filename in cached:
+                result = result_cache.get(result_cache.keys[filename])
+                yield filename, result, None
+                continue
+            result, spans = next(results)
+            yield filename, result, spans
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ParserRun:
+    """
+    Coordinator of a parser run, applying the side effects of each parsed
+    workbook one at a time and in input order: writing the output csvs
+    and log files, moving the workbook and queueing the uploads to
+    DNAnexus, which run in the background
+
+    Parameters
+    ----------
+      Namespace of command line argument inputs
+      dict from config file
+      object with the dxpy API used for uploads (optional, default dxpy)
+    """
+
+    def __init__(
+        self,
+        arguments: argparse.Namespace,
+        config_variable: dict,
+        dx_backend=None,
+    ) -> None:
+        self.arguments = arguments
+        self.config_variable = config_variable
+        self.clinvar_count = 0
+        self.folder_name = None
+        self.dx = None
+        self.uploader = None
+        self.aggregates = {}
+        self.tracer = Tracer(arguments.trace)
+        self.result_cache = None
+        # results of the workbooks staged, cached once they are committed
+        self.staged_results = []
+        if arguments.result_cache:
+            self.result_cache = ResultCache(
+                arguments.result_cache,
+                config_variable,
+                arguments.unusual_sample_name,
+                arguments.reader,
             )
-            shutil.move(filename, arguments.failed_dir)
-            continue
-        df_report, error_msg_table = get_report_fields(filename, df_included)
-        if error_msg_table:
-            write_txt_file(
-                arguments.failed_file_log,
-                filename,
-                error_msg_table,
+        self.sheet_cache = None
+        if arguments.sheet_cache:
+            self.sheet_cache = SheetCache(
+                arguments.sheet_cache, arguments.sheet_cache_size * 1024**2
             )
-            shutil.move(filename, arguments.failed_dir)
-            continue
-        if not df_included.empty:
-            df_merged = pd.merge(df_included, df_summary, how="cross")
-            empty_workbook = False
-        else:
-            df_merged = pd.concat([df_summary, df_included], axis=1)
-            empty_workbook = True
-        df_final = pd.merge(df_merged, df_report, on="HGVSc", how="left")
-        error_msg_interpreted = None
-        if not empty_workbook:
-            error_msg_interpreted = check_interpreted_col(df_final)
-        if error_msg_interpreted:
-            write_txt_file(
-                arguments.failed_file_log,
-                filename,
-                error_msg_interpreted,
+        if arguments.aggregate:
+            run_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+            for output in ["all_variants", "clinvar_variants"]:
+                self.aggregates[output] = AggregateCsvWriter(
+                    f"{arguments.outdir}run_{run_time}_{output}.csv"
+                )
+        if not arguments.no_dx_upload:
+            self.dx = DXClient(
+                arguments.token,
+                config_variable["info"]["csv_projectID"],
+                dx_backend,
             )
-            shutil.move(filename, arguments.failed_dir)
-            continue
-        df_final = df_final[
-            [
-                "Local ID",
-                "Linking ID",
-                "Organisation ID",
-                "Gene symbol",
-                "Chromosome",
-                "Start",
-                "Reference allele",
-                "Alternate allele",
-                "R code",
-                "Preferred condition name",
-                "Germline classification",
-                "Date last evaluated",
-                "Comment on classification",
-                "Collection method",
-                "Allele origin",
-                "Affected status",
-                "HGVSc",
-                "Consequence",
-                "Interpreted",
-                "Comment",
-                "Instrument ID",
-                "Specimen ID",
-                "Batch ID",
-                "Test code",
-                "Probeset ID",
-                "Panel",
-                "Ref genome",
-                "Organisation",
-                "Institution",
-                "Associated disease",
-                "Known inheritance",
-                "Prevalence",
-                "PVS1",
-                "PVS1_evidence",
-                "PS1",
-                "PS1_evidence",
-                "PS2",
-                "PS2_evidence",
-                "PS3",
-                "PS3_evidence",
-                "PS4",
-                "PS4_evidence",
-                "PM1",
-                "PM1_evidence",
-                "PM2",
-                "PM2_evidence",
-                "PM3",
-                "PM3_evidence",
-                "PM4",
-                "PM4_evidence",
-                "PM5",
-                "PM5_evidence",
-                "PM6",
-                "PM6_evidence",
-                "PP1",
-                "PP1_evidence",
-                "PP2",
-                "PP2_evidence",
-                "PP3",
-                "PP3_evidence",
-                "PP4",
-                "PP4_evidence",
-                "BS1",
-                "BS1_evidence",
-                "BS2",
-                "BS2_evidence",
-                "BS3",
-                "BS3_evidence",
-                "BA1",
-                "BA1_evidence",
-                "BP2",
-                "BP2_evidence",
-                "BP3",
-                "BP3_evidence",
-                "BS4",
-                "BS4_evidence",
-                "BP1",
-                "BP1_evidence",
-                "BP4",
-                "BP4_evidence",
-                "BP5",
-                "BP5_evidence",
-                "BP7",
-                "BP7_evidence",
-            ]
-        ]
-        if empty_workbook:
-            df_final.fillna("null", inplace=True)
-        else:
-            df_final["Germline classification"] = df_final[
-                "Germline classification"
-            ].replace(
-                {
-                    "Likely Pathogenic": "Likely pathogenic",
-                    "Uncertain Significance": "Uncertain significance",
-                    "Likely Benign": "Likely benign",
-                }
+            self.uploader = Uploader(
+                self.dx.upload_local_file,
+                arguments.upload_workers,
+                arguments.upload_retries,
             )
-            if (df_final.Interpreted == "yes").sum() > 0 and list(
-                df_final["Ref genome"].unique()
-            )[0] != "not_defined":
-                df_clinvar = df_final[df_final["Interpreted"] == "yes"]
-                df_clinvar = df_clinvar[
-                    [
-                        "Local ID",
-                        "Linking ID",
-                        "Organisation ID",
-                        "Gene symbol",
-                        "Chromosome",
-                        "Start",
-                        "Reference allele",
-                        "Alternate allele",
-                        "Preferred condition name",
-                        "Germline classification",
-                        "Date last evaluated",
-                        "Comment on classification",
-                        "Collection method",
-                        "Allele origin",
-                        "Affected status",
-                        "Ref genome",
-                        "HGVSc",
-                        "Consequence",
-                        "Interpreted",
-                        "Instrument ID",
-                        "Specimen ID",
-                    ]
-                ]
+        self.staging = None
+        if arguments.staging_dir:
+            self.staging = StagingArea(
+                arguments.staging_dir,
+                arguments.commit_batch,
+                None if arguments.no_dx_upload else self.upload_csv,
+            )
+
+    def record(
+        self,
+        filename: str,
+        result: tuple,
+        spans: list = None,
+        cached: bool = False,
+    ) -> None:
+        """
+        write the outputs of a parsed workbook and move it to the
+        completed or failed dir, then write its trace spans and add its
+        result to the result cache
+
+        Parameters
+        ----------
+          variant workbook file name
+          tuple returned by parse_workbook
+          list of trace spans of parsing the workbook (optional)
+          boolean for whether the result is from the result cache
+        """
+        trace = self.tracer.workbook(filename)
+        try:
+            self.record_outputs(filename, result, trace, cached)
+        finally:
+            self.tracer.write((spans or []) + (trace.spans or []))
+        if self.result_cache is None or cached:
+            return
+        key = self.result_cache.keys[filename]
+        if self.staging is None:
+            self.result_cache.put(key, result)
+        else:
+            self.staged_results.append((key, result))
+
+    def record_outputs(
+        self,
+        filename: str,
+        result: tuple,
+        trace: WorkbookTrace,
+        cached: bool = False,
+    ) -> None:
+        """
+        write the outputs of a parsed workbook and move it to the
+        completed or failed dir. A workbook with the content of a parsed
+        workbook under another name is only logged as parsed, as its
+        variants were already written and submitted to ClinVar
+
+        Parameters
+        ----------
+          variant workbook file name
+          tuple returned by parse_workbook
+          WorkbookTrace to add the spans of the stages to
+          boolean for whether the result is from the result cache
+        """
+        arguments = self.arguments
+        df_final, df_clinvar, error_msg, warning_msg = result
+        if error_msg:
+            with trace.span("write_logs"):
+                self.write_log(arguments.failed_file_log, filename, error_msg)
+            with trace.span("move_workbook") as span:
+                span["outcome"] = "failed"
+                self.move_workbook(filename, arguments.failed_dir)
+            return
+        if cached:
+            with trace.span("write_logs"):
+                self.write_log(arguments.parsed_file_log, filename, "")
+            print(filename, "is a copy of a parsed workbook")
+            with trace.span("move_workbook"):
+                self.move_workbook(filename, arguments.completed_dir)
+            return
+        with trace.span("write_outputs") as span:
+            if df_clinvar is not None:
+                span["clinvar_rows"] = df_clinvar.shape[0]
                 df_clinvar.to_csv(
+                    self.output_file(
+                        arguments.outdir
+                        + Path(filename).stem
+                        + "_clinvar_variants.csv"
+                    ),
+                    index=False,
+                )
+                if "clinvar_variants" in self.aggregates:
+                    self.aggregates["clinvar_variants"].write(
+                        Path(filename).name, df_clinvar
+                    )
+            span["rows"] = df_final.shape[0]
+            df_final.to_csv(
+                self.output_file(
                     arguments.outdir
                     + Path(filename).stem
-                    + "_clinvar_variants.csv",
-                    index=False,
+                    + "_all_variants.csv"
+                ),
+                index=False,
+            )
+            if arguments.parquet_dir:
+                write_parquet(df_final, arguments.parquet_dir, filename)
+            if "all_variants" in self.aggregates:
+                self.aggregates["all_variants"].write(
+                    Path(filename).name, df_final
                 )
-                write_txt_file(
+        with trace.span("write_logs"):
+            if df_clinvar is not None:
+                self.write_log(
                     arguments.clinvar_file_log,
                     filename,
                     "",
                 )
-                if not no_dx_upload:
-                    dx_login(arguments.token)
-                    now = datetime.now()
-                    print("uploading clinvar csv to DNAnexus")
-                    if clinvar_count == 0:
-                        folder_name = (
-                            "csvs_"
-                            + now.strftime("%Y%m%d")
-                            + "_"
-                            + now.strftime("%H%M%S")
-                        )
-                        project = dxpy.DXProject(
-                            config_variable["info"]["csv_projectID"]
-                        )
-                        project.new_folder(
-                            folder=arguments.subfolder
-                            + folder_name)
-                    dxpy.upload_local_file(
-                            arguments.outdir
-                            + Path(filename).stem
-                            + "_clinvar_variants.csv",
-                            project=config_variable["info"]["csv_projectID"],
-                            folder=arguments.subfolder
-                            + folder_name
-                        )
-                clinvar_count = clinvar_count + 1
-            elif list(df_final["Ref genome"].unique())[0] == "not_defined":
-                write_txt_file(
+            elif warning_msg:
+                self.write_log(
                     arguments.failed_file_log,
                     filename,
-                    "Ref_genome_not_defined",
+                    warning_msg,
                 )
-        df_final.to_csv(
-            arguments.outdir + Path(filename).stem + "_all_variants.csv",
-            index=False,
-        )
-        write_txt_file(arguments.parsed_file_log, filename, "")
+            self.write_log(arguments.parsed_file_log, filename, "")
+        if df_clinvar is not None:
+            if not arguments.no_dx_upload and self.staging is not None:
+                # the csv is uploaded once it is committed
+                self.staging.upload_after_commit(
+                    arguments.outdir
+                    + Path(filename).stem
+                    + "_clinvar_variants.csv"
+                )
+            elif not arguments.no_dx_upload:
+                with trace.span("queue_upload"):
+                    self.upload_clinvar_csv(filename)
+            self.clinvar_count = self.clinvar_count + 1
         print("Successfully parsed", filename)
-        shutil.move(filename, arguments.completed_dir)
+        with trace.span("move_workbook"):
+            self.move_workbook(filename, arguments.completed_dir)
+
+    def upload_clinvar_csv(self, filename: str) -> None:
+        """
+        upload the clinvar csv of a workbook to DNAnexus
+
+        Parameters
+        ----------
+          variant workbook file name
+        """
+        self.upload_csv(
+            self.arguments.outdir
+            + Path(filename).stem
+            + "_clinvar_variants.csv"
+        )
 
-    # uploading log files to dnanexus project for backup
-    pf_base_name = Path(arguments.parsed_file_log).stem
-    cf_base_name = Path(arguments.clinvar_file_log).stem
-    now = datetime.now()
-    if not no_dx_upload:
+    def upload_csv(self, csv: str) -> None:
+        """
+        upload a clinvar csv to DNAnexus, creating the csvs folder for
+        this run on the first upload
+
+        Parameters
+        ----------
+          str for csv file name
+        """
+        arguments = self.arguments
+        print("uploading clinvar csv to DNAnexus")
+        if self.folder_name is None:
+            now = datetime.now()
+            self.folder_name = (
+                "csvs_"
+                + now.strftime("%Y%m%d")
+                + "_"
+                + now.strftime("%H%M%S")
+            )
+        self.dx.new_folder(arguments.subfolder + self.folder_name)
+        self.uploader.submit(
+            csv, folder=arguments.subfolder + self.folder_name
+        )
+
+    def record_workbooks(
+        self, input_file: list, cached: set, recorded=None
+    ) -> None:
+        """
+        parse the workbooks and record each of them in input order. With
+        --staging_dir, they are parsed and recorded in batches of
+        --commit_batch workbooks, each committed before the next batch.
+        The workbooks recorded before an error are also committed
+
+        Parameters
+        ----------
+          list of variant workbook file names
+          set of variant workbook file names to serve from the cache
+          callable called with the file name and result of each
+          recorded workbook (optional)
+        """
+        if self.staging is None:
+            self.parse_and_record(input_file, cached, recorded)
+            return
+        batch_size = self.staging.batch_size
+        try:
+            for start in range(0, len(input_file), batch_size):
+                self.parse_and_record(
+                    input_file[start:start + batch_size], cached, recorded
+                )
+                self.commit()
+        finally:
+            self.commit()
+
+    def parse_and_record(
+        self, input_file: list, cached: set, recorded=None
+    ) -> None:
+        """
+        parse the workbooks and record each of them in input order, in
+        the staged pipeline with --pipeline
+
+        Parameters
+        ----------
+          list of variant workbook file names
+          set of variant workbook file names to serve from the cache
+          callable called with the file name and result of each
+          recorded workbook (optional)
+        """
+        arguments = self.arguments
+        if arguments.pipeline:
+            self.pipeline_workbooks(input_file, cached, recorded)
+            return
+        for filename, result, spans in parse_workbooks(
+            input_file,
+            self.config_variable,
+            arguments.unusual_sample_name,
+            arguments.reader,
+            arguments.workers,
+            self.tracer.enabled,
+            self.result_cache,
+            cached,
+            self.sheet_cache,
+            self.staging,
+        ):
+            self.record(filename, result, spans, filename in cached)
+            if recorded is not None:
+                recorded(filename, result)
+
+    def pipeline_workbooks(
+        self, input_file: list, cached: set, recorded=None
+    ) -> None:
+        """
+        parse and record the workbooks in a StagedPipeline: the next
+        --prefetch workbooks are read from disk in a thread while the
+        current ones are parsed, in --workers processes or in a thread,
+        and recorded one at a time in input order in another thread
+
+        Parameters
+        ----------
+          list of variant workbook file names
+          set of variant workbook file names to serve from the cache
+          callable called with the file name and result of each
+          recorded workbook (optional)
+        """
+        arguments = self.arguments
+        result_cache = self.result_cache
+
+        def fetch(filename: str):
+            if filename in cached:
+                return result_cache.get(result_cache.keys[filename])
+            data = None
+            if result_cache is not None:
+                data = result_cache.data.pop(filename, None)
+            if self.staging is not None:
+                return self.staging.read(filename, data)
+            if data is not None:
+                return data
+            with open(filename, "rb") as file:
+                return file.read()
+
+        def submit(filename: str, payload) -> Future:
+            if filename in cached:
+                future = Future()
+                future.set_result((payload, None))
+                return future
+            return executor.submit(
+                parse_workbook_spans,
+                filename,
+                self.config_variable,
+                arguments.unusual_sample_name,
+                arguments.reader,
+                self.tracer.enabled,
+                self.sheet_cache,
+                payload,
+            )
+
+        def record(filename: str, parsed: tuple) -> None:
+            result, spans = parsed
+            self.record(filename, result, spans, filename in cached)
+            if recorded is not None:
+                recorded(filename, result)
+
+        if arguments.workers > 1:
+            executor = id_process_pool(arguments.workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            StagedPipeline(
+                fetch, submit, record, arguments.prefetch, arguments.workers
+            ).run(input_file)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def commit(self) -> None:
+        """
+        commit the outputs, log lines and moves of the workbooks staged
+        since the last commit to the output dirs
+        """
+        trace = self.tracer.workbook(self.arguments.staging_dir)
+        with trace.span("commit") as span:
+            committed = self.staging.commit()
+            span["workbooks"] = committed
+        # the results are cached only once their outputs are committed,
+        # so a workbook whose commit failed is not taken for a copy
+        for key, result in self.staged_results:
+            self.result_cache.put(key, result)
+        self.staged_results = []
+        if committed:
+            print("Committed", committed, "workbook(s)")
+            self.tracer.write(trace.spans)
+
+    def output_file(self, path: str) -> str:
+        """
+        get the file to write an output to, its staged copy with
+        --staging_dir
+
+        Parameters
+        ----------
+          str for output file name
+
+        Return
+        ------
+          str for file name to write to
+        """
+        if self.staging is None:
+            return path
+        return self.staging.output(path)
+
+    def write_log(self, txt_file_name: str, filename: str, msg: str) -> None:
+        """
+        write a line to a txt file output, or stage it with --staging_dir
+
+        Parameters
+        ----------
+          str for output txt file name
+          variant workbook file name
+          str for error message
+        """
+        if self.staging is None:
+            write_txt_file(txt_file_name, filename, msg)
+        else:
+            self.staging.append_log(txt_file_name, log_line(filename, msg))
+
+    def move_workbook(self, filename: str, dest_dir: str) -> None:
+        """
+        move a workbook to the completed or failed dir, or stage the move
+        with --staging_dir
+
+        Parameters
+        ----------
+          variant workbook file name
+          str for completed or failed dir
+        """
+        if self.staging is None:
+            shutil.move(filename, dest_dir)
+        else:
+            self.staging.move(filename, dest_dir)
+
+    def close_aggregates(self) -> None:
+        """
+        close the aggregated csvs of the run
+        """
+        for writer in self.aggregates.values():
+            writer.close()
+            if writer.rows:
+                print("Written", writer.rows, "rows to", writer.path)
+
+    def upload_logs(self) -> None:
+        """
+        upload the log files to DNAnexus project for backup, then wait for
+        all the uploads of the run and report their results. Raise an
+        error if any upload still failed after all retries
+        """
+        arguments = self.arguments
+        if arguments.no_dx_upload:
+            return
+        now = datetime.now()
         print("uploading log file(s) to DNAnexus")
-        dx_login(arguments.token)
-        dxpy.upload_local_file(
-            arguments.parsed_file_log,
-            project=config_variable["info"]["csv_projectID"],
-            folder="/parser_logs/",
-            name=pf_base_name
-            + "_"
-            + now.strftime("%Y%m%d")
-            + "_"
-            + now.strftime("%H%M%S")
-            + ".txt",
+        log_files = [arguments.parsed_file_log]
+        if os.path.isfile(arguments.clinvar_file_log):
+            log_files.append(arguments.clinvar_file_log)
+        for log_file in log_files:
+            self.uploader.submit(
+                log_file,
+                folder="/parser_logs/",
+                name=Path(log_file).stem
+                + "_"
+                + now.strftime("%Y%m%d")
+                + "_"
+                + now.strftime("%H%M%S")
+                + ".txt",
+            )
+        results = self.uploader.wait()
+        self.tracer.write([result.span() for result in results])
+        if self.staging is not None:
+            self.staging.uploaded(
+                [result.path for result in results if result.uploaded]
+            )
+        failed = [result.path for result in results if not result.uploaded]
+        if failed:
+            raise RuntimeError(
+                "failed to upload file(s) to DNAnexus: " + ", ".join(failed)
+            )
+
+
+class WatchStats:
+    """
+    Counters of a --watch run: workbooks waiting for their size to stop
+    changing, workbooks queued for parsing and workbooks processed
+    """
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.waiting = 0
+        self.queued = 0
+        self.parsed = 0
+        self.failed = 0
+
+    def to_dict(self) -> dict:
+        """
+        counters with the throughput in workbooks per minute
+
+        Return
+        ------
+          dict of counters
+        """
+        minutes = (time.monotonic() - self.started) / 60
+        processed = self.parsed + self.failed
+        return {
+            "waiting": self.waiting,
+            "queued": self.queued,
+            "parsed": self.parsed,
+            "failed": self.failed,
+            "workbooks_per_minute": processed / minutes if minutes else 0,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def write(self, status_file: str) -> None:
+        """
+        write the counters to a json file, replacing it in one step
+
+        Parameters
+        ----------
+          str for json status file
+        """
+        with open(status_file + ".tmp", "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(status_file + ".tmp", status_file)
+
+
+def watch_folder(
+    arguments: argparse.Namespace,
+    config_variable: dict,
+    run: ParserRun,
+    parsed_list,
+    stop: threading.Event,
+) -> WatchStats:
+    """
+    poll the input dir and parse each new workbook once its size and
+    modification time are the same in two polls in a row. When stop is
+    set, the workbooks already queued are parsed before returning. With
+    a result cache, a workbook already parsed is checked again only if
+    its size or modification time change
+
+    Parameters
+    ----------
+      Namespace of command line argument inputs
+      dict from config file
+      ParserRun recording the parsed workbooks
+      set or ParsedIndex of previously parsed workbooks
+      threading.Event set to stop watching
+
+    Return
+    ------
+      WatchStats of the run
+    """
+    stats = WatchStats()
+    last_seen = {}
+    already_parsed = {}
+
+    def recorded(filename: str, result: tuple) -> None:
+        stats.queued = stats.queued - 1
+        if result[2]:
+            stats.failed = stats.failed + 1
+        else:
+            stats.parsed = stats.parsed + 1
+            parsed_list.add(Path(filename).stem + ".xlsx")
+        if arguments.watch_status:
+            stats.write(arguments.watch_status)
+
+    while True:
+        seen = {}
+        ready = []
+        for filename in sorted(glob.glob(arguments.indir + "*.xlsx")):
+            # skip the lock files Excel creates next to open workbooks
+            if Path(filename).name.startswith("~$"):
+                continue
+            if run.result_cache is None and (
+                (Path(filename).stem + ".xlsx") in parsed_list
+            ):
+                if filename not in already_parsed:
+                    print(filename, "is already parsed")
+                    already_parsed[filename] = None
+                continue
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            if already_parsed.get(filename) == (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                continue
+            seen[filename] = (stat.st_size, stat.st_mtime_ns)
+            if stat.st_size and last_seen.get(filename) == seen[filename]:
+                ready.append(filename)
+        last_seen = {
+            filename: size
+            for filename, size in seen.items()
+            if filename not in ready
+        }
+        selected, cached = select_workbooks(
+            ready, parsed_list, run.result_cache
         )
-    if not no_dx_upload and os.path.isfile(arguments.clinvar_file_log):
-        dxpy.upload_local_file(
-            arguments.clinvar_file_log,
-            project=config_variable["info"]["csv_projectID"],
-            folder="/parser_logs/",
-            name=cf_base_name
-            + "_"
-            + now.strftime("%Y%m%d")
-            + "_"
-            + now.strftime("%H%M%S")
-            + ".txt",
+        for filename in ready:
+            if filename not in selected:
+                already_parsed[filename] = seen[filename]
+        stats.waiting = len(last_seen)
+        stats.queued = len(selected)
+        if arguments.watch_status:
+            stats.write(arguments.watch_status)
+        run.record_workbooks(selected, cached, recorded)
+        if selected:
+            print("Watch status:", stats.to_dict())
+        if stop.is_set():
+            return stats
+        stop.wait(arguments.poll_interval)
+
+
+def main():
+    arguments = get_command_line_args(sys.argv[1:])
+    if arguments.validate_only and arguments.watch:
+        raise RuntimeError("--validate_only cannot be used with --watch")
+    if (
+        not arguments.validate_only
+        and not arguments.no_dx_upload
+        and not arguments.token
+    ):
+        raise RuntimeError(
+            "--no_dx_upload=False but no DNAnexus token provided via --token"
         )
+    if arguments.parquet_dir and not importlib.util.find_spec("pyarrow"):
+        raise RuntimeError("--parquet_dir needs pyarrow to be installed")
+    if arguments.sheet_cache and arguments.reader != "native":
+        raise RuntimeError("--sheet_cache needs --reader native")
+    if not 0 <= arguments.node_id < 1 << ID_NODE_BITS:
+        raise RuntimeError("--node_id needs to be from 0 to 63")
+    if arguments.workers >= 1 << ID_SLOT_BITS:
+        raise RuntimeError("--workers needs to be at most 63")
+    set_id_node(arguments.node_id)
+    if arguments.staging_dir:
+        replayed = replay_journal(arguments.staging_dir)
+        if replayed:
+            print("Committed", replayed, "workbook(s) of an interrupted run")
+    input_dir = arguments.indir
+    if arguments.watch:
+        input_file = []
+    elif arguments.file:
+        input_file = []
+        for idx, file in enumerate(arguments.file):
+            input_file.append(glob.glob(input_dir + file)[0])
+    else:
+        input_file = glob.glob(input_dir + "*.xlsx")
+    if len(input_file) == 0 and not arguments.watch:
+        print("Input file(s) not exist")
+    with open(arguments.config) as f:
+        config_variable = json.load(f)
+    # compile the validation rules once, failing early on invalid rules
+    load_rules(config_variable)
+    if arguments.validate_only:
+        sheet_cache = None
+        if arguments.sheet_cache:
+            sheet_cache = SheetCache(
+                arguments.sheet_cache, arguments.sheet_cache_size * 1024**2
+            )
+        failed = validate_workbooks(
+            input_file,
+            config_variable,
+            arguments.unusual_sample_name,
+            arguments.reader,
+            sheet_cache,
+        )
+        print(
+            len(input_file) - len(failed), "passed,", len(failed), "failed"
+        )
+        if failed:
+            sys.exit(1)
+        return
+    check_and_create_folder(arguments.outdir)
+    check_and_create_folder(arguments.completed_dir)
+    check_and_create_folder(arguments.failed_dir)
+    if not os.path.isfile(arguments.parsed_file_log):
+        with open(arguments.parsed_file_log, "w") as file:
+            file.close()
+    if arguments.parsed_index:
+        parsed_list = ParsedIndex(
+            arguments.parsed_file_log, arguments.parsed_index
+        )
+    else:
+        parsed_list = set(get_parsed_list(arguments.parsed_file_log))
+    run = ParserRun(arguments, config_variable)
+    to_parse, cached = select_workbooks(
+        input_file, parsed_list, run.result_cache
+    )
+    if arguments.watch:
+        stop = threading.Event()
+        for signum in [signal.SIGTERM, signal.SIGINT]:
+            signal.signal(signum, lambda signum, frame: stop.set())
+        print("Watching", input_dir)
+        watch_folder(arguments, config_variable, run, parsed_list, stop)
+    # extract fields from variant workbooks as df and merged
+    run.record_workbooks(to_parse, cached)
+    if arguments.parsed_index:
+        parsed_list.close()
+
+    run.close_aggregates()
+    run.upload_logs()
+    if run.staging is not None:
+        run.staging.close()
+    run.tracer.close()
     print("Done")
 
 
@@ -0,0 +1,504 @@
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+from variant_workbook_parser import FIELD_CELLS
+from validation_rules import load_rules
+
+# errors that can be put in a generated workbook, with the check of the
+# parser that fails on them
+ERRORS = {
+    "summary_layout": "checking_sheets",
+    "interpret_layout": "checking_sheets",
+    "sample_name": "check_sample_name",
+    "evaluated_date": "get_summary_fields",
+    "empty_interpreted": "parse_workbook",
+    "empty_classification": "check_interpret_table",
+    "wrong_classification": "check_interpret_table",
+    "empty_hgvsc": "check_interpret_table",
+    "wrong_hgvsc": "check_interpret_table",
+    "wrong_strength": "check_interpret_table",
+    "wrong_interpreted": "check_interpreted_col",
+    "wrong_interpreted_dropdown": "check_interpreted_col",
+}
+# errors in an interpret sheet, which need at least one interpreted variant
+INTERPRET_ERRORS = [
+    "empty_classification",
+    "wrong_classification",
+    "empty_hgvsc",
+    "wrong_hgvsc",
+    "wrong_strength",
+    "wrong_interpreted",
+]
+
+# genes the variants are picked from, with chromosome, start of the
+# region, transcript, associated disease and inheritance
+GENES = [
+    ("BRCA1", "17", 41196312, "NM_007294.4", "Breast-ovarian cancer", "AD"),
+    ("BRCA2", "13", 32889617, "NM_000059.4", "Breast-ovarian cancer", "AD"),
+    ("TSC1", "9", 135766735, "NM_000368.5", "Tuberous sclerosis", "AD"),
+    ("TSC2", "16", 2097466, "NM_000548.5", "Tuberous sclerosis", "AD"),
+    ("PALB2", "16", 23614780, "NM_024675.4", "Breast cancer", "AD"),
+    ("CFTR", "7", 117120017, "NM_000492.4", "Cystic fibrosis", "AR"),
+]
+CONSEQUENCES = [
+    "missense_variant",
+    "synonymous_variant",
+    "stop_gained",
+    "frameshift_variant",
+    "intron_variant&splice_region_variant",
+]
+CLINICAL_INDICATIONS = [
+    "R208.1_Inherited breast cancer and ovarian cancer_P",
+    "R207.1_Inherited ovarian cancer (without breast cancer)_P",
+    "R444.1_NICE approved PARP inhibitor treatment_P",
+]
+INCLUDED_COLUMNS = [
+    "CHROM",
+    "POS",
+    "REF",
+    "ALT",
+    "GT",
+    "SYMBOL",
+    "HGVSc",
+    "HGVSp",
+    "Consequence",
+    "IMPACT",
+    "Transcript",
+    "Comment",
+    "Interpreted",
+]
+# labels of the interpret sheet, the criteria labels are written next to
+# the strength cells of FIELD_CELLS
+INTERPRET_LABELS = {
+    "B2": "Gene",
+    "C2": "HGVSc",
+    "D2": "HGVSp",
+    "B4": "Associated disease",
+    "B5": "Known inheritance",
+    "B6": "Prevalence",
+    "C8": "EVIDENCE",
+    "G8": "PATHOGENIC",
+    "H8": "P_STRENGTH",
+    "I8": "P_POINTS",
+    "J8": "BENIGN",
+    "K8": "B_STRENGTH",
+    "L8": "B_POINTS",
+    "B26": "FINAL ACMG CLASSIFICATION",
+    "G26": "POINTS",
+}
+BASES = "ACGT"
+
+
+def get_command_line_args(arguments=None) -> argparse.Namespace:
+    """
+    Parse command line arguments
+
+    Returns
+    -------
+    args : Namespace
+        Namespace of command line argument inputs
+    """
+    arg_parser = argparse.ArgumentParser(
+        description=(
+            "write synthetic variant workbooks in the layout parsed by "
+            "variant_workbook_parser.py, optionally with errors"
+        )
+    )
+    arg_parser.add_argument(
+        "--outdir",
+        "--o",
+        required=True,
+        help=(
+            "dir to write the workbooks to, named after the CUH or NUH "
+            "folder of the parser config"
+        ),
+    )
+    arg_parser.add_argument(
+        "--count",
+        "--n",
+        type=int,
+        default=1,
+        help="number of workbooks to write",
+    )
+    arg_parser.add_argument(
+        "--variants",
+        type=int,
+        default=10,
+        help="number of variants in the included sheet of each workbook",
+    )
+    arg_parser.add_argument(
+        "--interpreted",
+        type=int,
+        default=2,
+        help="number of interpreted variants, one interpret sheet each",
+    )
+    arg_parser.add_argument(
+        "--errors",
+        nargs="+",
+        choices=list(ERRORS),
+        default=list(ERRORS),
+        help="errors to pick from for the workbooks with an error",
+    )
+    arg_parser.add_argument(
+        "--error_rate",
+        type=float,
+        default=0.0,
+        help="fraction of the workbooks with one of the --errors",
+    )
+    arg_parser.add_argument(
+        "--seed",
+        type=int,
+        help="seed of the random generator, for reproducible workbooks",
+    )
+
+    return arg_parser.parse_args(arguments)
+
+
+def random_sample_name(rng: random.Random) -> str:
+    """
+    make a sample name in the format checked by check_sample_name
+
+    Parameters
+    ----------
+      random generator
+
+    Return
+    ------
+      str for sample name
+    """
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    return "-".join(
+        [
+            str(rng.randrange(10**8, 10**9)),
+            f"{rng.randrange(10**5):05}{rng.choice(letters)}"
+            f"{rng.randrange(10**4):04}",
+            f"{rng.randrange(10, 100)}NGCEN{rng.randrange(1, 100)}",
+            f"{rng.randrange(10**4):04}",
+            rng.choice("FMU"),
+            f"{rng.randrange(10**7, 10**8)}",
+        ]
+    )
+
+
+def random_variants(rng: random.Random, variants: int) -> list:
+    """
+    make the rows of the included sheet, with a different HGVSc per row
+
+    Parameters
+    ----------
+      random generator
+      int for number of variants
+
+    Return
+    ------
+      list of dict of included sheet values per variant
+    """
+    rows = []
+    positions = set()
+    while len(rows) < variants:
+        gene, chrom, start, transcript, _, _ = rng.choice(GENES)
+        offset = rng.randrange(1, 100000)
+        if (gene, offset) in positions:
+            continue
+        positions.add((gene, offset))
+        ref, alt = rng.sample(BASES, 2)
+        rows.append(
+            {
+                "CHROM": chrom,
+                "POS": start + offset,
+                "REF": ref,
+                "ALT": alt,
+                "GT": rng.choice(["0/1", "1/1"]),
+                "SYMBOL": gene,
+                "HGVSc": f"{transcript}:c.{offset}{ref}>{alt}",
+                "HGVSp": ".",
+                "Consequence": rng.choice(CONSEQUENCES),
+                "IMPACT": rng.choice(["HIGH", "MODERATE", "LOW"]),
+                "Transcript": transcript,
+                "Comment": None,
+                "Interpreted": "NO",
+            }
+        )
+
+    return rows
+
+
+def write_summary(workbook, rng: random.Random, variants: int) -> None:
+    """
+    write the summary sheet with the cells read by the parser
+
+    Parameters
+    ----------
+      openpyxl workbook
+      random generator
+      int for number of variants in the included sheet
+    """
+    summary = workbook.create_sheet("summary")
+    indications = rng.sample(CLINICAL_INDICATIONS, rng.randint(1, 2))
+    cells = {
+        "A1": "Sample ID:",
+        "B1": random_sample_name(rng),
+        "E1": "Clinical Indication(s):",
+        "F1": ";".join(indications),
+        "E2": "Panel(s):",
+        "F2": ";".join(
+            indication.split("_")[1] + "_4.0" for indication in indications
+        ),
+        "B21": "Result",
+        "E21": "Date",
+        "G21": "Date",
+        "G22": datetime(2023, 1, 1) + timedelta(days=rng.randrange(700)),
+        "A38": "Total records:",
+        "B38": "included",
+        "C38": variants,
+        "B39": "excluded",
+        "C39": 0,
+        "A45": "Reference:",
+        "B45": "GRCh37.p13",
+    }
+    for address, value in cells.items():
+        summary[address] = value
+
+
+def criteria_list() -> list:
+    """
+    get the ACMG criteria with a dropdown in the interpret sheet from the
+    validation rules of the parser config
+
+    Return
+    ------
+      list of str for criteria, in the order of the rules
+    """
+    return [
+        column
+        for column in load_rules().dropdowns
+        if column != "Germline classification"
+    ]
+
+
+def write_interpret(
+    workbook, rng: random.Random, title: str, row: dict = None
+) -> object:
+    """
+    write an interpret sheet, filled in for a variant or left blank
+
+    Parameters
+    ----------
+      openpyxl workbook
+      random generator
+      str for sheet title
+      dict of included sheet values of the variant (optional)
+
+    Return
+    ------
+      openpyxl worksheet
+    """
+    sheet = workbook.create_sheet(title)
+    for address, value in INTERPRET_LABELS.items():
+        sheet[address] = value
+    for field, cell in FIELD_CELLS[5::2]:
+        label = chr(ord(cell[0]) - 1) + cell[1:]
+        sheet[label] = field
+    if row is None:
+        return sheet
+
+    disease, inheritance = next(
+        gene[4:] for gene in GENES if gene[0] == row["SYMBOL"]
+    )
+    sheet["C3"] = row["HGVSc"]
+    sheet["C4"] = disease
+    sheet["C5"] = inheritance
+    dropdowns = load_rules().dropdowns
+    sheet["C26"] = rng.choice(dropdowns["Germline classification"])
+    fields = dict(FIELD_CELLS)
+    for criteria in rng.sample(criteria_list(), rng.randint(1, 4)):
+        sheet[fields[criteria]] = rng.choice(dropdowns[criteria])
+        sheet[fields[f"{criteria}_evidence"]] = f"Evidence for {criteria}"
+
+    return sheet
+
+
+def add_error(
+    workbook, rng: random.Random, error: str, included: list
+) -> None:
+    """
+    put an error in a generated workbook
+
+    Parameters
+    ----------
+      openpyxl workbook
+      random generator
+      str for error, one of ERRORS
+      list of int for rows of the included sheet of interpreted variants
+    """
+    summary = workbook["summary"]
+    interpret = workbook[
+        rng.choice(
+            [
+                sheet
+                for sheet in workbook.sheetnames
+                if sheet.startswith("interpret")
+            ]
+        )
+    ]
+    fields = dict(FIELD_CELLS)
+    interpreted_col = INCLUDED_COLUMNS.index("Interpreted") + 1
+    if error == "summary_layout":
+        summary.insert_cols(1)
+    elif error == "interpret_layout":
+        interpret.insert_rows(1)
+    elif error == "sample_name":
+        summary["B1"] = summary["B1"].value.replace("NGCEN", "ngcen")
+    elif error == "evaluated_date":
+        summary["G22"] = "not a date"
+    elif error == "empty_interpreted":
+        row = rng.randrange(2, summary["C38"].value + 2)
+        workbook["included"].cell(row, interpreted_col).value = None
+    elif error == "empty_classification":
+        interpret["C26"] = None
+    elif error == "wrong_classification":
+        interpret["C26"] = "Probably Pathogenic"
+    elif error == "empty_hgvsc":
+        interpret["C3"] = None
+    elif error == "wrong_hgvsc":
+        interpret["C3"] = interpret["C3"].value + "del"
+    elif error == "wrong_strength":
+        criteria = rng.choice(criteria_list())
+        interpret[fields[criteria]] = "Very Very Strong"
+    elif error == "wrong_interpreted":
+        row = rng.choice(included)
+        workbook["included"].cell(row, interpreted_col).value = "NO"
+    elif error == "wrong_interpreted_dropdown":
+        row = rng.randrange(2, summary["C38"].value + 2)
+        workbook["included"].cell(row, interpreted_col).value = "MAYBE"
+
+
+def generate_workbook(
+    filename: str,
+    variants: int = 10,
+    interpreted: int = 2,
+    error: str = None,
+    seed: int = None,
+) -> None:
+    """
+    write a variant workbook with random variants, in the layout parsed
+    by variant_workbook_parser.py
+
+    Parameters
+    ----------
+      str for output workbook file name
+      int for number of variants in the included sheet
+      int for number of interpreted variants, one interpret sheet each
+      str for error to put in the workbook, one of ERRORS (optional)
+      int for seed of the random generator (optional)
+    """
+    from openpyxl import Workbook
+
+    if interpreted > variants:
+        raise ValueError(
+            f"Cannot interpret {interpreted} of {variants} variants"
+        )
+    if error is not None and error not in ERRORS:
+        raise ValueError(f"Unknown error {error}")
+    if error in INTERPRET_ERRORS and not interpreted:
+        raise ValueError(f"Error {error} needs an interpreted variant")
+    if error in ["empty_interpreted", "wrong_interpreted_dropdown"] and (
+        not variants
+    ):
+        raise ValueError(f"Error {error} needs a variant")
+    rng = random.Random(seed)
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    write_summary(workbook, rng, variants)
+
+    rows = random_variants(rng, variants)
+    included = sorted(rng.sample(range(variants), interpreted))
+    for idx in included:
+        rows[idx]["Interpreted"] = "YES"
+        write_interpret(
+            workbook, rng, f"interpret_{len(workbook.sheetnames)}", rows[idx]
+        )
+    if not interpreted:
+        # workbooks always have at least one interpret sheet
+        write_interpret(workbook, rng, "interpret_1")
+    sheet = workbook.create_sheet("included")
+    sheet.append(INCLUDED_COLUMNS)
+    for row in rows:
+        sheet.append([row[column] for column in INCLUDED_COLUMNS])
+    workbook.create_sheet("excluded").append(INCLUDED_COLUMNS)
+
+    if error is not None:
+        add_error(workbook, rng, error, [idx + 2 for idx in included])
+    workbook.save(filename)
+
+
+def generate_workbooks(
+    outdir: str,
+    count: int,
+    variants: int = 10,
+    interpreted: int = 2,
+    errors: list = None,
+    error_rate: float = 0.0,
+    seed: int = None,
+) -> list:
+    """
+    write a set of variant workbooks, a fraction of them with an error
+
+    Parameters
+    ----------
+      str for output dir
+      int for number of workbooks
+      int for number of variants in each workbook
+      int for number of interpreted variants in each workbook
+      list of str for errors to pick from (optional, default all ERRORS)
+      float for fraction of workbooks with an error
+      int for seed of the random generator (optional)
+
+    Return
+    ------
+      list of tuple of workbook file name and error, None if valid
+    """
+    rng = random.Random(seed)
+    if errors is None:
+        errors = list(ERRORS)
+    if not interpreted:
+        errors = [error for error in errors if error not in INTERPRET_ERRORS]
+    os.makedirs(outdir, exist_ok=True)
+    generated = []
+    for idx in range(count):
+        error = None
+        if errors and rng.random() < error_rate:
+            error = rng.choice(errors)
+        name = f"synthetic_{idx + 1:0{len(str(count))}}"
+        if error is not None:
+            name = f"{name}_{error}"
+        filename = os.path.join(outdir, f"{name}.xlsx")
+        generate_workbook(
+            filename, variants, interpreted, error, rng.getrandbits(64)
+        )
+        generated.append((filename, error))
+
+    return generated
+
+
+def main():
+    arguments = get_command_line_args()
+    generated = generate_workbooks(
+        arguments.outdir,
+        arguments.count,
+        arguments.variants,
+        arguments.interpreted,
+        arguments.errors,
+        arguments.error_rate,
+        arguments.seed,
+    )
+    errors = [error for _, error in generated if error is not None]
+    print(
+        f"{len(generated)} workbook(s) written to {arguments.outdir}, "
+        f"{len(errors)} with an error"
+    )
+
+
+if __name__ == "__main__":
+    main()
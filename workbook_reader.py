@@ -0,0 +1,899 @@
+import hashlib
+from io import BytesIO
+import posixpath
+import re
+import zipfile
+from xml.etree.ElementTree import fromstring, iterparse
+import numpy as np
+from openpyxl import load_workbook
+from openpyxl.styles import numbers
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.utils.datetime import (
+    CALENDAR_MAC_1904,
+    CALENDAR_WINDOWS_1900,
+    from_excel,
+    from_ISO8601,
+)
+import pandas as pd
+from pandas.io.parsers import TextParser
+from sheet_cache import SheetCache
+
+SHEET_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+DOCUMENT_REL_NS = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+)
+ROW_TAG = f"{{{SHEET_MAIN_NS}}}row"
+CELL_TAG = f"{{{SHEET_MAIN_NS}}}c"
+VALUE_TAG = f"{{{SHEET_MAIN_NS}}}v"
+TEXT_TAG = f"{{{SHEET_MAIN_NS}}}t"
+RUN_TAG = f"{{{SHEET_MAIN_NS}}}r"
+INLINE_STRING_TAG = f"{{{SHEET_MAIN_NS}}}is"
+STRING_ITEM_TAG = f"{{{SHEET_MAIN_NS}}}si"
+# index of the shared string of each shared string cell in a sheet part
+SHARED_STRING_CELL = re.compile(
+    rb'<(?:\w+:)?c\b[^>]*\bt="s"[^>]*>\s*<(?:\w+:)?v>(\d+)</(?:\w+:)?v>'
+)
+
+
+def read_workbook_data(filename: str, data: bytes = None) -> bytes:
+    """
+    read the bytes of a variant workbook, unless they were already read
+
+    Parameters
+    ----------
+      variant workbook file name
+      bytes of the workbook already read from disk (optional)
+
+    Return
+    ------
+      bytes of the workbook
+    """
+    if data is not None:
+        return data
+    with open(filename, "rb") as file:
+        return file.read()
+
+
+class VariantWorkbook:
+    """
+    Variant workbook read from disk once and loaded once, shared across
+    the parsing stages of variant_workbook_parser.py
+
+    Parameters
+    ----------
+      variant workbook file name
+      bytes of the workbook already read from disk (optional)
+    """
+
+    def __init__(self, filename: str, data: bytes = None) -> None:
+        self.filename = filename
+        self.data = read_workbook_data(filename, data)
+        self.workbook = load_workbook(BytesIO(self.data))
+
+    @property
+    def sheetnames(self) -> list:
+        """
+        names of all sheets in the workbook
+        """
+        return self.workbook.sheetnames
+
+    @property
+    def interpret_sheets(self) -> list:
+        """
+        names of interpret sheet(s) in the workbook
+        """
+        return [
+            idx
+            for idx in self.sheetnames
+            if idx.lower().startswith("interpret")
+        ]
+
+    def cell(self, sheet: str, address: str):
+        """
+        get the value of a single cell
+
+        Parameters
+        ----------
+          str for sheet name
+          str for cell address e.g. B1
+
+        Return
+        ------
+          cell value
+        """
+        return self.workbook[sheet][address].value
+
+    def lookup(
+        self,
+        sheet: str,
+        key_column: str,
+        key: str,
+        value_column: str,
+        default=None,
+    ):
+        """
+        get the value in value_column of the last row where key_column
+        equals key
+
+        Parameters
+        ----------
+          str for sheet name
+          str for column letter to search
+          value to search for
+          str for column letter to return the value from
+          value returned if key is not found
+
+        Return
+        ------
+          cell value
+        """
+        value = default
+        for cell in self.workbook[sheet][key_column]:
+            if cell.value == key:
+                value = self.workbook[sheet][f"{value_column}{cell.row}"].value
+
+        return value
+
+    def col_letter(self, sheet: str, col_name: str) -> str:
+        """
+        get the column letter with specific col name in the first row
+        of a sheet
+
+        Parameters
+        ----------
+          str for sheet name
+          str for name of column to get col letter
+
+        Return
+        ------
+          str for column letter for specific column name
+        """
+        col_letter = None
+        worksheet = self.workbook[sheet]
+        for column_cell in worksheet.iter_cols(1, worksheet.max_column):
+            if column_cell[0].value == col_name:
+                col_letter = column_cell[0].column_letter
+
+        return col_letter
+
+    def read_sheet(self, sheet: str, **kwargs) -> pd.DataFrame:
+        """
+        read a sheet as a data frame with pandas.read_excel using the
+        already loaded workbook
+
+        Parameters
+        ----------
+          str for sheet name
+          keyword arguments passed on to pandas.read_excel
+
+        Return
+        ------
+          data frame of sheet
+        """
+        # keep the ExcelFile for the life of the workbook, pandas closes
+        # the workbook when the ExcelFile is garbage collected
+        if getattr(self, "excel_file", None) is None:
+            self.excel_file = pd.ExcelFile(
+                self.values_workbook(), engine="openpyxl"
+            )
+
+        return pd.read_excel(self.excel_file, sheet_name=sheet, **kwargs)
+
+    def values_workbook(self):
+        """
+        get the workbook read_sheet reads from, giving the cached values
+        of formulas as pandas.read_excel does. The loaded workbook keeps
+        the formulas, so the bytes are read again by pandas
+
+        Return
+        ------
+          BytesIO of the workbook
+        """
+        return BytesIO(self.data)
+
+
+class ReadOnlyWorkbook(VariantWorkbook):
+    """
+    Variant workbook loaded with openpyxl in read-only mode, returning
+    the cached values of formulas and fetching only the cells the parser
+    needs from each sheet
+
+    Rows of a sheet are streamed and reading stops once the last needed
+    row is passed. All needed cells of a sheet are fetched in a single
+    pass the first time any of them is asked for.
+
+    Parameters
+    ----------
+      variant workbook file name
+      dict of cell addresses needed per sheet, interpret sheets share
+      the "interpret" key
+      bytes of the workbook already read from disk (optional)
+    """
+
+    def __init__(
+        self, filename: str, cells: dict, data: bytes = None
+    ) -> None:
+        self.filename = filename
+        self.data = read_workbook_data(filename, data)
+        self.workbook = load_workbook(
+            BytesIO(self.data), read_only=True, data_only=True
+        )
+        self.cells_needed = cells
+        self.fetched = {}
+
+    def values_workbook(self):
+        """
+        get the workbook read_sheet reads from, the loaded workbook as it
+        already has the cached values of formulas
+
+        Return
+        ------
+          openpyxl workbook
+        """
+        return self.workbook
+
+    def _cells_for_sheet(self, sheet: str) -> list:
+        """
+        get the cell addresses needed from a sheet
+
+        Parameters
+        ----------
+          str for sheet name
+
+        Return
+        ------
+          list of cell addresses
+        """
+        if sheet.lower().startswith("interpret"):
+            return self.cells_needed.get("interpret", [])
+        return self.cells_needed.get(sheet, [])
+
+    def _fetch(self, sheet: str, addresses: set) -> dict:
+        """
+        stream the rows of a sheet up to the last needed row and keep
+        only the values of the needed cells
+
+        Parameters
+        ----------
+          str for sheet name
+          set of cell addresses
+
+        Return
+        ------
+          dict of cell address to value
+        """
+        wanted = {}
+        for address in addresses:
+            row, col = coordinate_to_tuple(address)
+            wanted.setdefault(row, []).append((col, address))
+        max_row = max(wanted)
+        max_col = max(col for cols in wanted.values() for col, _ in cols)
+        values = dict.fromkeys(addresses)
+        rows = self.workbook[sheet].iter_rows(
+            min_row=1, max_row=max_row, max_col=max_col, values_only=True
+        )
+        for row_idx, row in enumerate(rows, start=1):
+            for col, address in wanted.get(row_idx, []):
+                if col <= len(row):
+                    values[address] = row[col - 1]
+
+        return values
+
+    def cell(self, sheet: str, address: str):
+        """
+        get the value of a single cell, fetching all the needed cells of
+        the sheet on first access
+
+        Parameters
+        ----------
+          str for sheet name
+          str for cell address e.g. B1
+
+        Return
+        ------
+          cell value
+        """
+        values = self.fetched.get(sheet, {})
+        if address not in values:
+            addresses = set(self._cells_for_sheet(sheet))
+            addresses.update(values)
+            addresses.add(address)
+            values = self._fetch(sheet, addresses)
+            self.fetched[sheet] = values
+
+        return values[address]
+
+    def lookup(
+        self,
+        sheet: str,
+        key_column: str,
+        key: str,
+        value_column: str,
+        default=None,
+    ):
+        """
+        get the value in value_column of the last row where key_column
+        equals key, streaming only the two columns
+
+        Parameters
+        ----------
+          str for sheet name
+          str for column letter to search
+          value to search for
+          str for column letter to return the value from
+          value returned if key is not found
+
+        Return
+        ------
+          cell value
+        """
+        key_idx = column_index_from_string(key_column)
+        value_idx = column_index_from_string(value_column)
+        min_col = min(key_idx, value_idx)
+        value = default
+        for row in self.workbook[sheet].iter_rows(
+            min_col=min_col,
+            max_col=max(key_idx, value_idx),
+            values_only=True,
+        ):
+            if row and row[key_idx - min_col] == key:
+                value = row[value_idx - min_col]
+
+        return value
+
+    def col_letter(self, sheet: str, col_name: str) -> str:
+        """
+        get the column letter with specific col name in the first row
+        of a sheet
+
+        Parameters
+        ----------
+          str for sheet name
+          str for name of column to get col letter
+
+        Return
+        ------
+          str for column letter for specific column name
+        """
+        col_letter = None
+        header = next(
+            self.workbook[sheet].iter_rows(max_row=1, values_only=True), ()
+        )
+        for idx, value in enumerate(header, start=1):
+            if value == col_name:
+                col_letter = get_column_letter(idx)
+
+        return col_letter
+
+
+def text_content(element) -> str:
+    """
+    get the text of a shared or inline string stripped of formatting, the
+    same way openpyxl does
+
+    Parameters
+    ----------
+      xml element of the string item
+
+    Return
+    ------
+      str of text
+    """
+    snippets = []
+    plain = element.find(TEXT_TAG)
+    if plain is not None and plain.text is not None:
+        snippets.append(plain.text)
+    for run in element.findall(RUN_TAG):
+        text = run.find(TEXT_TAG)
+        if text is not None and text.text is not None:
+            snippets.append(text.text)
+
+    return "".join(snippets)
+
+
+def excel_usecols(usecols):
+    """
+    convert Excel column letters e.g. "A:AU" to 0-based column positions
+    as pandas.read_excel does
+
+    Parameters
+    ----------
+      str of column letters and ranges, or usecols accepted by pandas
+
+    Return
+    ------
+      list of column positions, or usecols unchanged if not a str
+    """
+    if not isinstance(usecols, str):
+        return usecols
+    cols = []
+    for area in usecols.split(","):
+        if ":" in area:
+            first, last = area.split(":")
+            cols.extend(
+                range(
+                    column_index_from_string(first) - 1,
+                    column_index_from_string(last),
+                )
+            )
+        else:
+            cols.append(column_index_from_string(area) - 1)
+
+    return cols
+
+
+class NativeWorkbook(ReadOnlyWorkbook):
+    """
+    Variant workbook read straight from the .xlsx zip archive without
+    openpyxl loading the workbook
+
+    workbook.xml maps the sheet names to their XML parts and only the
+    parts of the sheets the parser asks for are parsed, streaming them
+    with iterparse. sharedStrings.xml and styles.xml are only read the
+    first time a cell needs them. Cell values are converted the same
+    way openpyxl does in read-only mode with cached values of formulas.
+
+    With a SheetCache, the values extracted from each sheet are cached
+    by the content of its XML part, the shared strings it uses and the
+    date styles, so only the sheets changed since a previous read of
+    the workbook are parsed.
+
+    Parameters
+    ----------
+      variant workbook file name
+      dict of cell addresses needed per sheet, interpret sheets share
+      the "interpret" key
+      SheetCache (optional)
+      bytes of the workbook already read from disk (optional)
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        cells: dict,
+        sheet_cache: SheetCache = None,
+        data: bytes = None,
+    ) -> None:
+        self.filename = filename
+        self.data = read_workbook_data(filename, data)
+        self.archive = zipfile.ZipFile(BytesIO(self.data))
+        self.cells_needed = cells
+        self.fetched = {}
+        self.sheet_cache = sheet_cache
+        self._sheet_keys = {}
+        self._shared_strings = None
+        self._date_styles = None
+        self._read_workbook()
+
+    def _read_workbook(self) -> None:
+        """
+        map the sheet names to their XML parts and find the shared
+        strings and styles parts from workbook.xml and its relationships
+        """
+        rels = fromstring(self.archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {}
+        self.shared_strings_path = None
+        self.styles_path = None
+        for rel in rels.iter(f"{{{PACKAGE_REL_NS}}}Relationship"):
+            target = rel.get("Target")
+            if target.startswith("/"):
+                path = target.lstrip("/")
+            else:
+                path = posixpath.normpath(posixpath.join("xl", target))
+            targets[rel.get("Id")] = path
+            if rel.get("Type").endswith("/sharedStrings"):
+                self.shared_strings_path = path
+            elif rel.get("Type").endswith("/styles"):
+                self.styles_path = path
+
+        workbook = fromstring(self.archive.read("xl/workbook.xml"))
+        self.sheet_paths = {
+            sheet.get("name"): targets[sheet.get(f"{{{DOCUMENT_REL_NS}}}id")]
+            for sheet in workbook.iter(f"{{{SHEET_MAIN_NS}}}sheet")
+        }
+        self.epoch = CALENDAR_WINDOWS_1900
+        properties = workbook.find(f"{{{SHEET_MAIN_NS}}}workbookPr")
+        if properties is not None and properties.get("date1904") in (
+            "1",
+            "true",
+        ):
+            self.epoch = CALENDAR_MAC_1904
+
+    @property
+    def sheetnames(self) -> list:
+        """
+        names of all sheets in the workbook
+        """
+        return list(self.sheet_paths)
+
+    @property
+    def shared_strings(self) -> list:
+        """
+        shared strings of the workbook, read on first use
+        """
+        if self._shared_strings is None:
+            self._shared_strings = []
+            if self.shared_strings_path is not None:
+                with self.archive.open(self.shared_strings_path) as source:
+                    for _, node in iterparse(source):
+                        if node.tag == STRING_ITEM_TAG:
+                            self._shared_strings.append(
+                                text_content(node).replace("x005F_", "")
+                            )
+                            node.clear()
+
+        return self._shared_strings
+
+    @property
+    def date_styles(self) -> tuple:
+        """
+        sets of the cell style indices with date and timedelta number
+        formats, read from styles.xml on first use
+        """
+        if self._date_styles is None:
+            date_formats = set()
+            timedelta_formats = set()
+            if self.styles_path is not None:
+                styles = fromstring(self.archive.read(self.styles_path))
+                custom = {
+                    int(fmt.get("numFmtId")): fmt.get("formatCode")
+                    for fmt in styles.iter(f"{{{SHEET_MAIN_NS}}}numFmt")
+                }
+                # openpyxl < 3.1 reads timedeltas as dates
+                is_timedelta_format = getattr(
+                    numbers, "is_timedelta_format", None
+                )
+                cell_xfs = styles.find(f"{{{SHEET_MAIN_NS}}}cellXfs")
+                xfs = [] if cell_xfs is None else list(cell_xfs)
+                for idx, xf in enumerate(xfs):
+                    fmt_id = int(xf.get("numFmtId", 0))
+                    fmt = custom.get(
+                        fmt_id, numbers.builtin_format_code(fmt_id)
+                    )
+                    if numbers.is_date_format(fmt):
+                        date_formats.add(idx)
+                    if is_timedelta_format and is_timedelta_format(fmt):
+                        timedelta_formats.add(idx)
+            self._date_styles = (date_formats, timedelta_formats)
+
+        return self._date_styles
+
+    def sheet_key(self, sheet: str) -> str:
+        """
+        key of the content of a sheet: its XML part with the shared
+        strings its cells use, the date styles and the date epoch
+
+        Parameters
+        ----------
+          str for sheet name
+
+        Return
+        ------
+          str for SHA-256 hex digest
+        """
+        if sheet not in self._sheet_keys:
+            xml = self.archive.read(self.sheet_paths[sheet])
+            # shared string indices are replaced by the strings, as they
+            # change when another sheet adds or removes a string
+            digest = hashlib.sha256()
+            position = 0
+            for match in SHARED_STRING_CELL.finditer(xml):
+                value = self.shared_strings[int(match.group(1))].encode()
+                digest.update(xml[position:match.start(1)])
+                digest.update(b"%d:%s" % (len(value), value))
+                position = match.end(1)
+            digest.update(xml[position:])
+            date_formats, timedelta_formats = self.date_styles
+            digest.update(
+                repr(
+                    (sorted(date_formats), sorted(timedelta_formats))
+                ).encode()
+            )
+            digest.update(repr(self.epoch).encode())
+            self._sheet_keys[sheet] = digest.hexdigest()
+
+        return self._sheet_keys[sheet]
+
+    def _cached(self, sheet: str, call: tuple, extract):
+        """
+        get an extraction from a sheet from the sheet cache, extracting
+        and caching it on a miss
+
+        Parameters
+        ----------
+          str for sheet name
+          tuple of the extraction method and its arguments
+          function without arguments doing the extraction
+
+        Return
+        ------
+          extracted value
+        """
+        if self.sheet_cache is None:
+            return extract()
+        sheet_key = self.sheet_key(sheet)
+        try:
+            return self.sheet_cache.get(sheet_key, call)
+        except KeyError:
+            value = extract()
+            self.sheet_cache.put(sheet_key, call, value)
+            return value
+
+    def _iter_rows(self, sheet: str, max_row: int = None):
+        """
+        stream the rows of a sheet XML part, stopping once max_row is
+        passed
+
+        Parameters
+        ----------
+          str for sheet name
+          int for last row needed (optional)
+
+        Yields
+        ------
+          int for row number and list of (column number, cell element)
+        """
+        row_counter = 0
+        with self.archive.open(self.sheet_paths[sheet]) as source:
+            cells = []
+            col_counter = 0
+            for _, element in iterparse(source):
+                if element.tag == CELL_TAG:
+                    coordinate = element.get("r")
+                    if coordinate:
+                        col_counter = coordinate_to_tuple(coordinate)[1]
+                    else:
+                        col_counter += 1
+                    cells.append((col_counter, element))
+                elif element.tag == ROW_TAG:
+                    row_counter = int(element.get("r", row_counter + 1))
+                    if max_row is not None and row_counter > max_row:
+                        return
+                    yield row_counter, cells
+                    element.clear()
+                    cells = []
+                    col_counter = 0
+
+    def _cell_value(self, element) -> tuple:
+        """
+        convert a cell element to its value as openpyxl does
+
+        Parameters
+        ----------
+          xml element of the cell
+
+        Return
+        ------
+          cell value and str for openpyxl data type
+        """
+        data_type = element.get("t", "n")
+        if data_type == "inlineStr":
+            child = element.find(INLINE_STRING_TAG)
+            if child is None:
+                return None, data_type
+            return text_content(child), "s"
+        value = element.findtext(VALUE_TAG, None) or None
+        if value is None:
+            return None, data_type
+        if data_type == "n":
+            if "." in value or "E" in value or "e" in value:
+                value = float(value)
+            else:
+                value = int(value)
+            style_id = int(element.get("s", 0))
+            date_formats, timedelta_formats = self.date_styles
+            if style_id in date_formats:
+                data_type = "d"
+                if style_id in timedelta_formats:
+                    value = from_excel(value, self.epoch, timedelta=True)
+                else:
+                    value = from_excel(value, self.epoch)
+        elif data_type == "s":
+            value = self.shared_strings[int(value)]
+        elif data_type == "b":
+            value = bool(int(value))
+        elif data_type == "str":
+            data_type = "s"
+        elif data_type == "d":
+            value = from_ISO8601(value)
+
+        return value, data_type
+
+    def _fetch(self, sheet: str, addresses: set) -> dict:
+        return self._cached(
+            sheet,
+            ("fetch", tuple(sorted(addresses))),
+            lambda: self._extract_cells(sheet, addresses),
+        )
+
+    def _extract_cells(self, sheet: str, addresses: set) -> dict:
+        """
+        stream the rows of a sheet up to the last needed row and keep
+        only the values of the needed cells
+
+        Parameters
+        ----------
+          str for sheet name
+          set of cell addresses
+
+        Return
+        ------
+          dict of cell address to value
+        """
+        wanted = {}
+        for address in addresses:
+            row, col = coordinate_to_tuple(address)
+            wanted.setdefault(row, {})[col] = address
+        values = dict.fromkeys(addresses)
+        for row_idx, cells in self._iter_rows(sheet, max(wanted)):
+            if row_idx not in wanted:
+                continue
+            for col, element in cells:
+                if col in wanted[row_idx]:
+                    values[wanted[row_idx][col]] = self._cell_value(element)[0]
+
+        return values
+
+    def lookup(
+        self,
+        sheet: str,
+        key_column: str,
+        key: str,
+        value_column: str,
+        default=None,
+    ):
+        """
+        get the value in value_column of the last row where key_column
+        equals key
+
+        Parameters
+        ----------
+          str for sheet name
+          str for column letter to search
+          value to search for
+          str for column letter to return the value from
+          value returned if key is not found
+
+        Return
+        ------
+          cell value
+        """
+        return self._cached(
+            sheet,
+            ("lookup", key_column, key, value_column, default),
+            lambda: self._extract_lookup(
+                sheet, key_column, key, value_column, default
+            ),
+        )
+
+    def _extract_lookup(
+        self,
+        sheet: str,
+        key_column: str,
+        key: str,
+        value_column: str,
+        default=None,
+    ):
+        """
+        uncached lookup, see lookup
+        """
+        key_idx = column_index_from_string(key_column)
+        value_idx = column_index_from_string(value_column)
+        value = default
+        for _, cells in self._iter_rows(sheet):
+            row = dict(cells)
+            if (
+                key_idx in row
+                and self._cell_value(row[key_idx])[0] == key
+            ):
+                value = None
+                if value_idx in row:
+                    value = self._cell_value(row[value_idx])[0]
+
+        return value
+
+    def col_letter(self, sheet: str, col_name: str) -> str:
+        """
+        get the column letter with specific col name in the first row
+        of a sheet
+
+        Parameters
+        ----------
+          str for sheet name
+          str for name of column to get col letter
+
+        Return
+        ------
+          str for column letter for specific column name
+        """
+        return self._cached(
+            sheet,
+            ("col_letter", col_name),
+            lambda: self._extract_col_letter(sheet, col_name),
+        )
+
+    def _extract_col_letter(self, sheet: str, col_name: str) -> str:
+        """
+        uncached col_letter, see col_letter
+        """
+        col_letter = None
+        for row_idx, cells in self._iter_rows(sheet, 1):
+            for col, element in cells:
+                if self._cell_value(element)[0] == col_name:
+                    col_letter = get_column_letter(col)
+
+        return col_letter
+
+    def read_sheet(
+        self, sheet: str, usecols=None, nrows: int = None
+    ) -> pd.DataFrame:
+        """
+        read a sheet as a data frame with its first row as header, giving
+        the same data frame as pandas.read_excel with the openpyxl engine
+
+        Parameters
+        ----------
+          str for sheet name
+          Excel column letters e.g. "A:AU" or positions to keep (optional)
+          int for number of rows to read after the header (optional)
+
+        Return
+        ------
+          data frame of sheet
+        """
+        return self._cached(
+            sheet,
+            ("read_sheet", repr(usecols), nrows),
+            lambda: self._extract_sheet(sheet, usecols, nrows),
+        )
+
+    def _extract_sheet(
+        self, sheet: str, usecols=None, nrows: int = None
+    ) -> pd.DataFrame:
+        """
+        uncached read_sheet, see read_sheet
+        """
+        file_rows_needed = None if nrows is None else nrows + 1
+        data = []
+        last_row_with_data = -1
+        for row_idx, cells in self._iter_rows(sheet):
+            while len(data) < row_idx - 1 and (
+                file_rows_needed is None or len(data) < file_rows_needed
+            ):
+                data.append([])
+            if file_rows_needed is not None and len(data) >= file_rows_needed:
+                break
+            row = [""] * (cells[-1][0] if cells else 0)
+            for col, element in cells:
+                if col > len(row):
+                    continue
+                value, data_type = self._cell_value(element)
+                if value is None:
+                    value = ""
+                elif data_type == "e":
+                    value = np.nan
+                elif data_type == "n" and int(value) == value:
+                    value = int(value)
+                row[col - 1] = value
+            while row and row[-1] == "":
+                row.pop()
+            if row:
+                last_row_with_data = len(data)
+            data.append(row)
+
+        data = data[: last_row_with_data + 1]
+        if not data:
+            return pd.DataFrame()
+        max_width = max(len(row) for row in data)
+        data = [row + [""] * (max_width - len(row)) for row in data]
+        parser = TextParser(
+            data,
+            header=0,
+            nrows=nrows,
+            skip_blank_lines=False,
+            usecols=excel_usecols(usecols),
+        )
+
+        return parser.read(nrows=nrows)